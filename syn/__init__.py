@@ -19,9 +19,10 @@ from web3._utils import request
 from math import log2
 import lru
 
-# Get the next ^2 that is greater than len(SYN_DATA.keys()) so we can make
-# the cache size greater than the amount of chains we support.
-n = 1 << int(log2(len(SYN_DATA.keys()))) + 1
+# Get the next ^2 that is greater than the amount of rpc endpoints so we can
+# make the cache size greater than the amount of sessions we will ever need.
+_endpoints = sum(len(v['w3'].provider.endpoints) for v in SYN_DATA.values())
+n = 1 << int(log2(_endpoints)) + 1
 
 b = request._session_cache.get_size()
 request._session_cache.set_size(n)
@@ -33,11 +34,13 @@ from flask.wrappers import Response
 import simplejson as json
 from flask import Flask
 
-from syn.cron import update_prices, update_getlogs, update_getlogs_pool, \
-    update_prices_missing
+from syn.cron import update_prices, update_getlogs, update_prices_missing
 from syn.utils.data import cache, SCHEDULER_CONFIG, schedular, \
-    MESSAGE_QUEUE_REDIS
+    MESSAGE_QUEUE_REDIS, AGGREGATE_STORAGE
 from syn.utils.helpers import worker_assert_lock
+from syn.utils.storage import ensure_index, migrate_compact
+from syn.utils.sqlstore import get_store
+from syn.utils.price import SPOT_PRICES
 
 import os
 
@@ -50,7 +53,16 @@ def _first_run() -> None:
 
     print(f'worker({os.getpid()}), acquired the lock')
 
-    update_getlogs_pool()
+    if AGGREGATE_STORAGE == 'compact':
+        migrate_compact()
+
+    # Index aggregates written before the index existed, readers scan the
+    # db until this is done.
+    ensure_index()
+
+    if (store := get_store()) is not None:
+        store.sync_checkpoints()
+
     update_getlogs()
     update_prices()
     update_prices_missing()
@@ -63,6 +75,8 @@ def _first_run() -> None:
 
 
 gevent.spawn(_first_run)
+# Every worker keeps its own copy of the spot prices.
+gevent.spawn(SPOT_PRICES.run)
 
 
 def init() -> Flask:
@@ -9,25 +9,27 @@
 
 from contextlib import contextmanager
 from datetime import date, datetime
-from typing import Generator
+from typing import Dict, Generator, List
 from functools import wraps
 from decimal import Decimal
 import traceback
 import time
 import os
 
-import simplejson as json
 from web3 import Web3
-import requests
 
 from syn.utils.data import (LOGS_REDIS_URL, schedular, MESSAGE_QUEUE_REDIS,
-                            REDIS, COINGECKO_HISTORIC_URL, SYN_DATA)
-from syn.utils.helpers import dispatch_get_logs, worker_assert_lock, date2block
-from syn.utils.analytics.pool import pool_callback
+                            REDIS, SYN_DATA, BACKFILL_SHARDS)
+from syn.utils.helpers import dispatch_get_logs, dispatch_scan, \
+    worker_assert_lock, date2block, get_pool_addresses
+from syn.utils.analytics.pool import pool_callback, TOPICS as POOL_TOPICS
 from syn.utils.cache import _serialize_args_to_str
-from syn.utils.wrappa.rpc import bridge_callback
+from syn.utils.wrappa.rpc import bridge_callback, bridge_prefetch, LogSource
 from syn.utils.contract import get_balance_of
+from syn.utils.snapshot import build_snapshot
 from syn.utils.price import CoingeckoIDS, get_historic_price
+from syn.utils.wrappa.coingecko import ingest_prices
+from syn.utils.pricequeue import consume, enqueue
 
 
 def acquire_lock(name: str):
@@ -53,12 +55,6 @@ def acquire_lock(name: str):
     return _decorator
 
 
-def get_price_cg(_id: str, date: str) -> Decimal:
-    time.sleep(1)
-    r = requests.get(COINGECKO_HISTORIC_URL.format(_id, date))
-    return r.json(use_decimal=True)['market_data']['current_price']['usd']
-
-
 def get_price_xjewel(_date: date) -> Decimal:
     chain = 'dfk'
     w3 = SYN_DATA[chain]['w3']
@@ -91,17 +87,6 @@ def get_price_xjewel(_date: date) -> Decimal:
     return jewel_price * t0bal / t1bal
 
 
-def get_price(_id: str, date: date) -> Decimal:
-    CUSTOM_PRICE_FUNCS = {
-        #  'custom-xjewel': get_price_xjewel,
-    }
-
-    if _id in CUSTOM_PRICE_FUNCS:
-        return CUSTOM_PRICE_FUNCS[_id](date)
-
-    return get_price_cg(_id, date.strftime('%d-%m-%Y'))
-
-
 @schedular.task("cron", id="update_prices", hour=0, minute=10, max_instances=1)
 @acquire_lock('update_prices')
 def update_prices():
@@ -111,67 +96,53 @@ def update_prices():
     _now = datetime.now()
     date = _now.strftime('%Y-%m-%d')
     date_cg = _now.date()
+    missing: Dict[str, List[str]] = {}
 
     for x in CoingeckoIDS:
         _key = _serialize_args_to_str(x, date)
         keys = [_key, f'{_key}:usd']
 
-        for key in keys:
-            if REDIS.get(key) is None:
-                try:
-                    REDIS.setnx(key, json.dumps(get_price(x.value, date_cg)))
-                except Exception as e:
-                    MESSAGE_QUEUE_REDIS.sadd('prices:missing', key)
-
-                    if not type(e) == KeyError:
-                        traceback.print_exc()
-                        print(key)
+        for key, data in zip(keys, REDIS.mget(keys)):
+            if data is None:
+                missing.setdefault(x.value, []).append(key)
             else:
                 print(f'{key} has a value??')
 
+    # Both keys of an id come from a single request.
+    written = set(ingest_prices({x: [date_cg] for x in missing}))
+
+    enqueue(y for x in missing.values() for y in x if y not in written)
+
     print(f'(0) Cron job done. Elapsed: {time.time() - start:.2f}s')
 
 
 @schedular.task("interval",
                 id="update_prices_missing",
-                hours=1,
+                minutes=5,
                 max_instances=1)
 @acquire_lock('update_prices_missing')
 def update_prices_missing():
     start = time.time()
     print(f'(1) [{start}] Cron job start.')
 
-    keys = MESSAGE_QUEUE_REDIS.smembers('prices:missing')
+    processed = consume()
 
-    for key in keys:
-        # TODO(blaze): remove now or later?
-        MESSAGE_QUEUE_REDIS.srem('prices:missing', 1, key)
+    print(f'(1) Cron job done, {processed} prices processed. '
+          f'Elapsed: {time.time() - start:.2f}s')
 
-        # Check if price is actually missing
-        if (_ := REDIS.get(key)) is None or _ == '0':
-            if (key.endswith(':usd')):
-                if (data := REDIS.get(key.replace(':usd', ''))) is not None:
-                    REDIS.setnx(key, data)
-                    continue
-            else:
-                if (data := REDIS.get(f'{key}:usd')) is not None:
-                    REDIS.setnx(key, data)
-                    continue
 
-            x = key.split(':')
-            _id, date = x[0], x[1]
-            date = datetime.fromisoformat(date).date()
+def _log_sources(chain: str) -> List[LogSource]:
+    sources = [LogSource(bridge_callback, SYN_DATA[chain]['bridge'])]
 
-            try:
-                REDIS.setnx(key, json.dumps(get_price(_id, date)))
-            except Exception as e:
-                MESSAGE_QUEUE_REDIS.sadd('prices:missing', key)
-
-                if not type(e) == KeyError:
-                    traceback.print_exc()
-                    print(key)
+    for address, start_block in get_pool_addresses(chain):
+        sources.append(
+            LogSource(pool_callback,
+                      address,
+                      topics=list(POOL_TOPICS),
+                      key_namespace='pool',
+                      start_block=start_block))
 
-    print(f'(1) Cron job done. Elapsed: {time.time() - start:.2f}s')
+    return sources
 
 
 @schedular.task("interval", id="update_getlogs", hours=1, max_instances=1)
@@ -180,22 +151,21 @@ def update_getlogs():
     start = time.time()
     print(f'(2) [{start}] Cron job start.')
 
-    dispatch_get_logs(bridge_callback)
+    if BACKFILL_SHARDS > 1:
+        # Pool events depend on the order they are processed in, so only the
+        # bridge can catch up with a sharded backfill.
+        dispatch_get_logs(bridge_callback,
+                          prefetch=bridge_prefetch,
+                          shards=BACKFILL_SHARDS)
 
-    print(f'(2) Cron job done. Elapsed: {time.time() - start:.2f}s')
+    # Bridge and pools of a chain are scanned together, `bridge_prefetch`
+    # only fetches txs for bridge events and blocks for everything else.
+    dispatch_scan(_log_sources, prefetch=bridge_prefetch)
 
+    try:
+        build_snapshot()
+    except Exception:
+        # Workers keep serving the previous snapshot.
+        traceback.print_exc()
 
-@schedular.task("interval", id="update_getlogs_pool", hours=1, max_instances=1)
-@acquire_lock('update_getlogs_pool')
-def update_getlogs_pool():
-    from syn.utils.analytics.pool import TOPICS
-
-    start = time.time()
-    print(f'(3) [{start}] Cron job start.')
-
-    dispatch_get_logs(pool_callback,
-                      topics=list(TOPICS),
-                      key_namespace='pool',
-                      address_key=-1)
-
-    print(f'(3) Cron job done. Elapsed: {time.time() - start:.2f}s')
+    print(f'(2) Cron job done. Elapsed: {time.time() - start:.2f}s')
@@ -18,6 +18,7 @@ from syn.utils.price import (ADDRESS_TO_CGID, get_price_for_address,
 from syn.utils.data import (LOGS_REDIS_URL, SYN_DATA, cache, TOKENS_INFO,
                             symbol_to_address)
 from syn.utils.helpers import get_all_keys, date2block
+from syn.utils.cache import BLOCK_TIMESTAMPS
 from syn.utils.explorer.data import CHAINS
 
 utils_bp = Blueprint('utils_bp', __name__)
@@ -41,6 +42,18 @@ def syncing():
     return jsonify(res)
 
 
+# Hit/miss counters of the indexer's block timestamp cache.
+@utils_bp.route('/syncing/timestamps', methods=['GET'])
+def syncing_timestamps():
+    return jsonify({k: v.stats() for k, v in BLOCK_TIMESTAMPS.items()})
+
+
+# Health of every rpc endpoint of each chain.
+@utils_bp.route('/syncing/rpc', methods=['GET'])
+def syncing_rpc():
+    return jsonify({k: v['w3'].provider.stats() for k, v in SYN_DATA.items()})
+
+
 @utils_bp.route('/date2block/<chain:chain>/<date:date>', methods=['GET'])
 @cache.cached()
 def chain_date_to_block(chain: str, date: datetime):
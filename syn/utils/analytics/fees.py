@@ -11,13 +11,15 @@ from typing import Any, Dict, Optional, Union, List
 from collections import defaultdict
 from decimal import Decimal
 
-from syn.utils.data import SYN_DATA, TOKEN_DECIMALS, LOGS_REDIS_URL
-from syn.utils.helpers import add_to_dict, raise_if, get_all_keys, \
-    handle_decimals
+from syn.utils.data import SYN_DATA, TOKEN_DECIMALS
+from syn.utils.helpers import add_to_dict, raise_if, get_aggregates, \
+    handle_decimals, iter_aggregates
 from syn.utils.contract import get_all_tokens_in_pool, call_abi
 from syn.utils.price import CoingeckoIDS, get_historic_price, \
     get_historic_price_for_address
 from syn.utils.analytics.volume import create_totals
+from syn.utils.snapshot import get_snapshot
+from syn.utils.sqlstore import get_store
 from syn.utils.cache import timed_cache
 
 from gevent.greenlet import Greenlet
@@ -136,38 +138,39 @@ def get_chain_validator_gas_fees(
         chain: str,
         token: Optional[str] = None
 ) -> Dict[str, Dict[str, Union[str, Decimal]]]:
-    if token is None:
-        key = f'{chain}:bridge:*:IN'
-    else:
-        key = f'{chain}:bridge:*:{token.lower()}:IN'
+    token = token.lower() if token is not None else None
+    facts = get_store() or get_snapshot()
 
     # We aggregate validator gas fees on `IN` txs.
-    ret = get_all_keys(key,
-                       client=LOGS_REDIS_URL,
-                       index=[2, 4],
-                       serialize=True)
+    if facts is not None:
+        ret = facts.group_sum('bridge', ['day'],
+                              ['gas_price', 'gas_paid', 'tx_count'],
+                              chain=chain,
+                              token=token,
+                              direction='IN')
+        items = [(k[0], v['gas_price'], v['gas_paid'], v['tx_count'])
+                 for k, v in ret.items()]
+    else:
+        ret = iter_aggregates(chain, 'bridge', f'{token or "*"}:IN')
+        items = [(k.split(':')[2], v['validator']['gas_price'],
+                  v['validator']['gas_paid'], v['txCount']) for k, v in ret]
 
     res: Dict[str, Dict[str, Union[str, Decimal]]] = defaultdict(dict)
 
-    for k, v in ret.items():
-        date, _ = k.split(':')
+    for date, gas_price, gas_paid, tx_count in items:
         price = get_historic_price(_chain_to_cgid[chain], date)
-        x = v['validator']
 
-        add_to_dict(res[date], 'gas_price', x['gas_price'])
-        add_to_dict(res[date], 'transaction_fee', x['gas_paid'])
-        add_to_dict(res[date], 'price_usd', x['gas_paid'] * price)
-        add_to_dict(res[date], 'tx_count', v['txCount'])
+        add_to_dict(res[date], 'gas_price', gas_price)
+        add_to_dict(res[date], 'transaction_fee', gas_paid)
+        add_to_dict(res[date], 'price_usd', gas_paid * price)
+        add_to_dict(res[date], 'tx_count', tx_count)
 
     return res
 
 
 def get_chain_bridge_fees(chain: str, address: str):
     # We aggregate bridge fees on `IN` txs
-    ret = get_all_keys(f'{chain}:bridge:*:{address}:IN',
-                       client=LOGS_REDIS_URL,
-                       index=2,
-                       serialize=True)
+    ret = get_aggregates(chain, 'bridge', f'{address}:IN', index=2)
 
     res = defaultdict(dict)
 
@@ -200,26 +203,29 @@ def get_chain_bridge_fees(chain: str, address: str):
 
 def get_chain_airdrop_amounts(chain: str,
                               token: Optional[str] = None) -> Dict[str, Any]:
-    if token is None:
-        key = f'{chain}:bridge:*:IN'
+    token = token.lower() if token is not None else None
+    facts = get_store() or get_snapshot()
+
+    # We aggregate airdrops on `IN` txs.
+    if facts is not None:
+        ret = facts.group_sum('bridge', ['day'], ['airdrops', 'tx_count'],
+                              chain=chain,
+                              token=token,
+                              direction='IN')
+        items = [(k[0], v['airdrops'], v['tx_count']) for k, v in ret.items()]
     else:
-        key = f'{chain}:bridge:*:{token.lower()}:IN'
-
-    # We aggregate validator gas fees on `IN` txs.
-    ret = get_all_keys(key,
-                       client=LOGS_REDIS_URL,
-                       index=[2, 4],
-                       serialize=True)
+        ret = iter_aggregates(chain, 'bridge', f'{token or "*"}:IN')
+        items = [(k.split(':')[2], v['airdrops'], v['txCount'])
+                 for k, v in ret]
 
     res: Dict[str, Dict[str, Union[str, Decimal]]] = defaultdict(dict)
 
-    for k, v in ret.items():
-        date, _ = k.split(':')
+    for date, airdrops, tx_count in items:
         price = get_historic_price(_chain_to_cgid[chain], date)
 
-        add_to_dict(res[date], 'airdrop', v['airdrops'])
-        add_to_dict(res[date], 'price_usd', v['airdrops'] * price)
-        add_to_dict(res[date], 'tx_count', v['txCount'])
+        add_to_dict(res[date], 'airdrop', airdrops)
+        add_to_dict(res[date], 'price_usd', airdrops * price)
+        add_to_dict(res[date], 'tx_count', tx_count)
 
     total, total_usd, total_usd_current = create_totals(res,
                                                         chain,
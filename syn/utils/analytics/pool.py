@@ -7,21 +7,25 @@
           https://www.boost.org/LICENSE_1_0.txt)
 """
 
-from typing import Any, Dict, Literal, Optional, Union, cast, get_args, List
-from collections import defaultdict
+from typing import Any, Dict, Literal, NamedTuple, Optional, Union, cast, \
+    get_args, List
+from collections import defaultdict, namedtuple
 from datetime import datetime
 from decimal import Decimal
 import logging
 import copy
 
+from eth_abi.decoding import ContextFramesBytesIO, TupleDecoder
+from eth_abi.registry import registry
 from web3.types import LogReceipt
-import simplejson as json
-from web3 import Web3
+from hexbytes import HexBytes
 import gevent
 
-from syn.utils.helpers import (add_to_dict, convert, get_all_keys,
-                               handle_decimals, raise_if)
+from syn.utils.helpers import add_to_dict, convert, get_aggregates, raise_if
 from syn.utils.data import SYN_DATA, POOL_ABI, TOKEN_DECIMALS, LOGS_REDIS_URL
+from syn.utils.wrappa.batch import WindowContext
+from syn.utils.storage import merge_sum, to_fixed
+from syn.utils.sqlstore import get_store
 from syn.utils.price import CoingeckoIDS, get_historic_price
 from syn.utils.contract import get_pool_data
 
@@ -41,6 +45,7 @@ TOPICS = {
     '0x3631c28b1f9dd213e0319fb167b554d76b6c283a41143eb400a0d1adb1af1755':
     'RemoveLiquidityImbalance',
 }
+TOPICS_REVERSE = {v: k for k, v in TOPICS.items()}
 
 #: NOTE: all the fees here are INITIAL fees which can be changed later on,
 #: thus us tracking `NewSwapFee` and `NewAdminFee`
@@ -187,6 +192,47 @@ FEE_DECIMALS = 10
 _chain_fee: Dict[str, Dict[str, Dict[str, int]]] = defaultdict(dict)
 
 
+class EventDecoder:
+    """
+    Decode logs of a single event into a named tuple of its args, with the
+    eth-abi decoders resolved once rather than by web3 on every log.
+    """
+    __slots__ = ('record', '_indexed', '_positions', '_data')
+
+    def __init__(self, abi: Dict[str, Any]) -> None:
+        inputs = abi['inputs']
+        self.record = namedtuple(abi['name'], [x['name'] for x in inputs])
+
+        # (arg position, decoder) of every indexed arg, in topic order.
+        self._indexed = [(i, registry.get_decoder(x['type']))
+                         for i, x in enumerate(inputs) if x['indexed']]
+        data = [(i, x['type']) for i, x in enumerate(inputs)
+                if not x['indexed']]
+        self._positions = [i for i, _ in data]
+        self._data = TupleDecoder(
+            decoders=[registry.get_decoder(x) for _, x in data])
+
+    def __call__(self, log: LogReceipt) -> NamedTuple:
+        args: List[Any] = [None] * len(self.record._fields)
+
+        for (i, decoder), topic in zip(self._indexed, log['topics'][1:]):
+            args[i] = decoder(ContextFramesBytesIO(bytes(topic)))
+
+        stream = ContextFramesBytesIO(bytes(HexBytes(log['data'])))
+        for i, value in zip(self._positions, self._data(stream)):
+            args[i] = value
+
+        return self.record(*args)
+
+
+#: topic0 -> decoder of every event in `TOPICS`.
+DECODERS: Dict[str, EventDecoder] = {
+    TOPICS_REVERSE[x['name']]: EventDecoder(x)
+    for x in POOL_ABI
+    if x['type'] == 'event' and x['name'] in TOPICS_REVERSE
+}
+
+
 def _address_to_pool(chain: str, address: str) -> Literal['nusd', 'neth']:
     for k, v in POOLS[chain].items():
         if cast(str, v['address']).lower() == address.lower():
@@ -199,21 +245,23 @@ def _address_to_pool(chain: str, address: str) -> Literal['nusd', 'neth']:
     raise RuntimeError(f"{address} not found in {chain}'s pools")
 
 
-def pool_callback(chain: str, address: str, log: LogReceipt,
-                  first_run: bool) -> None:
-    w3: Web3 = SYN_DATA[chain]['w3']
-    contract = w3.eth.contract(w3.toChecksumAddress(address), abi=POOL_ABI)
-
+def pool_callback(chain: str,
+                  address: str,
+                  log: LogReceipt,
+                  first_run: bool,
+                  ctx: Optional[WindowContext] = None) -> None:
     topic = cast(str, convert(log['topics'][0]))
     if topic not in TOPICS:
         raise RuntimeError(f'sanity check? got invalid topic: {topic}')
 
-    event = TOPICS[topic]
-    data = contract.events[event]().processLog(log)
+    data: Any = DECODERS[topic](log)
     pool = _address_to_pool(chain, address)
 
+    if ctx is None:
+        ctx = WindowContext(chain)
+
     block_n = log['blockNumber']
-    timestamp = w3.eth.get_block(block_n)['timestamp']  # type: ignore
+    timestamp = ctx.get_timestamp(block_n)
     date = datetime.utcfromtimestamp(timestamp).date()
 
     if pool not in _chain_fee[chain]:
@@ -227,8 +275,12 @@ def pool_callback(chain: str, address: str, log: LogReceipt,
 
     if first_run:
         # Check previously set `newAdminFee` and `newSwapFee`.
-        _admin_fees = LOGS_REDIS_URL.hgetall(key_admin)
-        _swap_fees = LOGS_REDIS_URL.hgetall(key_swap)
+        if (store := get_store()) is not None:
+            _admin_fees = store.pool_fees(chain, pool, 'admin')
+            _swap_fees = store.pool_fees(chain, pool, 'swap')
+        else:
+            _admin_fees = LOGS_REDIS_URL.hgetall(key_admin)
+            _swap_fees = LOGS_REDIS_URL.hgetall(key_swap)
 
         key = lambda x: datetime.fromisoformat(x)
 
@@ -240,11 +292,9 @@ def pool_callback(chain: str, address: str, log: LogReceipt,
             _chain_fee[chain][pool]['swap'] = int(_swap_fees[max(
                 _swap_fees.keys(), key=key)])
 
-    TOPICS_REVERSE = {v: k for k, v in TOPICS.items()}
     admin_fee = _chain_fee[chain][pool]['admin']
     swap_fee = _chain_fee[chain][pool]['swap']
     pool_data = get_pool_data(chain, address)
-    data = data['args']
 
     newfee: Optional[Union[Literal['swap'], Literal['admin']]] = None
 
@@ -252,37 +302,35 @@ def pool_callback(chain: str, address: str, log: LogReceipt,
     if topic in [
             TOPICS_REVERSE['RemoveLiquidityOne'], TOPICS_REVERSE['TokenSwap']
     ]:
-        decimals = TOKEN_DECIMALS[chain][pool_data[data['boughtId']].lower()]
-        total_fees = Decimal(
-            data['tokensBought']) * Decimal(swap_fee) / Decimal(
-                (FEE_DENOMINATOR - swap_fee) * 10**decimals)
-        admin_lps_fees = handle_decimals(total_fees * admin_fee, FEE_DECIMALS)
+        decimals = TOKEN_DECIMALS[chain][pool_data[data.boughtId].lower()]
+        volume = to_fixed(data.tokensBought, decimals)
+        total_fees = volume * swap_fee // (FEE_DENOMINATOR - swap_fee)
+        admin_lps_fees = total_fees * admin_fee // 10**FEE_DECIMALS
         lp_fees = total_fees - admin_lps_fees
-        volume = handle_decimals(data['tokensBought'], decimals)
     elif topic == TOPICS_REVERSE['NewSwapFee']:
-        LOGS_REDIS_URL.hset(key_swap, str(date), data['newSwapFee'])
-        _chain_fee[chain][pool]['swap'] = data['newSwapFee']
+        ctx.hset(key_swap, str(date), data.newSwapFee)
+        _chain_fee[chain][pool]['swap'] = data.newSwapFee
         newfee = 'swap'
     elif topic == TOPICS_REVERSE['NewAdminFee']:
-        LOGS_REDIS_URL.hset(key_admin, str(date), data['newAdminFee'])
-        _chain_fee[chain][pool]['admin'] = data['newAdminFee']
+        ctx.hset(key_admin, str(date), data.newAdminFee)
+        _chain_fee[chain][pool]['admin'] = data.newAdminFee
         newfee = 'admin'
     elif topic in [
             TOPICS_REVERSE['AddLiquidity'],
             TOPICS_REVERSE['RemoveLiquidityImbalance']
     ]:
-        fees = data['fees']
-        amounts = data['tokenAmounts']
+        fees = data.fees
+        amounts = data.tokenAmounts
         # Pools are (WETH, NETH) & (STABLES) - all practically have the same peg.
-        total_fees = Decimal(0)
-        volume = Decimal(0)
+        total_fees = 0
+        volume = 0
 
         for i, token in pool_data.items():
             decimals = TOKEN_DECIMALS[chain][token.lower()]
-            total_fees += handle_decimals(fees[i], decimals)
-            volume += handle_decimals(amounts[i], decimals)
+            total_fees += to_fixed(fees[i], decimals)
+            volume += to_fixed(amounts[i], decimals)
 
-        admin_lps_fees = handle_decimals(total_fees * admin_fee, FEE_DECIMALS)
+        admin_lps_fees = total_fees * admin_fee // 10**FEE_DECIMALS
         lp_fees = total_fees - admin_lps_fees
     else:
         print(topic, 'unsupported', data, chain, log)
@@ -305,7 +353,7 @@ def pool_callback(chain: str, address: str, log: LogReceipt,
         # Swaps on other chains are base if both tokens ID > 0,
         # as nexus token is always the first token in the pool (ID = 0)
         if chain == 'ethereum' or \
-                (data['soldId'] > 0 and data['boughtId'] > 0):
+                (data.soldId > 0 and data.boughtId > 0):
             tx_type = ':swap_base'
         else:
             tx_type = ':swap_nexus'
@@ -322,36 +370,15 @@ def pool_callback(chain: str, address: str, log: LogReceipt,
             'volume': volume,  # type: ignore
             'lp_fees': lp_fees,  # type: ignore
             'admin_fees': admin_lps_fees,  # type: ignore
+            # NOTE: many aggregators create txs with many pool events in 1
+            # tx, so in reality `tx_count` is more like `event_count`.
+            # Quite inconsistent with :func:`bridge_callback`.
             'tx_count': 1,
         }
 
-    if (ret := LOGS_REDIS_URL.get(key)) is not None:
-        ret = json.loads(ret, use_decimal=True)
-
-        if newfee is not None:
-            # New fee was set.
-            ret[key_fee] = value[key_fee]  # type: ignore -> NOT UNBOUND!!!
-        else:
-            # A swap event.
-            ret['admin_fees'] += value['admin_fees']
-            ret['lp_fees'] += value['lp_fees']
-            ret['volume'] += value['volume']
-
-            # NOTE: many aggregators create txs with many pool events in 1 tx,
-            # so in reality this is more like `event_count` rather than `tx_count`.
-            # Quite inconsistent with :func:`bridge_callback`.
-            ret['tx_count'] += 1
-
-        LOGS_REDIS_URL.set(key, json.dumps(ret))
-    else:
-        # TODO: possibly check if we got an earlier block before the one set in
-        # :func:`bridge_callback`, but it adds computational cost.
-        LOGS_REDIS_URL.set(key, json.dumps(value))
-
-    LOGS_REDIS_URL.set(f'{chain}:pool:{address}:MAX_BLOCK_STORED',
-                       log['blockNumber'])
-    LOGS_REDIS_URL.set(f'{chain}:pool:{address}:TX_INDEX',
-                       log['transactionIndex'])
+    # TODO: possibly check if we got an earlier block before the one set in
+    # :func:`bridge_callback`, but it adds computational cost.
+    ctx.update(key, value, merge_sum)
 
 
 def get_swap_volume_for_pool(pool: Pools, chain: str) -> Dict[str, Any]:
@@ -361,10 +388,7 @@ def get_swap_volume_for_pool(pool: Pools, chain: str) -> Dict[str, Any]:
 
     for tx_type in ['add_remove', 'swap_base', 'swap_nexus']:
         x = Dict[str, Dict[str, str]]
-        ret: x = get_all_keys(f'{chain}:pool:*:{pool}:{tx_type}',
-                              client=LOGS_REDIS_URL,
-                              index=2,
-                              serialize=True)
+        ret: x = get_aggregates(chain, 'pool', f'{pool}:{tx_type}', index=2)
 
         for k, v in ret.items():
             # For simplicity's sake, we disregard virtual prices & pool token
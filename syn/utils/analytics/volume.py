@@ -16,10 +16,13 @@ import gevent
 
 from syn.utils.price import (CoingeckoIDS, get_historic_price_for_address,
                              get_price_for_address, get_price_coingecko)
-from syn.utils.helpers import (add_to_dict, get_all_keys, raise_if,
+from syn.utils.helpers import (add_to_dict, get_aggregates, raise_if,
                                calculate_volume_totals, recursive_defaultdict,
-                               update_global_data)
-from syn.utils.data import LOGS_REDIS_URL, SYN_DATA, symbol_to_address
+                               update_global_data, iter_aggregates,
+                               get_aggregate_series)
+from syn.utils.data import SYN_DATA, symbol_to_address
+from syn.utils.snapshot import get_snapshot
+from syn.utils.sqlstore import get_store
 
 
 def create_totals(
@@ -99,21 +102,29 @@ def get_chain_outflows_total() -> Dict[str, Any]:
     totals = recursive_defaultdict()
     res = recursive_defaultdict()
 
-    ret = get_all_keys(f'*bridge:*:OUT:*',
-                       serialize=True,
-                       client=LOGS_REDIS_URL,
-                       index=False)
+    if (facts := get_store() or get_snapshot()) is not None:
+        ret = facts.group_sum('bridge', ['chain', 'day', 'token', 'dest'],
+                              ['amount', 'tx_count'],
+                              direction='OUT')
+        items = [(*k, v['amount'], v['tx_count']) for k, v in ret.items()]
+    else:
+        items = []
 
-    for k, v in ret.items():
-        from_chain, _, date, address, _, to_chain = k.split(':')
+        for k, v in iter_aggregates('*', 'bridge', '*:OUT:*'):
+            from_chain, _, date, address, _, to_chain = k.split(':')
+            items.append((from_chain, date, address, to_chain, v['amount'],
+                          v['txCount']))
 
+    for from_chain, date, address, to_chain, amount, tx_count in items:
+        # Chain ids are ints in `facts`.
+        to_chain = str(to_chain)
         price = get_historic_price_for_address(from_chain, address, date)
-        volume_usd = Decimal(v['amount']) * price
+        volume_usd = Decimal(amount) * price
 
-        add_to_dict(res[from_chain][date][to_chain], 'tx_count', v['txCount'])
+        add_to_dict(res[from_chain][date][to_chain], 'tx_count', tx_count)
         add_to_dict(res[from_chain][date][to_chain], 'volume_usd', volume_usd)
 
-        add_to_dict(totals[from_chain][to_chain], 'tx_count', v['txCount'])
+        add_to_dict(totals[from_chain][to_chain], 'tx_count', tx_count)
         add_to_dict(totals[from_chain][to_chain], 'volume_usd', volume_usd)
 
     return {'data': res, 'totals': totals}
@@ -124,13 +135,19 @@ def get_chain_tx_count_total(direction: str) -> Dict[str, Dict[str, Decimal]]:
 
     res = recursive_defaultdict()
 
+    if (facts := get_store() or get_snapshot()) is not None:
+        ret = facts.group_sum('bridge', ['chain', 'day'], ['tx_count'],
+                              direction=direction)
+
+        for (chain, date), v in ret.items():
+            add_to_dict(res[chain], date, v['tx_count'])
+
+        return {'data': res, 'totals': calculate_volume_totals(res)}
+
     if direction == 'OUT':
         direction = 'OUT:*'
 
-    ret = get_all_keys(f'*:bridge:*:{direction}',
-                       serialize=True,
-                       client=LOGS_REDIS_URL,
-                       index=False)
+    ret = get_aggregates('*', 'bridge', f'*:{direction}', index=False)
 
     for k, v in ret.items():
         if direction == 'IN':
@@ -150,11 +167,11 @@ def get_chain_volume_for_address(address: str,
 
     res = recursive_defaultdict()
 
-    ret: Dict[str, Dict[str, str]] = get_all_keys(
-        f'{chain}:bridge:*:{address}:{direction}',
-        client=LOGS_REDIS_URL,
+    ret: Dict[str, Dict[str, str]] = get_aggregates(
+        chain,
+        'bridge',
+        f'{address}:{direction}',
         index=2 if direction == 'IN' else False,
-        serialize=True,
     )
 
     for k, v in ret.items():
@@ -196,11 +213,11 @@ def get_chain_volume(chain: str, direction: str = '*') -> Dict[str, Any]:
         direction = 'OUT:*'
 
     # Get all tokens for the chain which we have stored.
-    ret = get_all_keys(f'{chain}:bridge:*:{direction}',
-                       serialize=True,
-                       client=LOGS_REDIS_URL,
-                       index=3)
-    tokens = ret.keys()
+    tokens = {
+        series.split(':')[0]
+        for _, series in get_aggregate_series(chain, 'bridge',
+                                              f'*:{direction}')
+    }
 
     jobs: Dict[str, Greenlet] = {}
 
@@ -7,18 +7,22 @@
           https://www.boost.org/LICENSE_1_0.txt)
 """
 
-from typing import Callable, Optional, Union
+from typing import Callable, Dict, Iterable, Optional, Union
 from functools import lru_cache, wraps
 from datetime import timedelta
 import time
 
 from flask_caching.backends import SimpleCache
 import simplejson as json
+import lru
 
-from .data import REDIS
+from .data import REDIS, LOGS_REDIS_URL, SYN_DATA
 
 _redis_cache = SimpleCache()
 
+# Seconds hit counters are kept in-process before being added to redis.
+STATS_FLUSH_INTERVAL = 60
+
 
 # Gotta love SO: https://stackoverflow.com/a/63674816
 def timed_cache(max_age, maxsize=5, typed=False):
@@ -121,4 +125,97 @@ def redis_cache(key: Optional[Callable[..., str]] = None,
 
         return _wrapped
 
-    return _decorator
\ No newline at end of file
+    return _decorator
+
+
+class BlockTimestampCache:
+    """
+    Block number -> timestamp cache for a single chain, an in-process LRU
+    backed by a redis hash. Blocks the indexer sees are already mined, so
+    entries never need to be invalidated.
+    """
+    def __init__(self, chain: str, maxsize: int = 2**16) -> None:
+        self.chain = chain
+        self.key = f'{chain}:timestamps'
+        self.key_stats = f'{chain}:timestamps:stats'
+        self._lru = lru.LRU(maxsize)
+        self._stats: Dict[str, int] = {'lru': 0, 'redis': 0, 'miss': 0}
+        # Counted since the last flush to `key_stats`.
+        self._pending: Dict[str, int] = dict.fromkeys(self._stats, 0)
+        self._flushed = time.time()
+
+    def get_many(self, blocks: Iterable[int]) -> Dict[int, int]:
+        res: Dict[int, int] = {}
+        missing = []
+
+        for block in blocks:
+            if (ret := self._lru.get(block)) is not None:
+                res[block] = ret
+            else:
+                missing.append(block)
+
+        hits = {'lru': len(res), 'redis': 0, 'miss': 0}
+
+        if missing:
+            ret = LOGS_REDIS_URL.hmget(self.key, missing)
+
+            for block, timestamp in zip(missing, ret):
+                if timestamp is not None:
+                    res[block] = self._lru[block] = int(timestamp)
+                    hits['redis'] += 1
+                else:
+                    hits['miss'] += 1
+
+        self._record(hits)
+        return res
+
+    def get(self, block: int) -> Optional[int]:
+        return self.get_many([block]).get(block)
+
+    def set_many(self, timestamps: Dict[int, int]) -> None:
+        if not timestamps:
+            return
+
+        for block, timestamp in timestamps.items():
+            self._lru[block] = timestamp
+
+        LOGS_REDIS_URL.hset(self.key, mapping=timestamps)  # type: ignore
+
+    def _record(self, hits: Dict[str, int]) -> None:
+        for k, v in hits.items():
+            self._stats[k] += v
+            self._pending[k] += v
+
+        if time.time() - self._flushed >= STATS_FLUSH_INTERVAL:
+            self._flush()
+
+    def _flush(self) -> None:
+        pending, self._pending = self._pending, dict.fromkeys(self._stats, 0)
+        self._flushed = time.time()
+        pipe = LOGS_REDIS_URL.pipeline(transaction=False)
+
+        for k, v in pending.items():
+            if v:
+                pipe.hincrby(self.key_stats, k, v)
+
+        pipe.execute()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        Hit/miss counters of this process and of every process combined,
+        `lru` and `redis` are hits on the respective layer. Other processes
+        are up to :data:`STATS_FLUSH_INTERVAL` seconds behind.
+        """
+        self._flush()
+        ret = LOGS_REDIS_URL.hgetall(self.key_stats)
+
+        return {
+            'process': dict(self._stats),
+            'total': {k: int(ret.get(k, 0)) for k in self._stats},
+        }
+
+
+BLOCK_TIMESTAMPS: Dict[str, BlockTimestampCache] = {
+    chain: BlockTimestampCache(chain)
+    for chain in SYN_DATA
+}
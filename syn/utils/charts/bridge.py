@@ -13,8 +13,7 @@ from datetime import datetime
 from decimal import Decimal
 
 from syn.utils.price import get_historic_price_for_address
-from syn.utils.helpers import get_all_keys
-from syn.utils.data import LOGS_REDIS_URL
+from syn.utils.helpers import get_aggregates
 
 
 def chart_chain_bridge_volume(
@@ -24,11 +23,11 @@ def chart_chain_bridge_volume(
     # if direction not in ['IN', 'OUT']:
     #     raise TypeError(f'expected direction as IN or OUT got {direction!r}')
 
-    ret: Dict[str, Dict[str, str]] = get_all_keys(
-        f'{chain}:bridge:*:IN',
-        client=LOGS_REDIS_URL,
+    ret: Dict[str, Dict[str, str]] = get_aggregates(
+        chain,
+        'bridge',
+        '*:IN',
         index=False,
-        serialize=True,
     )
 
     for k, v in ret.items():
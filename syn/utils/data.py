@@ -25,6 +25,7 @@ from web3 import Web3
 import gevent
 import redis
 
+from syn.utils.wrappa.provider import MultiHTTPProvider
 from syn.patches.cache import PatchedCache
 
 load_dotenv(find_dotenv('.env.sample'))
@@ -33,6 +34,7 @@ load_dotenv(override=True)
 
 COINGECKO_HISTORIC_URL = "https://api.coingecko.com/api/v3/coins/{0}/history?date={1}&localization=false"
 COINGECKO_BASE_URL = "https://api.coingecko.com/api/v3/simple/price?ids={0}&vs_currencies={1}"
+COINGECKO_RANGE_URL = "https://api.coingecko.com/api/v3/coins/{0}/market_chart/range?vs_currency={1}&from={2}&to={3}"
 
 BRIDGE_CONFIG_ABI = """[{"inputs":[{"internalType":"string","name":"tokenAddress","type":"string"},{"internalType":"uint256","name":"chainID","type":"uint256"}],"name":"getTokenByAddress","outputs":[{"components":[{"internalType":"uint256","name":"chainId","type":"uint256"},{"internalType":"string","name":"tokenAddress","type":"string"},{"internalType":"uint8","name":"tokenDecimals","type":"uint8"},{"internalType":"uint256","name":"maxSwap","type":"uint256"},{"internalType":"uint256","name":"minSwap","type":"uint256"},{"internalType":"uint256","name":"swapFee","type":"uint256"},{"internalType":"uint256","name":"maxSwapFee","type":"uint256"},{"internalType":"uint256","name":"minSwapFee","type":"uint256"},{"internalType":"bool","name":"hasUnderlying","type":"bool"},{"internalType":"bool","name":"isUnderlying","type":"bool"}],"internalType":"struct BridgeConfigV3.Token","name":"token","type":"tuple"}],"stateMutability":"view","type":"function"}]"""
 MINICHEF_ABI = """[{"inputs":[],"name":"synapsePerSecond","outputs":[{"internalType":"uint256","name":"","type":"uint256"}],"stateMutability":"view","type":"function"}]"""
@@ -84,6 +86,43 @@ else:
 if POPULATE_CACHE:
     print('`POPULATE_CACHE` set to true, disable this during deployment.')
 
+# Split the bridge indexer's backfill into this many concurrent shards per
+# chain, see :file:syn/utils/wrappa/rpc.py :func:backfill
+BACKFILL_SHARDS = int(os.getenv('BACKFILL_SHARDS', 1))
+
+# How the indexer stores its daily aggregates in `LOGS_REDIS_URL`, either
+# 'json' blobs, 'hash'es of fixed-point integers updated server side or a
+# 'compact' hash per chain and day, see :file:syn/utils/storage.py. Or in the
+# 'sqlite' db at `SQLITE_PATH` instead, see :file:syn/utils/sqlstore.py.
+# Switching requires an empty (or migrated) db, switching to 'compact'
+# migrates on startup.
+AGGREGATE_STORAGE = os.getenv('AGGREGATE_STORAGE', 'json').lower()
+assert AGGREGATE_STORAGE in ['json', 'hash', 'compact', 'sqlite'], \
+    f'invalid AGGREGATE_STORAGE: {AGGREGATE_STORAGE!r}'
+SQLITE_PATH = os.getenv('SQLITE_PATH', 'syn.db')
+
+# Requests per second (and burst) allowed to each rpc endpoint, 0 disables
+# rate limiting. The limit is per worker unless shared through redis.
+RPC_RATE_LIMIT = float(os.getenv('RPC_RATE_LIMIT', 0))
+RPC_BURST = int(os.getenv('RPC_BURST', 0))
+RPC_RATE_LIMIT_SHARED = os.getenv('RPC_RATE_LIMIT_SHARED',
+                                  'false').lower() == 'true'
+# Requests every call of a batch request counts as against the rate limit,
+# providers tend to bill batches per call.
+RPC_BATCH_ITEM_COST = float(os.getenv('RPC_BATCH_ITEM_COST', 1))
+
+# Requests per second (and burst) allowed to CoinGecko, shared by every
+# worker through redis. 0 disables rate limiting.
+COINGECKO_RATE_LIMIT = float(os.getenv('COINGECKO_RATE_LIMIT', 0.5))
+COINGECKO_BURST = int(os.getenv('COINGECKO_BURST', 5))
+# Seconds between polls of the spot price of every id, 0 disables polling.
+SPOT_PRICE_INTERVAL = int(os.getenv('SPOT_PRICE_INTERVAL', 60))
+
+# Directory the columnar snapshot of the daily aggregates is written to after
+# every indexer pass, see :file:syn/utils/snapshot.py. Needs numpy, empty
+# disables the snapshot.
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', '')
+
 NULL_ADDR = '0x0000000000000000000000000000000000000000'
 
 CACHE_CONFIG = {
@@ -269,7 +308,14 @@ TREASURY = {
 
 # Init 'func' to append `contract` to SYN_DATA so we can call the ABI simpler later.
 for key, value in SYN_DATA.items():
-    w3 = Web3(Web3.HTTPProvider(value['rpc']))
+    # `*_RPC` may be a comma separated list of endpoints.
+    endpoints = [x.strip() for x in value['rpc'].split(',') if x.strip()]
+    w3 = Web3(
+        MultiHTTPProvider(
+            endpoints,
+            rate_limit=RPC_RATE_LIMIT,
+            burst=RPC_BURST,
+            client=MESSAGE_QUEUE_REDIS if RPC_RATE_LIMIT_SHARED else None))
     assert w3.isConnected(), key
 
     if key != 'ethereum':
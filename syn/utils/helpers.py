@@ -9,16 +9,18 @@
 from __future__ import annotations
 
 from typing import Any, List, Dict, Literal, Optional, TypeVar, Union, cast, \
-    Callable, Generator, TYPE_CHECKING, DefaultDict
+    Callable, Generator, TYPE_CHECKING, DefaultDict, Tuple, TypedDict, \
+    Iterable
 from datetime import datetime, timedelta, date
 from collections import defaultdict
+from fnmatch import fnmatchcase
 import contextlib
 import traceback
 import decimal
 import logging
 import copy
 
-from web3.types import _Hash32, TxReceipt, LogReceipt, TxData
+from web3.types import _Hash32, TxReceipt, LogReceipt, TxData, BlockData
 from werkzeug.datastructures import MultiDict
 from hexbytes import HexBytes
 from gevent import Greenlet
@@ -30,10 +32,15 @@ import gevent
 import bech32
 
 from syn.utils.data import (REDIS, TOKEN_DECIMALS, SYN_DATA, LOGS_REDIS_URL,
-                            _cb, _tk_d, _sml_adr, TOKENS_INFO, new_tokens_file)
+                            _cb, _tk_d, _sml_adr, TOKENS_INFO, new_tokens_file,
+                            AGGREGATE_STORAGE)
+from syn.utils.storage import decode_hash, get_aggregate_keys, is_indexed, \
+    iter_compact, compact_series, is_day, to_fixed, from_fixed, get_series
+from syn.utils.sqlstore import get_store
 
 if TYPE_CHECKING:
     from syn.utils.contract import _TokenInfo
+    from syn.utils.wrappa.rpc import LogSource
     from _typeshed import SupportsDunderGT
 
 logger = logging.Logger(__name__)
@@ -74,21 +81,81 @@ def raise_if(val: Any, match: Any) -> Any:
     return val
 
 
-def get_all_keys(pattern: str,
-                 serialize: bool = False,
-                 client: Redis = REDIS,
-                 index: Union[List[int], int] = 1,
-                 use_max_of_duped_keys: bool = False) -> Dict[str, Any]:
+# Keys SCAN looks at per call, and keys fetched per MGET/pipeline.
+SCAN_COUNT = 1000
+FETCH_BATCH = 500
+
+
+def iter_values(
+    keys: Iterable[str],
+    serialize: bool = False,
+    client: Redis = REDIS,
+    hashes: bool = False,
+    batch_size: int = FETCH_BATCH,
+) -> Generator[Tuple[str, Any], None, None]:
+    """
+    Stream (key, value) of `keys`, fetching values in batches. Values are
+    only decoded once reached, keys which do not exist are skipped.
+    """
+    def _fetch(keys: List[str]) -> Generator[Tuple[str, Any], None, None]:
+        if hashes:
+            pipe = client.pipeline(transaction=False)
+            for key in keys:
+                pipe.hgetall(key)
+            values = pipe.execute()
+        else:
+            values = client.mget(keys)
+
+        for key, ret in zip(keys, values):
+            if not ret:
+                continue
+
+            if serialize:
+                if hashes:
+                    ret = decode_hash(ret)
+                else:
+                    ret = json.loads(ret, use_decimal=True)
+
+            yield key, ret
+
+    batch: List[str] = []
+
+    for key in keys:
+        batch.append(key)
+
+        if len(batch) >= batch_size:
+            yield from _fetch(batch)
+            batch = []
+
+    if batch:
+        yield from _fetch(batch)
+
+
+def iter_all_keys(
+    pattern: str,
+    serialize: bool = False,
+    client: Redis = REDIS,
+    hashes: bool = False,
+    count: int = SCAN_COUNT,
+    batch_size: int = FETCH_BATCH,
+) -> Generator[Tuple[str, Any], None, None]:
+    """
+    :func:`iter_values` of every key matching `pattern`, using SCAN so redis
+    is never blocked.
+    """
+    return iter_values(client.scan_iter(match=pattern, count=count),
+                       serialize, client, hashes, batch_size)
+
+
+def _to_dict(items: Iterable[Tuple[str, Any]],
+             serialize: bool,
+             index: Union[List[int], int],
+             use_max_of_duped_keys: bool = False) -> Dict[str, Any]:
     res = cast(Dict[str, Any], defaultdict(dict))
     assert isinstance(index, (int, list))
 
-    for key in client.keys(pattern):
-        ret = client.get(key)
-
+    for key, ret in items:
         if serialize:
-            if ret is not None:
-                ret = json.loads(ret, use_decimal=True)
-
             if index is not None:
                 if type(index) == int:
                     key = key.split(':')[index]
@@ -110,6 +177,104 @@ def get_all_keys(pattern: str,
     return res
 
 
+def get_all_keys(pattern: str,
+                 serialize: bool = False,
+                 client: Redis = REDIS,
+                 index: Union[List[int], int] = 1,
+                 use_max_of_duped_keys: bool = False,
+                 hashes: bool = False) -> Dict[str, Any]:
+    return _to_dict(iter_all_keys(pattern, serialize, client, hashes),
+                    serialize, index, use_max_of_duped_keys)
+
+
+def _scan_aggregate_keys(
+    chain: str,
+    ns: str,
+    series: str = '*',
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+) -> Generator[str, None, None]:
+    """:func:`get_aggregate_keys` by scanning `LOGS_REDIS_URL` instead."""
+    _since, _until = since or date.min, until or date.max
+
+    compact = AGGREGATE_STORAGE == 'compact'
+    # Series are fields of the day's hash with 'compact' storage.
+    pattern = f'{chain}:{ns}:*' if compact else f'{chain}:{ns}:*:{series}'
+
+    for key in LOGS_REDIS_URL.scan_iter(match=pattern, count=SCAN_COUNT):
+        # `*` also matches keys like `{chain}:pool:{pool}:newswapfees`.
+        try:
+            _date = date.fromisoformat(key.split(':')[2])
+        except ValueError:
+            continue
+
+        if not _since <= _date <= _until:
+            continue
+
+        if not compact:
+            yield key
+        elif is_day(key):
+            yield from (f'{key}:{x}' for x in compact_series(key)
+                        if fnmatchcase(x, series))
+
+
+def get_aggregate_series(chain: str,
+                         ns: str,
+                         series: str = '*') -> List[Tuple[str, str]]:
+    """
+    :func:`syn.utils.storage.get_series`, which scans for them instead
+    while the index is still being built.
+    """
+    if (store := get_store()) is not None:
+        return store.series(chain, ns, series)
+    elif is_indexed():
+        return get_series(chain, ns, series)
+
+    return sorted({(key.split(':')[0], key.split(':', 3)[3])
+                   for key in _scan_aggregate_keys(chain, ns, series)})
+
+
+def iter_aggregates(
+    chain: str,
+    ns: str,
+    series: str = '*',
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+) -> Generator[Tuple[str, Any], None, None]:
+    """
+    Stream (key, value) of every aggregate `{chain}:{ns}:{date}:{series}`
+    matching the `chain` and `series` globs, decoded the same whichever
+    `AGGREGATE_STORAGE` they are stored with.
+    """
+    if (store := get_store()) is not None:
+        yield from store.iter_aggregates(chain, ns, series, since, until)
+        return
+
+    if is_indexed():
+        keys: Iterable[str] = get_aggregate_keys(chain, ns, series, since,
+                                                 until)
+    else:
+        # Index is still being built, fall back to scanning.
+        keys = _scan_aggregate_keys(chain, ns, series, since, until)
+
+    if AGGREGATE_STORAGE == 'compact':
+        yield from iter_compact(keys)
+    else:
+        yield from iter_values(keys, True, LOGS_REDIS_URL,
+                               AGGREGATE_STORAGE == 'hash')
+
+
+def get_aggregates(chain: str,
+                   ns: str,
+                   series: str = '*',
+                   index: Union[List[int], int] = 1,
+                   since: Optional[date] = None,
+                   until: Optional[date] = None) -> Dict[str, Any]:
+    """:func:`iter_aggregates` keyed like :func:`get_all_keys` does."""
+    return _to_dict(iter_aggregates(chain, ns, series, since, until), True,
+                    index)
+
+
 def convert_amount(chain: str, token: str, amount: int) -> D:
     try:
         return handle_decimals(amount, TOKEN_DECIMALS[chain][token.lower()])
@@ -125,64 +290,169 @@ def hex_to_int(str_hex: str) -> int:
     return int(str_hex[2:], 16)
 
 
+class TxContext(TypedDict, total=False):
+    """What we already have of a tx, see :func:`get_gas_stats_for_tx`."""
+    receipt: TxReceipt
+    tx: TxData
+    block: BlockData
+
+
+def _to_int(value: Union[int, str]) -> int:
+    # Non-standard receipt fields are not formatted by web3.
+    return hex_to_int(value) if isinstance(value, str) else value
+
+
 def get_gas_stats_for_tx(chain: str,
                          w3: Web3,
                          txhash: _Hash32,
-                         receipt: TxReceipt = None) -> Dict[str, D]:
+                         receipt: TxReceipt = None,
+                         ctx: TxContext = None,
+                         fixed: bool = False) -> Dict[str, Any]:
+    """
+    Gas price (in gwei) and gas paid (in the native token) of `txhash`, read
+    from the receipt where possible. The tx and its block are only fetched
+    if `ctx` does not have them and the receipt lacks the fields needed.
+
+    Stats are `Decimal`s, or fixed-point ints if `fixed`, see
+    :func:`syn.utils.storage.to_fixed`.
+    """
+    ctx = ctx or {}
+
     if receipt is None:
-        receipt = w3.eth.get_transaction_receipt(txhash)
+        receipt = ctx.get('receipt') or w3.eth.get_transaction_receipt(txhash)
+
+    gas_used = receipt['gasUsed']
 
     # Arbitrum has this crazy gas bidding system, this isn't some
     # sort of auction now is it?
-    if chain == 'arbitrum':
+    if chain == 'arbitrum' and 'feeStats' in receipt:
         paid = receipt['feeStats']['paid']  # type: ignore
         paid_for_gas = 0
 
         for key in paid:
             paid_for_gas += hex_to_int(paid[key])
+    else:
+        if 'effectiveGasPrice' in receipt:
+            price = _to_int(receipt['effectiveGasPrice'])  # type: ignore
+        else:
+            # Nodes which predate EIP-1559 only have it in the tx.
+            tx = ctx.get('tx') or w3.eth.get_transaction(txhash)
 
-        gas_price = D(paid_for_gas) / (D(1e9) * D(receipt['gasUsed']))
-
-        return {
-            'gas_paid': handle_decimals(paid_for_gas, 18),
-            'gas_price': gas_price
-        }
-
-    ret = w3.eth.get_transaction(txhash)
-
-    # Optimism seems to be pricing gas on both L1 and L2,
-    # so we aggregate these and use gas_spent on L2 to
-    # determine the "gas price", L2 gasUsed numbers are somewhat consistent
-
-    # Turns out, Boba does the same. Who would've thought that
-    # L2s are not that different?
-    if chain in ['optimism', 'boba']:
-        paid_for_gas = receipt['gasUsed'] * ret['gasPrice']  # type: ignore
-        paid_for_gas += hex_to_int(receipt['l1Fee'])  # type: ignore
-        gas_used = receipt['gasUsed']  # type: ignore
-        gas_price = D(paid_for_gas) / (D(1e9) * D(gas_used))
-
-        return {
-            'gas_paid': handle_decimals(paid_for_gas, 18),
-            'gas_price': gas_price
-        }
-
-    gas_price = handle_decimals(ret['gasPrice'], 9)  # type: ignore
-
-    return {
-        'gas_paid': handle_decimals(gas_price * receipt['gasUsed'], 9),
-        'gas_price': gas_price
+            if 'gasPrice' in tx:
+                price = tx['gasPrice']
+            else:
+                block = ctx.get('block') \
+                    or w3.eth.get_block(receipt['blockNumber'])
+                price = min(
+                    tx['maxFeePerGas'],
+                    block['baseFeePerGas'] + tx['maxPriorityFeePerGas'],
+                )
+
+        paid_for_gas = gas_used * price
+
+        # Optimism seems to be pricing gas on both L1 and L2,
+        # so we aggregate these and use gas_spent on L2 to
+        # determine the "gas price", L2 gasUsed numbers are somewhat
+        # consistent
+
+        # Turns out, Boba does the same. Who would've thought that
+        # L2s are not that different?
+        if chain in ['optimism', 'boba'] and 'l1Fee' in receipt:
+            paid_for_gas += _to_int(receipt['l1Fee'])  # type: ignore
+
+    # Native tokens all have 18 decimals, gas price is in gwei.
+    res = {
+        'gas_paid': to_fixed(paid_for_gas, 18),
+        'gas_price': to_fixed(paid_for_gas, 9) // gas_used,
     }
 
+    if fixed:
+        return res
+
+    return {k: from_fixed(v) for k, v in res.items()}
+
+
+# Deployment blocks of the pools, see :func:`get_pool_addresses`.
+_pool_start_blocks = {
+    'ethereum': {
+        'nusd': 13033711,
+    },
+    'avalanche': {
+        'nusd': 6619002,
+        'neth': 7378400,
+    },
+    'bsc': {
+        'nusd': 12431591,
+    },
+    'polygon': {
+        'nusd': 21071348,
+    },
+    'arbitrum': {
+        'nusd': 2876718,
+        'neth': 762758,
+        '3pool': 5152261,
+    },
+    'fantom': {
+        'nusd': 21297076,
+        'neth': 28288390,
+        '3pool': 29236172,
+    },
+    'harmony': {
+        'nusd': 19163634,
+    },
+    'boba': {
+        'nusd': 16221,
+        'neth': 49329,
+    },
+    'optimism': {
+        'neth': 30819,
+        'nusd': 6045403,
+    },
+    'aurora': {
+        'nusd': 56441515,
+    },
+    'metis': {
+        'nusd': 1251758,
+        'neth': 1698938,
+    },
+    'cronos': {
+        'nusd': 2511054,
+    },
+    'klaytn': {
+        'nusd': 94136612,
+    },
+}
+
+
+def get_pool_addresses(chain: str) -> List[Tuple[str, int]]:
+    """(address, deployment block) of every pool on `chain`."""
+    addresses: List[Tuple[str, int]] = []
+
+    if 'pool_contract' in SYN_DATA[chain]:
+        _start_block = _pool_start_blocks[chain]['nusd']
+        addresses.append((SYN_DATA[chain]['pool'], _start_block))
+
+    if 'ethpool_contract' in SYN_DATA[chain]:
+        _start_block = _pool_start_blocks[chain]['neth']
+        addresses.append((SYN_DATA[chain]['ethpool'], _start_block))
+
+    if '3pool_contract' in SYN_DATA[chain]:
+        _start_block = _pool_start_blocks[chain]['3pool']
+        addresses.append((SYN_DATA[chain]['3pool'], _start_block))
+
+    return addresses
+
 
 def dispatch_get_logs(
-    cb: Callable[[str, str, LogReceipt], None],
+    cb: Callable[..., None],
     topics: List[str] = None,
     key_namespace: str = 'logs',
     address_key: Union[str, Literal[-1]] = 'bridge',
     join_all: bool = True,
+    prefetch: Callable[[str, List[LogReceipt]], Any] = None,
+    shards: int = 1,
 ) -> Optional[List[Greenlet]]:
-    from .wrappa.rpc import get_logs, TOPICS
+    from .wrappa.rpc import get_logs, backfill, TOPICS
 
     jobs: List[Greenlet] = []
 
@@ -194,129 +464,57 @@ def dispatch_get_logs(
         if address_key != -1:
             addresses.append([SYN_DATA[chain][cast(str, address_key)], None])
         else:
-            _start_blocks = {
-                'ethereum': {
-                    'nusd': 13033711,
-                },
-                'avalanche': {
-                    'nusd': 6619002,
-                    'neth': 7378400,
-                },
-                'bsc': {
-                    'nusd': 12431591,
-                },
-                'polygon': {
-                    'nusd': 21071348,
-                },
-                'arbitrum': {
-                    'nusd': 2876718,
-                    'neth': 762758,
-                    '3pool': 5152261,
-                },
-                'fantom': {
-                    'nusd': 21297076,
-                    'neth': 28288390,
-                    '3pool': 29236172,
-                },
-                'harmony': {
-                    'nusd': 19163634,
-                },
-                'boba': {
-                    'nusd': 16221,
-                    'neth': 49329,
-                },
-                'optimism': {
-                    'neth': 30819,
-                    'nusd': 6045403,
-                },
-                'aurora': {
-                    'nusd': 56441515,
-                },
-                'metis': {
-                    'nusd': 1251758,
-                    'neth': 1698938,
-                },
-                'cronos': {
-                    'nusd': 2511054,
-                },
-                'klaytn': {
-                    'nusd': 94136612,
-                },
-            }
-
-            if 'pool_contract' in SYN_DATA[chain]:
-                _start_block = _start_blocks[chain]['nusd']
-                addresses.append([SYN_DATA[chain]['pool'], _start_block])
-
-            if 'ethpool_contract' in SYN_DATA[chain]:
-                _start_block = _start_blocks[chain]['neth']
-                addresses.append([SYN_DATA[chain]['ethpool'], _start_block])
-
-            if '3pool_contract' in SYN_DATA[chain]:
-                _start_block = _start_blocks[chain]['3pool']
-                addresses.append([SYN_DATA[chain]['3pool'], _start_block])
+            addresses.extend(get_pool_addresses(chain))
 
         topics = topics or list(TOPICS)
 
         for x in addresses:
             address, start_block = x[0], x[1]
-            if chain in [
-                    'harmony',
-                    'bsc',
-                    'ethereum',
-                    'moonriver',
-                    'aurora',
-                    'moonbeam',
-                    'dfk',
-            ]:
-                jobs.append(
-                    gevent.spawn(get_logs,
-                                 chain,
-                                 cb,
-                                 address,
-                                 max_blocks=1024,
-                                 topics=topics,
-                                 start_block=start_block,
-                                 key_namespace=key_namespace))
-            elif chain == 'cronos':
-                jobs.append(
-                    gevent.spawn(get_logs,
-                                 chain,
-                                 cb,
-                                 address,
-                                 max_blocks=2000,
-                                 topics=topics,
-                                 start_block=start_block,
-                                 key_namespace=key_namespace))
-            elif chain == 'boba':
-                jobs.append(
-                    gevent.spawn(get_logs,
-                                 chain,
-                                 cb,
-                                 address,
-                                 max_blocks=512,
-                                 topics=topics,
-                                 start_block=start_block,
-                                 key_namespace=key_namespace))
-            elif chain in ['polygon', 'avalanche']:
+            if shards > 1:
                 jobs.append(
-                    gevent.spawn(get_logs,
+                    gevent.spawn(backfill,
                                  chain,
                                  cb,
                                  address,
-                                 max_blocks=2048,
+                                 shards,
                                  topics=topics,
-                                 start_block=start_block,
-                                 key_namespace=key_namespace))
-            else:
-                jobs.append(
-                    gevent.spawn(get_logs,
-                                 chain,
-                                 cb,
-                                 address,
-                                 topics=topics,
-                                 start_block=start_block,
-                                 key_namespace=key_namespace))
+                                 key_namespace=key_namespace,
+                                 prefetch=prefetch))
+                continue
+
+            # The block range of each request is learned per chain by
+            # `get_logs` itself.
+            jobs.append(
+                gevent.spawn(get_logs,
+                             chain,
+                             cb,
+                             address,
+                             topics=topics,
+                             start_block=start_block,
+                             key_namespace=key_namespace,
+                             prefetch=prefetch))
+
+    if join_all:
+        gevent.joinall(jobs)
+    else:
+        return jobs
+
+
+def dispatch_scan(
+    sources: Callable[[str], List[LogSource]],
+    join_all: bool = True,
+    prefetch: Callable[[str, List[LogReceipt]], Any] = None,
+) -> Optional[List[Greenlet]]:
+    """
+    Like :func:`dispatch_get_logs` but with a single scan per chain over
+    every address `sources` returns for it, rather than one per address.
+    """
+    from .wrappa.rpc import scan
+
+    jobs: List[Greenlet] = [
+        gevent.spawn(scan, chain, sources(chain), prefetch=prefetch)
+        for chain in SYN_DATA
+    ]
 
     if join_all:
         gevent.joinall(jobs)
@@ -618,7 +816,16 @@ def recursive_defaultdict() -> DefaultDict:
 
 
 def date2block(chain: str, date: date) -> Optional[Dict[str, int]]:
-    ret = LOGS_REDIS_URL.get(f'{chain}:date2block:{date}')
+    key = f'{chain}:date2block:{date}'
+
+    if (store := get_store()) is not None:
+        return store.date2block(chain, date)
+
+    if AGGREGATE_STORAGE == 'hash':
+        ret = LOGS_REDIS_URL.hgetall(key)
+        return {k: int(v) for k, v in ret.items()} or None
+
+    ret = LOGS_REDIS_URL.get(key)
     if ret is not None:
         ret = json.loads(ret)
 
@@ -9,14 +9,21 @@
 
 from datetime import datetime, timedelta
 from decimal import Decimal
+from typing import List
 from enum import Enum
 import logging
+import time
 
 import dateutil.parser
+import lru
 
-from syn.utils.data import REDIS, POPULATE_CACHE, MESSAGE_QUEUE_REDIS
-from syn.utils.cache import redis_cache, _serialize_args_to_str
+from syn.utils.data import REDIS, POPULATE_CACHE
+from syn.utils.cache import redis_cache, _serialize_args_to_str, \
+    _redis_cache
 from syn.utils.helpers import date_range
+from syn.utils.pricetable import PriceTable
+from syn.utils.spotprice import SpotPrices
+from syn.utils.pricequeue import enqueue
 
 logger = logging.Logger(__name__)
 
@@ -344,37 +351,78 @@ ADDRESS_TO_CGID = {
 }
 
 
-# Fetch prices from cache but DO NOT actually cache responses.
-@redis_cache(filter=lambda _: False)
+PRICE_TABLE = PriceTable([x.value for x in CoingeckoIDS])
+SPOT_PRICES = SpotPrices([x.value for x in CoingeckoIDS])
+# Seconds a price resolved from an earlier day is served for the requested
+# day, and how long a price which could not be resolved at all stays 0.
+RESOLVED_TTL = 60 * 5
+ABSENT_TTL = 60
+# Missing price keys this process has queued already, and when.
+_queued = lru.LRU(2**16)
+
+
 def get_historic_price(_id: CoingeckoIDS,
                        date: str,
                        currency: str = "usd") -> Decimal:
+    if (price := PRICE_TABLE.get(_id.value, date)) is not None:
+        return price
+
+    return _get_historic_price(_id, date, currency)
+
+
+def _queue_missing(keys: List[str], requested: bool = False) -> None:
+    # Every process only queues a key once every `ABSENT_TTL` seconds, the
+    # queue retries what it could not fill itself. Queueing it again brings
+    # back keys the queue has since given up on.
+    now = time.time()
+
+    if (keys := [x for x in keys if now - _queued.get(x, 0) >= ABSENT_TTL]):
+        enqueue(keys, requested)
+
+        for x in keys:
+            _queued[x] = now
+
+
+# Fetch prices from cache but DO NOT actually cache responses.
+@redis_cache(filter=lambda _: False)
+def _get_historic_price(_id: CoingeckoIDS,
+                        date: str,
+                        currency: str = "usd") -> Decimal:
     # If this function is running here, price has not been indexed yet by
     # the worker. Data should be returned by `redis_cache()`
     if POPULATE_CACHE:
         return Decimal()
 
-    MESSAGE_QUEUE_REDIS.sadd(
-        'prices:missing', *[
-            _serialize_args_to_str(_id, date, currency),
-            _serialize_args_to_str(_id, date)
-        ])
+    key = _serialize_args_to_str(_id, date, currency)
+    _queue_missing([key, _serialize_args_to_str(_id, date)], True)
+
+    if (price := PRICE_TABLE.fallback(_id.value, date)) is None:
+        _date = dateutil.parser.parse(date)
+        keys = []
 
-    _date = dateutil.parser.parse(date)
-    for date in date_range(_date, _date - timedelta(days=7)):
-        _key = _serialize_args_to_str(_id, date)
-        keys = [_key, f'{_key}:usd']
+        for x in date_range(_date, _date - timedelta(days=7)):
+            _key = _serialize_args_to_str(_id, x)
+            keys += [_key, f'{_key}:usd']
 
-        for key in keys:
-            if (data := REDIS.get(key)) is not None:
+        for i, data in enumerate(REDIS.mget(keys)):
+            if data is not None:
                 # NOTE: data could be 0.
-                return Decimal(data)
-            else:
-                MESSAGE_QUEUE_REDIS.sadd('prices:missing', key)
+                price = Decimal(data)
+                keys = keys[:i]
+                break
 
-    # Did not converge, just fallback to 0.
-    logging.warning(f'returned 0 for {_id} @ {date}')
-    return Decimal()
+        _queue_missing(keys)
+
+    # Serve the resolved price (or lack of) for the requested day for a bit,
+    # rather than walking back again on every call.
+    if price is None:
+        # Did not converge, just fallback to 0.
+        logging.warning(f'returned 0 for {_id} @ {date}')
+        _redis_cache.set(key, Decimal(), timeout=ABSENT_TTL)
+        return Decimal()
+
+    _redis_cache.set(key, price, timeout=RESOLVED_TTL)
+    return price
 
 
 def get_historic_price_syn(date: str, currency: str = "usd") -> Decimal:
@@ -414,5 +462,8 @@ def get_price_for_address(chain: str, address: str) -> Decimal:
 
 
 def get_price_coingecko(_id: CoingeckoIDS, currency: str = "usd") -> Decimal:
+    if currency == 'usd' and (price := SPOT_PRICES.get(_id.value)):
+        return price
+
     # Proxy method for get_historic_price() with `_date` as today.
     return get_historic_price(_id, datetime.now().date().isoformat(), currency)
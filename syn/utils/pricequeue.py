@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+          Copyright Blaze 2021.
+ Distributed under the Boost Software License, Version 1.0.
+    (See accompanying file LICENSE_1_0.txt or copy at
+          https://www.boost.org/LICENSE_1_0.txt)
+"""
+
+from typing import Dict, Iterable, List, Optional, Set
+from datetime import date as Date
+import traceback
+import time
+
+from gevent.pool import Pool
+
+from syn.utils.wrappa.coingecko import ingest_prices
+from syn.utils.data import REDIS, MESSAGE_QUEUE_REDIS
+from syn.utils.pricetable import publish_prices
+
+# Seconds a missing price is pulled forward in the queue for being recent,
+# halving with every day of age, and for a request waiting on it.
+RECENT_BONUS = 3600
+REQUESTED_BONUS = 3600
+# A price is retried `BACKOFF * 2**attempts` seconds after a failed attempt,
+# and dropped after `MAX_ATTEMPTS` of them.
+BACKOFF = 60
+MAX_ATTEMPTS = 8
+# Consumers working the queue at once and prices each claims at a time,
+# CoinGecko's rate limit is shared by all of them.
+CONSUMERS = 4
+CLAIM_BATCH = 50
+
+# Missing price keys scored by when they are due, lowest first.
+_KEY_QUEUE = 'prices:queue'
+_KEY_ATTEMPTS = 'prices:attempts'
+# What the queue replaced, drained into it by :func:`consume`.
+_KEY_LEGACY = 'prices:missing'
+
+# KEYS[1]: queue, ARGV: now, count. Pops up to `count` due keys.
+_CLAIM_SCRIPT = """
+local keys = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1],
+                        'LIMIT', 0, tonumber(ARGV[2]))
+
+for _, key in ipairs(keys) do
+    redis.call('ZREM', KEYS[1], key)
+end
+
+return keys
+"""
+_claim = MESSAGE_QUEUE_REDIS.register_script(_CLAIM_SCRIPT)
+
+
+def _parse(key: str) -> Optional[Date]:
+    try:
+        return Date.fromisoformat(key.split(':')[1])
+    except (IndexError, ValueError):
+        return None
+
+
+def _canonical(key: str) -> str:
+    # Both variants are filled by the same request, so queue them once.
+    return key[:-len(':usd')] if key.endswith(':usd') else key
+
+
+def _score(day: Date, requested: bool) -> float:
+    score = time.time() - RECENT_BONUS / 2**max((Date.today() - day).days, 0)
+
+    if requested:
+        score -= REQUESTED_BONUS
+
+    return score
+
+
+def enqueue(keys: Iterable[str], requested: bool = False) -> None:
+    """
+    Queue the missing price `keys`, keys which are queued already only move
+    up if they are now more urgent. Keys backing off after a failed attempt
+    stay where :func:`_retry` put them, however urgent.
+
+    Needs redis >= 6.2 for `ZADD LT`.
+    """
+    scores = {}
+
+    for key in keys:
+        if (day := _parse(key)) is not None:
+            scores[_canonical(key)] = _score(day, requested)
+
+    if not scores:
+        return
+
+    attempts = MESSAGE_QUEUE_REDIS.hmget(_KEY_ATTEMPTS, list(scores))
+    scores = {
+        k: v
+        for (k, v), x in zip(scores.items(), attempts) if x is None
+    }
+
+    if scores:
+        MESSAGE_QUEUE_REDIS.zadd(_KEY_QUEUE, scores, lt=True)
+
+
+def _retry(keys: List[str]) -> None:
+    pipe = MESSAGE_QUEUE_REDIS.pipeline(transaction=False)
+    for key in keys:
+        pipe.hincrby(_KEY_ATTEMPTS, key, 1)
+
+    scores = {}
+    dropped = []
+    for key, attempts in zip(keys, pipe.execute()):
+        if attempts >= MAX_ATTEMPTS:
+            dropped.append(key)
+        else:
+            scores[key] = time.time() + BACKOFF * 2**attempts
+
+    pipe = MESSAGE_QUEUE_REDIS.pipeline(transaction=False)
+    if scores:
+        pipe.zadd(_KEY_QUEUE, scores)
+    if dropped:
+        print(f'giving up on prices: {dropped}')
+        pipe.hdel(_KEY_ATTEMPTS, *dropped)
+    pipe.execute()
+
+
+def _process(keys: List[str]) -> None:
+    pending: List[str] = []
+    copied: List[str] = []
+    # Id -> days we still need, fetched as a single range per id. Days with
+    # a '0' price are fetched apart, as they have to be overwritten.
+    missing: Dict[str, Set[Date]] = {}
+    zeros: Dict[str, Set[Date]] = {}
+
+    ret = REDIS.mget([y for x in keys for y in [x, f'{x}:usd']])
+    for key, plain, usd in zip(keys, ret[::2], ret[1::2]):
+        # What failed fetches used to write, which is no price at all.
+        zero = '0' in [plain, usd]
+        plain, usd = [None if x == '0' else x for x in [plain, usd]]
+
+        # Only one of them was written, copy it over.
+        if plain is None and usd is not None:
+            if REDIS.set(key, usd, nx=not zero):
+                copied.append(key)
+        elif usd is None and plain is not None:
+            if REDIS.set(f'{key}:usd', plain, nx=not zero):
+                copied.append(f'{key}:usd')
+        elif plain is None:
+            days = zeros if zero else missing
+            days.setdefault(key.split(':')[0], set()).add(_parse(key))
+            pending.append(key)
+
+    publish_prices(copied)
+    ingest_prices(missing)  # type: ignore
+    ingest_prices(zeros, overwrite=True)  # type: ignore
+
+    failed = []
+    for key, data in zip(pending, REDIS.mget(pending) if pending else []):
+        if data is None or data == '0':
+            failed.append(key)
+
+    if failed:
+        _retry(failed)
+    if (done := [x for x in keys if x not in failed]):
+        MESSAGE_QUEUE_REDIS.hdel(_KEY_ATTEMPTS, *done)
+
+
+def _consumer(deadline: float) -> int:
+    processed = 0
+
+    while time.time() < deadline:
+        keys = _claim(keys=[_KEY_QUEUE], args=[time.time(), CLAIM_BATCH])
+
+        if not keys:
+            break
+
+        try:
+            _process(keys)
+        except Exception:
+            # Do not lose what we claimed.
+            traceback.print_exc()
+            _retry(keys)
+
+        processed += len(keys)
+
+    return processed
+
+
+def consume(timeout: float = 60 * 4) -> int:
+    """
+    Fill every missing price which is due with :data:`CONSUMERS` consumers,
+    for up to `timeout` seconds. Claiming is atomic, so consumers in other
+    workers may run at the same time.
+
+    Returns:
+        int: prices processed.
+    """
+    if (keys := MESSAGE_QUEUE_REDIS.smembers(_KEY_LEGACY)):
+        enqueue(keys)
+        MESSAGE_QUEUE_REDIS.srem(_KEY_LEGACY, *keys)
+
+    deadline = time.time() + timeout
+    pool = Pool(CONSUMERS)
+    jobs = [pool.spawn(_consumer, deadline) for _ in range(CONSUMERS)]
+    pool.join()
+
+    return sum(x.value or 0 for x in jobs)
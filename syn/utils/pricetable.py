@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+          Copyright Blaze 2021.
+ Distributed under the Boost Software License, Version 1.0.
+    (See accompanying file LICENSE_1_0.txt or copy at
+          https://www.boost.org/LICENSE_1_0.txt)
+"""
+
+from typing import Any, Iterable, List, Optional, Union
+from datetime import date as Date, datetime
+from decimal import Decimal
+import traceback
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    # The table is optional, prices are then read from redis on every call.
+    np = None
+
+from syn.utils.data import REDIS
+
+# First day loaded into the table, predates every price we ever stored.
+START = Date(2021, 1, 1)
+# Days `get_historic_price` walks back when a price is missing, the requested
+# day included.
+FALLBACK_DAYS = 7
+# Seconds between checks for prices written by other processes.
+REFRESH_INTERVAL = 30
+# Keys fetched per MGET when loading the table.
+LOAD_BATCH = 1000
+# Publishes kept in `_KEY_UPDATES`, tables which fell further behind than
+# this reload from scratch.
+KEEP_UPDATES = 10000
+
+# Price keys which were written, scored by `_KEY_SEQ` at the time of writing.
+_KEY_UPDATES = 'prices:updates'
+_KEY_SEQ = 'prices:seq'
+# Every update scored at or below this was pruned.
+_KEY_PRUNED = 'prices:updates:pruned'
+
+# KEYS: updates, seq, pruned. ARGV[1]: publishes kept, ARGV[2:]: keys.
+# Returns the seq the keys were published under.
+_PUBLISH_SCRIPT = """
+local seq = redis.call('INCR', KEYS[2])
+
+for i = 2, #ARGV do
+    redis.call('ZADD', KEYS[1], seq, ARGV[i])
+end
+
+local pruned = seq - tonumber(ARGV[1])
+if pruned > 0 then
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', pruned)
+    redis.call('SET', KEYS[3], pruned)
+end
+
+return seq
+"""
+_publish = REDIS.register_script(_PUBLISH_SCRIPT)
+
+
+def _day(date: Union[str, Date]) -> Optional[int]:
+    try:
+        if isinstance(date, str):
+            date = Date.fromisoformat(date[:10])
+        elif isinstance(date, datetime):
+            date = date.date()
+    except ValueError:
+        return None
+
+    return (date - START).days
+
+
+def _keys(_id: str, day: int) -> List[str]:
+    # Same keys `update_prices` writes, the plain one is preferred.
+    key = f'{_id}:{Date.fromordinal(START.toordinal() + day)}'
+    return [key, f'{key}:usd']
+
+
+def publish_prices(keys: Iterable[str], pipe: Any = None) -> None:
+    """
+    Let every process' :class:`PriceTable` know `keys` were (re)written,
+    they pick them up on their next refresh.
+    """
+    if not (keys := list(keys)):
+        return
+
+    # Atomic, so no reader sees the seq before its keys.
+    _publish(keys=[_KEY_UPDATES, _KEY_SEQ, _KEY_PRUNED],
+             args=[KEEP_UPDATES, *keys],
+             client=pipe)
+
+
+class PriceTable:
+    """
+    Historic prices of every id as a dense id x day matrix, `nan` where no
+    price is stored. It is loaded in bulk on first use and then kept up to
+    date through :func:`publish_prices`, so lookups (and the 7 day fallback
+    of :func:`syn.utils.price.get_historic_price`) are array reads.
+    """
+    def __init__(self, ids: List[str]) -> None:
+        self._ids = list(ids)
+        self.ids = {x: i for i, x in enumerate(ids)}
+        self.prices: Any = None
+        # The stored prices as they were written, floats are not exact.
+        self.values: Any = None
+        # Most recent day with a price at or before every day, -1 if none.
+        self.last: Any = None
+        self.seq = 0
+        self.refreshed = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return np is not None
+
+    def load(self) -> None:
+        days = _day(Date.today()) + 1  # type: ignore
+        # Read the sequence first so nothing written meanwhile is missed.
+        seq = int(REDIS.get(_KEY_SEQ) or 0)
+        keys = [
+            key for x in self.ids for day in range(days)
+            for key in _keys(x, day)
+        ]
+
+        pipe = REDIS.pipeline(transaction=False)
+        for i in range(0, len(keys), LOAD_BATCH):
+            pipe.mget(keys[i:i + LOAD_BATCH])
+        ret = [y for x in pipe.execute() for y in x]
+
+        prices = np.full((len(self.ids), days), np.nan)
+        values = np.full((len(self.ids), days), None, dtype=object)
+        for i, (plain, usd) in enumerate(zip(ret[::2], ret[1::2])):
+            if (data := plain if plain is not None else usd) is not None:
+                values[divmod(i, days)] = Decimal(data)
+                prices[divmod(i, days)] = float(data)
+
+        self.prices = prices
+        self.values = values
+        self.last = self._last(prices)
+        self.seq = seq
+        self.refreshed = time.time()
+
+    @staticmethod
+    def _last(prices: Any) -> Any:
+        idx = np.where(np.isnan(prices), -1, np.arange(prices.shape[1]))
+        return np.maximum.accumulate(idx, axis=1)
+
+    def refresh(self) -> None:
+        """Apply the prices written since the last load or refresh."""
+        self.refreshed = time.time()
+
+        pipe = REDIS.pipeline(transaction=True)
+        pipe.get(_KEY_PRUNED)
+        pipe.zrangebyscore(_KEY_UPDATES,
+                           f'({self.seq}',
+                           '+inf',
+                           withscores=True)
+        pruned, ret = pipe.execute()
+
+        if self.seq < int(pruned or 0):
+            # Some of what we missed is gone already.
+            return self.load()
+        elif not ret:
+            return
+
+        cells = []
+        for key, seq in ret:
+            self.seq = max(self.seq, int(seq))
+            _id, date, *_ = key.split(':')
+
+            if _id in self.ids and (day := _day(date)) is not None \
+                    and day >= 0:
+                cells.append((self.ids[_id], day))
+
+        if not cells:
+            return
+
+        if (days := max(x for _, x in cells) + 1) > self.prices.shape[1]:
+            pad = ((0, 0), (0, days - self.prices.shape[1]))
+            self.prices = np.pad(self.prices, pad, constant_values=np.nan)
+            self.values = np.pad(self.values, pad, constant_values=None)
+
+        keys = [y for i, day in cells for y in _keys(self._ids[i], day)]
+        ret = REDIS.mget(keys)
+
+        for (i, day), plain, usd in zip(cells, ret[::2], ret[1::2]):
+            data = plain if plain is not None else usd
+            self.prices[i, day] = np.nan if data is None else float(data)
+            self.values[i, day] = None if data is None else Decimal(data)
+
+        self.last = self._last(self.prices)
+
+    def _ready(self) -> bool:
+        if not self.enabled:
+            return False
+
+        with self._lock:
+            try:
+                if self.prices is None:
+                    self.load()
+                elif time.time() - self.refreshed > REFRESH_INTERVAL:
+                    self.refresh()
+            except Exception:
+                # Serve from whatever we have, redis is the source of truth.
+                traceback.print_exc()
+                self.refreshed = time.time()
+
+                if self.prices is None:
+                    return False
+
+        return True
+
+    def _cell(self, _id: str, date: Union[str, Date]) -> Optional[Any]:
+        if _id not in self.ids or not self._ready():
+            return None
+        elif (day := _day(date)) is None or day < 0:
+            return None
+
+        return self.ids[_id], day
+
+    def get(self, _id: str, date: Union[str, Date]) -> Optional[Decimal]:
+        """Price of `_id` at `date`, `None` if it is not in the table."""
+        if (cell := self._cell(_id, date)) is None:
+            return None
+
+        i, day = cell
+        if day >= self.prices.shape[1] or np.isnan(self.prices[i, day]):
+            return None
+
+        return self.values[i, day]
+
+    def fallback(self, _id: str, date: Union[str, Date]) -> Optional[Decimal]:
+        """
+        Most recent price of `_id` within :data:`FALLBACK_DAYS` up to `date`,
+        `None` if there is none.
+        """
+        if (cell := self._cell(_id, date)) is None:
+            return None
+
+        i, day = cell
+        last = self.last[i, min(day, self.last.shape[1] - 1)]
+
+        if last < 0 or day - last >= FALLBACK_DAYS:
+            return None
+
+        return self.values[i, last]
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+          Copyright Blaze 2021.
+ Distributed under the Boost Software License, Version 1.0.
+    (See accompanying file LICENSE_1_0.txt or copy at
+          https://www.boost.org/LICENSE_1_0.txt)
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+from datetime import date as Date, timedelta
+from decimal import Decimal
+import traceback
+import shutil
+import time
+import json
+import os
+
+try:
+    import numpy as np
+except ImportError:
+    # The snapshot is optional, analytics read redis without it.
+    np = None
+
+from syn.utils.helpers import iter_aggregates
+from syn.utils.storage import FIXED_DECIMALS, decimal_to_fixed, from_fixed
+from syn.utils.data import SNAPSHOT_DIR
+
+# Amounts keep all `FIXED_DECIMALS` decimals, split at this into a `_hi` and
+# `_lo` int64 column each like :class:`SQLiteStore` does.
+LIMB = 10**18
+# `_lo` is summed in halves of this size so the sums cannot overflow.
+_HALF = 10**9
+# Bumped whenever the layout changes, older snapshots are not loaded.
+SNAPSHOT_VERSION = 2
+# Snapshots kept on disk, workers may still have the previous one mapped.
+KEEP = 2
+_CURRENT = 'CURRENT'
+_EPOCH = Date(1970, 1, 1)
+
+# Columns of every table and their dtype, columns listed in `STRINGS` are ids
+# into the snapshot's string table of that name and the ones in `FIXED` are
+# stored as two columns, see :func:`_columns`.
+TABLES: Dict[str, Dict[str, str]] = {
+    'bridge': {
+        'day': 'int32',
+        'chain': 'int32',
+        'token': 'int32',
+        'direction': 'int8',
+        # Chain id the tx bridges to, -1 for `IN` txs.
+        'dest': 'int64',
+        'tx_count': 'int64',
+        'amount': 'int64',
+        'fees': 'int64',
+        'airdrops': 'int64',
+        'gas_paid': 'int64',
+        'gas_price': 'int64',
+    },
+    'pool': {
+        'day': 'int32',
+        'chain': 'int32',
+        'pool': 'int32',
+        'tx_type': 'int32',
+        'tx_count': 'int64',
+        'volume': 'int64',
+        'lp_fees': 'int64',
+        'admin_fees': 'int64',
+    },
+}
+STRINGS = ['chain', 'token', 'pool', 'tx_type']
+FIXED = [
+    'amount', 'fees', 'airdrops', 'gas_paid', 'gas_price', 'volume', 'lp_fees',
+    'admin_fees'
+]
+DIRECTIONS = ['IN', 'OUT']
+
+
+def _fixed(value: Any) -> int:
+    return decimal_to_fixed(Decimal(value))
+
+
+def _columns(table: str) -> Dict[str, str]:
+    """Columns of `table` as stored, with the halves of amounts."""
+    ret: Dict[str, str] = {}
+
+    for x, dtype in TABLES[table].items():
+        if x in FIXED:
+            ret[f'{x}_hi'] = ret[f'{x}_lo'] = dtype
+        else:
+            ret[x] = dtype
+
+    return ret
+
+
+def _bridge_row(key: str, value: Dict[str, Any]) -> Dict[str, Any]:
+    chain, _, date, token, direction, *dest = key.split(':')
+    validator = value.get('validator', {})
+
+    return {
+        'day': (Date.fromisoformat(date) - _EPOCH).days,
+        'chain': chain,
+        'token': token,
+        'direction': DIRECTIONS.index(direction),
+        'dest': int(dest[0]) if dest else -1,
+        'tx_count': value['txCount'],
+        'amount': _fixed(value['amount']),
+        'fees': _fixed(value.get('fees', 0)),
+        'airdrops': _fixed(value.get('airdrops', 0)),
+        'gas_paid': _fixed(validator.get('gas_paid', 0)),
+        'gas_price': _fixed(validator.get('gas_price', 0)),
+    }
+
+
+def _pool_row(key: str, value: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    chain, _, date, pool, tx_type = key.split(':')
+
+    # Fee changes are settings rather than counters.
+    if tx_type == 'new_fee':
+        return None
+
+    return {
+        'day': (Date.fromisoformat(date) - _EPOCH).days,
+        'chain': chain,
+        'pool': pool,
+        'tx_type': tx_type,
+        'tx_count': value['tx_count'],
+        'volume': _fixed(value['volume']),
+        'lp_fees': _fixed(value['lp_fees']),
+        'admin_fees': _fixed(value['admin_fees']),
+    }
+
+
+def build_snapshot(path: str = SNAPSHOT_DIR) -> Optional[str]:
+    """
+    Export every bridge and pool aggregate to a new snapshot in `path`, one
+    `.npy` file per column, and make it the current one.
+
+    Returns:
+        Optional[str]: directory of the snapshot, `None` if disabled.
+    """
+    if np is None or not path:
+        return None
+
+    start = time.time()
+    strings: Dict[str, Dict[str, int]] = {x: {} for x in STRINGS}
+    columns: Dict[str, Dict[str, List[int]]] = {
+        table: {x: [] for x in _columns(table)}
+        for table in TABLES
+    }
+
+    for table, parse in [('bridge', _bridge_row), ('pool', _pool_row)]:
+        for key, value in iter_aggregates('*', table):
+            if (row := parse(key, value)) is None:
+                continue
+
+            for k, v in row.items():
+                if k in strings:
+                    v = strings[k].setdefault(v, len(strings[k]))
+                elif k in FIXED:
+                    hi, lo = divmod(v, LIMB)
+                    columns[table][f'{k}_hi'].append(hi)
+                    columns[table][f'{k}_lo'].append(lo)
+                    continue
+
+                columns[table][k].append(v)
+
+    version = str(time.time_ns())
+    out = os.path.join(path, version)
+    os.makedirs(out)
+
+    for table, cols in columns.items():
+        for col, values in cols.items():
+            np.save(os.path.join(out, f'{table}.{col}.npy'),
+                    np.array(values, dtype=_columns(table)[col]))
+
+    with open(os.path.join(out, 'meta.json'), 'w') as f:
+        json.dump(
+            {
+                'version': SNAPSHOT_VERSION,
+                'decimals': FIXED_DECIMALS,
+                'strings': {k: list(v)
+                            for k, v in strings.items()},
+            }, f)
+
+    # Swap atomically so workers never see a half written snapshot.
+    tmp = os.path.join(path, f'{_CURRENT}.{version}')
+    with open(tmp, 'w') as f:
+        f.write(version)
+    os.replace(tmp, os.path.join(path, _CURRENT))
+
+    versions = sorted(x for x in os.listdir(path) if x.isdigit())
+    for x in versions[:-KEEP]:
+        shutil.rmtree(os.path.join(path, x), ignore_errors=True)
+
+    print(f'snapshot {version} built with '
+          f'{len(columns["bridge"]["day"])} bridge and '
+          f'{len(columns["pool"]["day"])} pool rows '
+          f'in {time.time() - start:.2f}s')
+
+    return out
+
+
+class Snapshot:
+    """
+    A snapshot built by :func:`build_snapshot`, columns are read-only memory
+    maps so every worker shares the same pages.
+    """
+    def __init__(self, path: str, version: str) -> None:
+        self.version = version
+        out = os.path.join(path, version)
+
+        with open(os.path.join(out, 'meta.json')) as f:
+            meta = json.load(f)
+
+        if meta.get('version') != SNAPSHOT_VERSION \
+                or meta['decimals'] != FIXED_DECIMALS:
+            raise RuntimeError(f'outdated snapshot {version}: {meta}')
+
+        self.strings: Dict[str, List[str]] = meta['strings']
+        self.ids = {
+            k: {x: i
+                for i, x in enumerate(v)}
+            for k, v in self.strings.items()
+        }
+        self.tables = {
+            table: {
+                x: np.load(os.path.join(out, f'{table}.{x}.npy'),
+                           mmap_mode='r')
+                for x in _columns(table)
+            }
+            for table in TABLES
+        }
+
+    def where(self,
+              table: str,
+              since: Optional[Date] = None,
+              until: Optional[Date] = None,
+              **filters: Any) -> Any:
+        """
+        Mask of the rows of `table` matching every filter, e.g.
+        `where('bridge', chain='bsc', direction='IN')`. Filters which are
+        `None` are ignored.
+        """
+        cols = self.tables[table]
+        mask = np.ones(len(cols['day']), dtype=bool)
+
+        if since is not None:
+            mask &= cols['day'] >= (since - _EPOCH).days
+        if until is not None:
+            mask &= cols['day'] <= (until - _EPOCH).days
+
+        for k, v in filters.items():
+            if v is None:
+                continue
+            elif k in self.ids:
+                if v not in self.ids[k]:
+                    return np.zeros_like(mask)
+
+                v = self.ids[k][v]
+            elif k == 'direction':
+                v = DIRECTIONS.index(v)
+
+            mask &= cols[k] == v
+
+        return mask
+
+    def _decode(self, col: str, value: int) -> Any:
+        if col in self.strings:
+            return self.strings[col][value]
+        elif col == 'day':
+            return str(_EPOCH + timedelta(days=int(value)))
+        elif col == 'direction':
+            return DIRECTIONS[value]
+
+        return int(value)
+
+    def group_sum(self,
+                  table: str,
+                  by: List[str],
+                  values: List[str],
+                  since: Optional[Date] = None,
+                  until: Optional[Date] = None,
+                  **filters: Any) -> Dict[Tuple[Any, ...], Dict[str, Any]]:
+        """
+        Sum `values` of the rows matching :func:`where` grouped by `by`, e.g.
+        the daily tx count of every chain is
+        `group_sum('bridge', ['chain', 'day'], ['tx_count'])`.
+
+        Group keys and sums are decoded, so dates are iso strings and
+        amounts `Decimal`s like their redis equivalent.
+        """
+        cols = self.tables[table]
+        mask = self.where(table, since, until, **filters)
+
+        if not mask.any():
+            return {}
+
+        keys = np.stack([cols[x][mask].astype('int64') for x in by], axis=1)
+        groups, inverse = np.unique(keys, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+
+        def _sum(col: Any) -> List[int]:
+            ret = np.zeros(len(groups), dtype='int64')
+            np.add.at(ret, inverse, col[mask])
+            # Python ints from here on, which do not overflow.
+            return [int(x) for x in ret]
+
+        sums: Dict[str, List[Any]] = {}
+        for x in values:
+            if x not in FIXED:
+                sums[x] = _sum(cols[x])
+                continue
+
+            # Integer sums, so fixed-point amounts stay exact. Summing `_lo`
+            # as is overflows after 10 rows, its halves do not.
+            _lo = cols[f'{x}_lo']
+            sums[x] = [
+                from_fixed(hi * LIMB + mid * _HALF + lo)
+                for hi, mid, lo in zip(_sum(cols[f'{x}_hi']),
+                                       _sum(_lo // _HALF), _sum(_lo % _HALF))
+            ]
+
+        return {
+            tuple(self._decode(x, y) for x, y in zip(by, group)): {
+                x: sums[x][i]
+                for x in values
+            }
+            for i, group in enumerate(groups)
+        }
+
+
+_snapshot: Optional[Snapshot] = None
+
+
+def get_snapshot(path: str = SNAPSHOT_DIR) -> Optional[Snapshot]:
+    """The current snapshot, `None` if there is none (yet)."""
+    global _snapshot
+
+    if np is None or not path:
+        return None
+
+    try:
+        with open(os.path.join(path, _CURRENT)) as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        return None
+
+    if _snapshot is None or _snapshot.version != version:
+        try:
+            _snapshot = Snapshot(path, version)
+        except Exception:
+            traceback.print_exc()
+            return None
+
+    return _snapshot
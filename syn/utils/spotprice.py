@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+          Copyright Blaze 2021.
+ Distributed under the Boost Software License, Version 1.0.
+    (See accompanying file LICENSE_1_0.txt or copy at
+          https://www.boost.org/LICENSE_1_0.txt)
+"""
+
+from typing import Dict, List, Optional
+from decimal import Decimal
+import traceback
+import time
+import os
+
+import gevent
+
+from syn.utils.wrappa.coingecko import CoingeckoClient
+from syn.utils.data import REDIS, SPOT_PRICE_INTERVAL
+
+# Spot prices older than this are not served, callers then fall back to
+# today's historic price.
+MAX_AGE = 10 * 60
+
+_KEY = 'prices:spot'
+_KEY_UPDATED = 'prices:spot:updated'
+_KEY_LOCK = 'prices:spot:lock'
+
+
+class SpotPrices:
+    """
+    Current price of every id, polled from CoinGecko in a single request
+    every `interval` seconds by whichever worker gets there first and
+    published to redis, where every other worker picks it up from.
+    """
+    def __init__(self,
+                 ids: List[str],
+                 interval: int = SPOT_PRICE_INTERVAL,
+                 client: Optional[CoingeckoClient] = None) -> None:
+        self.ids = ids
+        self.interval = interval
+        self.client = client or CoingeckoClient()
+        self.prices: Dict[str, Decimal] = {}
+        self.updated = 0.0
+
+    def poll(self) -> None:
+        # The lock expires before the next poll of any worker is due.
+        if REDIS.set(_KEY_LOCK,
+                     os.getpid(),
+                     nx=True,
+                     ex=max(self.interval - 1, 1)):
+            try:
+                ret = self.client.spot(self.ids)
+
+                pipe = REDIS.pipeline(transaction=True)
+                pipe.hset(_KEY, mapping={k: str(v) for k, v in ret.items()})
+                pipe.set(_KEY_UPDATED, time.time())
+                pipe.execute()
+            except Exception:
+                traceback.print_exc()
+
+        pipe = REDIS.pipeline(transaction=False)
+        pipe.hgetall(_KEY)
+        pipe.get(_KEY_UPDATED)
+        prices, updated = pipe.execute()
+
+        if updated is not None:
+            self.prices = {k: Decimal(v) for k, v in prices.items()}
+            self.updated = float(updated)
+
+    def run(self) -> None:
+        if self.interval <= 0:
+            return
+
+        while True:
+            try:
+                self.poll()
+            except Exception:
+                traceback.print_exc()
+
+            gevent.sleep(self.interval)
+
+    def get(self, _id: str) -> Optional[Decimal]:
+        """Spot price of `_id`, `None` if there is no recent one."""
+        if time.time() - self.updated > MAX_AGE:
+            return None
+
+        return self.prices.get(_id)
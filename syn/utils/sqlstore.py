@@ -0,0 +1,468 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+          Copyright Blaze 2021.
+ Distributed under the Boost Software License, Version 1.0.
+    (See accompanying file LICENSE_1_0.txt or copy at
+          https://www.boost.org/LICENSE_1_0.txt)
+"""
+
+from typing import Any, Callable, Dict, Generator, List, Optional, Tuple
+from datetime import date as Date
+from decimal import Decimal
+import sqlite3
+import re
+import os
+
+from gevent.threadpool import ThreadPool
+from gevent.monkey import get_original
+
+from syn.utils.data import AGGREGATE_STORAGE, LOGS_REDIS_URL, SQLITE_PATH
+from syn.utils.storage import from_fixed
+
+# Amounts keep all of their 18 decimals, which do not fit a 64-bit integer,
+# so every amount is split in a `_hi` column of whole tokens and a `_lo`
+# column of the remaining 10**-18ths. Sums stay exact, see `_sum`.
+LIMB = 10**18
+# `_lo` is summed in halves of this size so the sums cannot overflow.
+_HALF = 10**9
+# Bumped whenever the layout changes, older dbs have to be re-indexed.
+SCHEMA_VERSION = 2
+# Threads per process running the queries, sqlite would block the whole
+# gevent loop otherwise.
+THREADS = 4
+
+# Identifies the native thread, not the greenlet, a query runs in.
+_get_ident = get_original('_thread', 'get_ident')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS bridge (
+    chain TEXT NOT NULL,
+    date TEXT NOT NULL,
+    token TEXT NOT NULL,
+    direction TEXT NOT NULL,
+    -- Chain id the tx bridges to, -1 for `IN` txs.
+    dest_chain INTEGER NOT NULL,
+    tx_count INTEGER NOT NULL,
+    amount_hi INTEGER NOT NULL,
+    amount_lo INTEGER NOT NULL,
+    fees_hi INTEGER NOT NULL,
+    fees_lo INTEGER NOT NULL,
+    airdrops_hi INTEGER NOT NULL,
+    airdrops_lo INTEGER NOT NULL,
+    gas_paid_hi INTEGER NOT NULL,
+    gas_paid_lo INTEGER NOT NULL,
+    gas_price_hi INTEGER NOT NULL,
+    gas_price_lo INTEGER NOT NULL,
+    PRIMARY KEY (chain, date, token, direction, dest_chain)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS bridge_direction ON bridge (direction, date);
+CREATE INDEX IF NOT EXISTS bridge_token ON bridge (chain, token, date);
+
+CREATE TABLE IF NOT EXISTS pool (
+    chain TEXT NOT NULL,
+    date TEXT NOT NULL,
+    pool TEXT NOT NULL,
+    tx_type TEXT NOT NULL,
+    tx_count INTEGER NOT NULL,
+    volume_hi INTEGER NOT NULL,
+    volume_lo INTEGER NOT NULL,
+    lp_fees_hi INTEGER NOT NULL,
+    lp_fees_lo INTEGER NOT NULL,
+    admin_fees_hi INTEGER NOT NULL,
+    admin_fees_lo INTEGER NOT NULL,
+    PRIMARY KEY (chain, pool, tx_type, date)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS pool_fees (
+    chain TEXT NOT NULL,
+    pool TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    date TEXT NOT NULL,
+    fee INTEGER NOT NULL,
+    PRIMARY KEY (chain, pool, kind, date)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS date2block (
+    chain TEXT NOT NULL,
+    date TEXT NOT NULL,
+    block INTEGER NOT NULL,
+    timestamp INTEGER NOT NULL,
+    PRIMARY KEY (chain, date)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS checkpoints (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+# Fixed-point columns of every table, in order.
+_FIXED = {
+    'bridge': ['amount', 'fees', 'airdrops', 'gas_paid', 'gas_price'],
+    'pool': ['volume', 'lp_fees', 'admin_fees'],
+}
+
+
+def _add(column: str) -> str:
+    # Carry whatever overflows `_lo` into `_hi`, so `_lo` stays < `LIMB`.
+    # Both right hand sides see the row before the update.
+    lo = f'{column}_lo + excluded.{column}_lo'
+    return (f'{column}_lo = ({lo}) % {LIMB}, '
+            f'{column}_hi = {column}_hi + excluded.{column}_hi '
+            f'+ ({lo}) / {LIMB}')
+
+
+_UPSERT_BRIDGE = f"""
+INSERT INTO bridge VALUES ({', '.join('?' * 16)})
+ON CONFLICT (chain, date, token, direction, dest_chain) DO UPDATE SET
+    tx_count = tx_count + excluded.tx_count,
+    {', '.join(_add(x) for x in _FIXED['bridge'])}
+"""
+_UPSERT_POOL = f"""
+INSERT INTO pool VALUES ({', '.join('?' * 11)})
+ON CONFLICT (chain, pool, tx_type, date) DO UPDATE SET
+    tx_count = tx_count + excluded.tx_count,
+    {', '.join(_add(x) for x in _FIXED['pool'])}
+"""
+_UPSERT_POOL_FEE = """
+INSERT INTO pool_fees VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (chain, pool, kind, date) DO UPDATE SET fee = excluded.fee
+"""
+_UPSERT_DATE2BLOCK = """
+INSERT INTO date2block VALUES (?, ?, ?, ?)
+ON CONFLICT (chain, date) DO UPDATE SET
+    block = excluded.block,
+    timestamp = excluded.timestamp
+WHERE excluded.block < block
+"""
+_UPSERT_CHECKPOINT = """
+INSERT INTO checkpoints VALUES (?, ?)
+ON CONFLICT (key) DO UPDATE SET value = excluded.value
+"""
+
+# `{chain}:pool:{pool}:new{kind}fees` hashes set by the pool callback.
+_POOL_FEES = re.compile(r'^(\w+):pool:(\w+):new(admin|swap)fees$')
+
+# Series of every table, as matched by :func:`iter_aggregates` globs.
+_SERIES = {
+    'bridge': "token || ':' || direction || "
+    "CASE WHEN dest_chain < 0 THEN '' ELSE ':' || dest_chain END",
+    'pool': "pool || ':' || tx_type",
+}
+# Columns :func:`SQLiteStore.group_sum` takes, named like the snapshot's.
+_COLUMNS = {'day': 'date', 'dest': 'dest_chain'}
+
+
+def _split(value: int) -> Tuple[int, int]:
+    # The indexer's amounts are fixed-point ints, see `to_fixed`.
+    return divmod(value, LIMB)
+
+
+def _decimal(hi: int, lo: int) -> Decimal:
+    return from_fixed(hi * LIMB + lo)
+
+
+def _sum(column: str) -> str:
+    # Summing `_lo` as is overflows after 10 rows, its halves do not.
+    return (f'SUM({column}_hi), SUM({column}_lo / {_HALF}), '
+            f'SUM({column}_lo % {_HALF})')
+
+
+class SQLiteStore:
+    """
+    Daily aggregates, pool fee history, date2block and checkpoints in a
+    local sqlite db rather than `LOGS_REDIS_URL`.
+
+    The db is in WAL mode, so every worker can read while the indexer writes.
+    Checkpoints are committed with the aggregates and mirrored to redis where
+    the indexer reads them from, see :func:`sync_checkpoints`.
+
+    Queries run in a pool of :data:`THREADS` threads, each with its own
+    connection, so other greenlets keep going meanwhile.
+    """
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._conns: Dict[int, sqlite3.Connection] = {}
+        self._pool: Optional[ThreadPool] = None
+        self._pid = 0
+
+    def _run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        # Neither threads nor connections survive a fork.
+        if self._pool is None or self._pid != os.getpid():
+            self._pool = ThreadPool(THREADS)
+            self._conns = {}
+            self._pid = os.getpid()
+
+        return self._pool.apply(fn, args)
+
+    def _fetchall(self, sql: str, args: Any = ()) -> List[Tuple[Any, ...]]:
+        return self.conn.execute(sql, args).fetchall()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """Connection of the current thread, only use it in :func:`_run`."""
+        if (conn := self._conns.get(_get_ident())) is None:
+            conn = sqlite3.connect(self.path,
+                                   timeout=30,
+                                   isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            tables = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'bridge'").fetchone()
+            if tables is not None and version != SCHEMA_VERSION:
+                raise RuntimeError(f'{self.path} predates schema '
+                                   f'{SCHEMA_VERSION}, re-index into a new '
+                                   'SQLITE_PATH')
+
+            conn.executescript(_SCHEMA)
+            conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+            self._conns[_get_ident()] = conn
+
+        return conn
+
+    def commit(self, pending: Dict[str, Tuple[Any, Any]],
+               hashes: Dict[str, Dict[str, Any]],
+               checkpoint: Dict[str, Any]) -> None:
+        """
+        Equivalent of :func:`WindowContext.commit`, `pending` being
+        redis keys and the value to merge into them.
+        """
+        bridge, pool, date2block, fees = [], [], [], []
+
+        for key, (_, value) in pending.items():
+            chain, ns, date, *series = key.split(':')
+
+            if ns == 'bridge':
+                token, direction, *dest = series
+                validator = value.get('validator', {})
+                bridge.append((
+                    chain,
+                    date,
+                    token,
+                    direction,
+                    int(dest[0]) if dest else -1,
+                    value['txCount'],
+                    *_split(value['amount']),
+                    *_split(value.get('fees', 0)),
+                    *_split(value.get('airdrops', 0)),
+                    *_split(validator.get('gas_paid', 0)),
+                    *_split(validator.get('gas_price', 0)),
+                ))
+            elif ns == 'pool':
+                _pool, tx_type = series
+
+                # Fee changes are kept by `pool_fees`.
+                if tx_type != 'new_fee':
+                    pool.append((chain, date, _pool, tx_type,
+                                 value['tx_count'], *_split(value['volume']),
+                                 *_split(value['lp_fees']),
+                                 *_split(value['admin_fees'])))
+            elif ns == 'date2block':
+                date2block.append(
+                    (chain, date, value['block'], value['timestamp']))
+            else:
+                raise RuntimeError(f'no sqlite table for {key}')
+
+        for key, mapping in hashes.items():
+            if (match := _POOL_FEES.match(key)) is None:
+                raise RuntimeError(f'no sqlite table for {key}')
+
+            fees += [(*match.groups(), k, int(v)) for k, v in mapping.items()]
+
+        self._run(self._write, [
+            (_UPSERT_BRIDGE, bridge),
+            (_UPSERT_POOL, pool),
+            (_UPSERT_DATE2BLOCK, date2block),
+            (_UPSERT_POOL_FEE, fees),
+            (_UPSERT_CHECKPOINT, list(checkpoint.items())),
+        ])
+
+        # Redis is mirrored from here, its connections belong to the loop.
+        if checkpoint:
+            LOGS_REDIS_URL.mset(checkpoint)
+
+    def _write(self, statements: List[Tuple[str, List[Any]]]) -> None:
+        conn = self.conn
+        conn.execute('BEGIN IMMEDIATE')
+
+        try:
+            for sql, rows in statements:
+                conn.executemany(sql, rows)
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        conn.execute('COMMIT')
+
+    def sync_checkpoints(self) -> None:
+        """
+        Mirror every checkpoint to redis, in case we died between committing
+        a window and mirroring its checkpoint.
+        """
+        ret = dict(
+            self._run(self._fetchall, 'SELECT key, value FROM checkpoints'))
+
+        if ret:
+            LOGS_REDIS_URL.mset(ret)
+
+    def _where(self, table: str, chain: str, series: str,
+               since: Optional[Date],
+               until: Optional[Date]) -> Tuple[str, List[Any]]:
+        # Same glob syntax as redis, which `GLOB` without wildcards is just
+        # an equality check.
+        where = ['chain GLOB ?', f'({_SERIES[table]}) GLOB ?']
+        args: List[Any] = [chain, series]
+
+        if since is not None:
+            where.append('date >= ?')
+            args.append(str(since))
+        if until is not None:
+            where.append('date <= ?')
+            args.append(str(until))
+
+        return ' AND '.join(where), args
+
+    def iter_aggregates(
+        self,
+        chain: str,
+        ns: str,
+        series: str = '*',
+        since: Optional[Date] = None,
+        until: Optional[Date] = None,
+    ) -> Generator[Tuple[str, Any], None, None]:
+        """
+        Equivalent of :func:`syn.utils.helpers.iter_aggregates`, yielding the
+        redis key and json value every row would have had.
+        """
+        where, args = self._where(ns, chain, series, since, until)
+        # Fetched at once, so the thread is not held while we are iterated.
+        ret = self._run(
+            self._fetchall, f'SELECT chain, date, '
+            f'{"direction" if ns == "bridge" else "NULL"}, tx_count, '
+            f'{", ".join(f"{x}_hi, {x}_lo" for x in _FIXED[ns])}, '
+            f'{_SERIES[ns]} FROM {ns} WHERE {where}', args)
+
+        for row in ret:
+            chain, date, direction, tx_count, *fixed, _series = row
+            amounts = {
+                x: _decimal(*fixed[i * 2:i * 2 + 2])
+                for i, x in enumerate(_FIXED[ns])
+            }
+
+            if ns == 'bridge':
+                value: Dict[str, Any] = {
+                    'amount': amounts['amount'],
+                    'txCount': tx_count,
+                }
+
+                if direction == 'IN':
+                    value['validator'] = {
+                        'gas_paid': amounts['gas_paid'],
+                        'gas_price': amounts['gas_price'],
+                    }
+                    value['fees'] = amounts['fees']
+                    value['airdrops'] = amounts['airdrops']
+            else:
+                value = {**amounts, 'tx_count': tx_count}
+
+            yield f'{chain}:{ns}:{date}:{_series}', value
+
+    def series(self,
+               chain: str,
+               ns: str,
+               series: str = '*') -> List[Tuple[str, str]]:
+        """
+        Equivalent of :func:`syn.utils.storage.get_series`, whose index is
+        only written for redis.
+        """
+        where, args = self._where(ns, chain, series, None, None)
+
+        return self._run(
+            self._fetchall,
+            f'SELECT DISTINCT chain, {_SERIES[ns]} FROM {ns} WHERE {where}',
+            args)
+
+    def group_sum(self,
+                  table: str,
+                  by: List[str],
+                  values: List[str],
+                  since: Optional[Date] = None,
+                  until: Optional[Date] = None,
+                  **filters: Any) -> Dict[Tuple[Any, ...], Dict[str, Any]]:
+        """
+        :func:`syn.utils.snapshot.Snapshot.group_sum` as a `GROUP BY`, so
+        callers do not care which of the two they got.
+        """
+        where, args = ['1'], []
+
+        if since is not None:
+            where.append('date >= ?')
+            args.append(str(since))
+        if until is not None:
+            where.append('date <= ?')
+            args.append(str(until))
+
+        for k, v in filters.items():
+            if v is not None:
+                where.append(f'{_COLUMNS.get(k, k)} = ?')
+                args.append(v)
+
+        _by = [_COLUMNS.get(x, x) for x in by]
+        _values = [_sum(x) if x in _FIXED[table] else f'SUM({x})'
+                   for x in values]
+        ret = self._run(
+            self._fetchall,
+            f'SELECT {", ".join(_by)}, {", ".join(_values)} FROM {table} '
+            f'WHERE {" AND ".join(where)} GROUP BY {", ".join(_by)}', args)
+
+        res = {}
+        for row in ret:
+            sums, i = {}, len(by)
+
+            for x in values:
+                if x in _FIXED[table]:
+                    hi, mid, lo = row[i:i + 3]
+                    sums[x] = from_fixed(hi * LIMB + mid * _HALF + lo)
+                    i += 3
+                else:
+                    sums[x] = row[i]
+                    i += 1
+
+            res[tuple(row[:len(by)])] = sums
+
+        return res
+
+    def date2block(self, chain: str, date: Date) -> Optional[Dict[str, int]]:
+        ret = self._run(
+            self._fetchall, 'SELECT block, timestamp FROM date2block '
+            'WHERE chain = ? AND date = ?', (chain, str(date)))
+
+        return {'block': ret[0][0], 'timestamp': ret[0][1]} if ret else None
+
+    def pool_fees(self, chain: str, pool: str, kind: str) -> Dict[str, int]:
+        """date -> fee of every `kind` ('admin' or 'swap') fee change."""
+        return dict(
+            self._run(
+                self._fetchall, 'SELECT date, fee FROM pool_fees '
+                'WHERE chain = ? AND pool = ? AND kind = ?',
+                (chain, pool, kind)))
+
+
+_store: Optional[SQLiteStore] = None
+
+
+def get_store() -> Optional[SQLiteStore]:
+    """The store if `AGGREGATE_STORAGE` is 'sqlite', `None` otherwise."""
+    global _store
+
+    if AGGREGATE_STORAGE != 'sqlite':
+        return None
+
+    if _store is None:
+        _store = SQLiteStore(SQLITE_PATH)
+
+    return _store
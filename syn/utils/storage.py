@@ -0,0 +1,520 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+          Copyright Blaze 2021.
+ Distributed under the Boost Software License, Version 1.0.
+    (See accompanying file LICENSE_1_0.txt or copy at
+          https://www.boost.org/LICENSE_1_0.txt)
+"""
+
+from typing import Any, Dict, Generator, Iterable, List, Optional, Tuple, \
+    Union
+from datetime import date as Date
+from fnmatch import fnmatchcase
+from decimal import Decimal
+import re
+
+from redis.client import Pipeline
+import simplejson as json
+
+from syn.utils.data import LOGS_REDIS_URL, AGGREGATE_STORAGE
+
+# Fixed-point precision the indexer does its arithmetic in, and decimal
+# fields are stored with in 'hash' and 'compact' storage. Matches the
+# decimals of every token we index.
+FIXED_DECIMALS = 18
+# `10**i`, so scaling a token amount to `FIXED_DECIMALS` is a multiply.
+SCALES = [10**i for i in range(FIXED_DECIMALS + 1)]
+# Flattened fields which are fixed-point amounts, the rest are plain ints.
+FIXED_FIELDS = {
+    'amount',
+    'fees',
+    'airdrops',
+    'validator.gas_paid',
+    'validator.gas_price',
+    'volume',
+    'lp_fees',
+    'admin_fees',
+}
+# `HINCRBY` is limited to signed 64-bit integers which is ~9.2 tokens at
+# 18 decimals, so decimal fields are split in a `:hi` and `:lo` field where
+# the value is `hi * LIMB + lo`. `LIMB` stays below 2**53 so the carry can be
+# done with lua's doubles without losing precision.
+LIMB = 10**15
+
+# Aggregates are `{chain}:{ns}:{date}:{series}` where the series is e.g.
+# `{token}:IN` or `{pool}:swap_base`, these namespaces are indexed by
+# :func:`write_index` so readers never have to glob the whole db:
+#   idx:{ns}:chains           - set of chains.
+#   idx:{chain}:{ns}:series   - set of series.
+#   idx:{chain}:{ns}:dates    - zset of dates, scored by day number.
+#   idx:{chain}:{ns}:{series} - zset of dates, scored by day number.
+INDEXED = ['bridge', 'pool']
+# Bump to have :func:`ensure_index` rebuild the index on the next start.
+INDEX_VERSION = '1'
+_KEY_INDEX_VERSION = 'idx:version'
+_DATE = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+_EPOCH = Date(1970, 1, 1)
+
+# KEYS[1]: aggregate, ARGV: (field, op, value, lo) where op is either 'i'
+# (HINCRBY), 's' (HSET) or 'f' (HINCRBY of `:hi` by value and `:lo` by lo).
+_UPDATE_SCRIPT = LOGS_REDIS_URL.register_script("""
+for i = 1, #ARGV, 4 do
+    local field, op = ARGV[i], ARGV[i + 1]
+
+    if op == 'i' then
+        redis.call('HINCRBY', KEYS[1], field, ARGV[i + 2])
+    elseif op == 's' then
+        redis.call('HSET', KEYS[1], field, ARGV[i + 2])
+    else
+        redis.call('HINCRBY', KEYS[1], field .. ':hi', ARGV[i + 2])
+        local lo = redis.call('HINCRBY', KEYS[1], field .. ':lo', ARGV[i + 3])
+
+        if lo >= %d then
+            redis.call('HINCRBY', KEYS[1], field .. ':lo', -%d)
+            redis.call('HINCRBY', KEYS[1], field .. ':hi', 1)
+        end
+    end
+end
+""" % (LIMB, LIMB))
+
+# KEYS[1]: aggregate, ARGV: block, timestamp.
+_MIN_BLOCK_SCRIPT = LOGS_REDIS_URL.register_script("""
+local block = redis.call('HGET', KEYS[1], 'block')
+
+if not block or tonumber(ARGV[1]) < tonumber(block) then
+    redis.call('HSET', KEYS[1], 'block', ARGV[1], 'timestamp', ARGV[2])
+end
+""")
+
+
+def to_fixed(amount: int, decimals: int) -> int:
+    """Raw `amount` of a token with `decimals` as a fixed-point integer."""
+    if decimals <= FIXED_DECIMALS:
+        return amount * SCALES[FIXED_DECIMALS - decimals]
+
+    return amount // 10**(decimals - FIXED_DECIMALS)
+
+
+def decimal_to_fixed(num: Union[int, Decimal]) -> int:
+    return int(Decimal(num).scaleb(FIXED_DECIMALS).to_integral_value())
+
+
+def from_fixed(num: int) -> Decimal:
+    return Decimal(num).scaleb(-FIXED_DECIMALS)
+
+
+def _convert(value: Dict[str, Any], fn: Any, prefix: str) -> Dict[str, Any]:
+    res: Dict[str, Any] = {}
+
+    for k, v in value.items():
+        if isinstance(v, dict):
+            res[k] = _convert(v, fn, f'{prefix}{k}.')
+        elif prefix + k in FIXED_FIELDS:
+            res[k] = fn(v)
+        else:
+            res[k] = v
+
+    return res
+
+
+def fixed_value(value: Dict[str, Any]) -> Dict[str, Any]:
+    """Json `value` of an aggregate with its amounts as fixed-point ints."""
+    return _convert(value, decimal_to_fixed, '')
+
+
+def decimal_value(value: Dict[str, Any]) -> Dict[str, Any]:
+    """Inverse of :func:`fixed_value`."""
+    return _convert(value, from_fixed, '')
+
+
+def merge_sum(ret: Optional[Dict[str, Any]],
+              value: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Sum every numeric field of `value` into `ret`, recursing into nested
+    dicts. `newfee_*` fields are settings rather than counters and replace
+    the previous value.
+    """
+    if ret is None:
+        return value
+
+    for k, v in value.items():
+        if k.startswith('newfee_'):
+            ret[k] = v
+        elif k not in ret:
+            # e.g. an `IN` tx without validator stats, should never happen.
+            raise RuntimeError(f'mismatched aggregate field {k!r}: {ret}')
+        elif isinstance(v, dict):
+            merge_sum(ret[k], v)
+        else:
+            ret[k] += v
+
+    return ret
+
+
+def merge_min(ret: Optional[Dict[str, int]],
+              value: Dict[str, int]) -> Dict[str, int]:
+    """Keep whichever value has the lowest `block`."""
+    if ret is None or value['block'] < ret['block']:
+        return value
+
+    return ret
+
+
+def _flatten(value: Dict[str, Any], prefix: str = '') -> Dict[str, int]:
+    res: Dict[str, int] = {}
+
+    for k, v in value.items():
+        if isinstance(v, dict):
+            res.update(_flatten(v, f'{prefix}{k}.'))
+        else:
+            res[prefix + k] = v
+
+    return res
+
+
+def write_hash(pipe: Pipeline, key: str, merge: Any,
+               value: Dict[str, Any]) -> None:
+    """
+    Queue the server side update of the hash aggregate `key` by `value` on
+    `pipe`, `merge` being either :func:`merge_sum` or :func:`merge_min`.
+    Amounts of `value` are fixed-point ints, see :func:`fixed_value`.
+    """
+    if merge is merge_min:
+        _MIN_BLOCK_SCRIPT(keys=[key],
+                          args=[value['block'], value['timestamp']],
+                          client=pipe)
+        return
+
+    assert merge is merge_sum, f'no hash equivalent of {merge}'
+    args: list = []
+
+    for field, v in _flatten(value).items():
+        if field.startswith('newfee_'):
+            args += [field, 's', v, '']
+        elif field in FIXED_FIELDS:
+            args += [field, 'f', *divmod(v, LIMB)]
+        else:
+            args += [field, 'i', v, '']
+
+    _UPDATE_SCRIPT(keys=[key], args=args, client=pipe)
+
+
+def decode_hash(data: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Inverse of :func:`write_hash`, turns `HGETALL` of an aggregate back into
+    what its json equivalent would have been.
+    """
+    res: Dict[str, Any] = {}
+    fixed: Dict[str, int] = {}
+
+    for field, v in data.items():
+        if field.endswith(':hi'):
+            field = field[:-3]
+            fixed[field] = fixed.get(field, 0) + int(v) * LIMB
+        elif field.endswith(':lo'):
+            field = field[:-3]
+            fixed[field] = fixed.get(field, 0) + int(v)
+        else:
+            _set_nested(res, field, int(v))
+
+    for field, v in fixed.items():
+        _set_nested(res, field, from_fixed(v))
+
+    return res
+
+
+def _set_nested(res: Dict[str, Any], field: str, value: Any) -> None:
+    *path, last = field.split('.')
+
+    for x in path:
+        res = res.setdefault(x, {})
+
+    res[last] = value
+
+
+def _day(date: str) -> int:
+    return (Date.fromisoformat(date) - _EPOCH).days
+
+
+def split_aggregate(key: str) -> Optional[Tuple[str, str, str, str]]:
+    """(chain, ns, date, series) of `key`, `None` if it is no aggregate."""
+    parts = key.split(':', 3)
+
+    if len(parts) < 4 or parts[1] not in INDEXED \
+            or not _DATE.match(parts[2]):
+        return None
+
+    return parts[0], parts[1], parts[2], parts[3]
+
+
+def write_index(pipe: Pipeline, key: str) -> None:
+    """Queue adding `key` to the index on `pipe`, if it is an aggregate."""
+    if (parts := split_aggregate(key)) is None:
+        return
+
+    chain, ns, date, series = parts
+    day = _day(date)
+
+    pipe.sadd(f'idx:{ns}:chains', chain)
+    pipe.sadd(f'idx:{chain}:{ns}:series', series)
+    pipe.zadd(f'idx:{chain}:{ns}:dates', {date: day})
+    pipe.zadd(f'idx:{chain}:{ns}:{series}', {date: day})
+
+
+def is_indexed() -> bool:
+    return LOGS_REDIS_URL.get(_KEY_INDEX_VERSION) == INDEX_VERSION
+
+
+def ensure_index() -> None:
+    """Index every aggregate written before the index existed."""
+    if is_indexed():
+        return
+
+    pipe = LOGS_REDIS_URL.pipeline(transaction=False)
+    count = 0
+
+    for ns in INDEXED:
+        for key in LOGS_REDIS_URL.scan_iter(match=f'*:{ns}:*', count=1000):
+            if AGGREGATE_STORAGE == 'compact' and is_day(key):
+                for series in compact_series(key):
+                    write_index(pipe, f'{key}:{series}')
+                    count += 1
+            else:
+                write_index(pipe, key)
+                count += 1
+
+            if len(pipe) >= 1000:
+                pipe.execute()
+
+    pipe.set(_KEY_INDEX_VERSION, INDEX_VERSION)
+    pipe.execute()
+
+    print(f'indexed {count} aggregates')
+
+
+def get_series(chain: str,
+               ns: str,
+               series: str = '*') -> List[Tuple[str, str]]:
+    """
+    (chain, series) of every series in `ns` matching the `chain` and
+    `series` globs, e.g. the tokens bridged out of a chain are
+    `get_series(chain, 'bridge', '*:OUT:*')`.
+    """
+    assert ns in INDEXED, f'{ns} is not indexed'
+
+    chains = LOGS_REDIS_URL.smembers(f'idx:{ns}:chains')
+    chains = [x for x in chains if fnmatchcase(x, chain)]
+
+    pipe = LOGS_REDIS_URL.pipeline(transaction=False)
+    for x in chains:
+        pipe.smembers(f'idx:{x}:{ns}:series')
+
+    return [(x, y) for x, ret in zip(chains, pipe.execute()) for y in ret
+            if fnmatchcase(y, series)]
+
+
+def get_aggregate_keys(chain: str,
+                       ns: str,
+                       series: str = '*',
+                       since: Optional[Date] = None,
+                       until: Optional[Date] = None) -> List[str]:
+    """
+    Keys of every aggregate in `ns` matching the `chain` and `series` globs
+    with a date within [`since`, `until`].
+    """
+    _min = (since - _EPOCH).days if since is not None else '-inf'
+    _max = (until - _EPOCH).days if until is not None else '+inf'
+    _series = get_series(chain, ns, series)
+
+    pipe = LOGS_REDIS_URL.pipeline(transaction=False)
+    for x, y in _series:
+        pipe.zrangebyscore(f'idx:{x}:{ns}:{y}', _min, _max)
+
+    return [
+        f'{x}:{ns}:{date}:{y}'
+        for (x, y), dates in zip(_series, pipe.execute()) for date in dates
+    ]
+
+
+# The 'compact' layout keeps every aggregate of a chain's day in a single
+# `{chain}:{ns}:{date}` hash, with a `{series}:{field}` field per value.
+# Amounts are stored as fixed-point integers, which python sums without the
+# range issues of `HINCRBY`. To stay in redis' compact ziplist
+# encoding `hash-max-ziplist-entries` has to be raised above the amount of
+# fields of a busy day (~1024).
+COMPACT_FIELDS = {
+    'amount': 'a',
+    'txCount': 'c',
+    'fees': 'f',
+    'airdrops': 'd',
+    'validator.gas_paid': 'gp',
+    'validator.gas_price': 'gg',
+    'volume': 'v',
+    'lp_fees': 'l',
+    'admin_fees': 'm',
+    'tx_count': 't',
+    'newfee_admin': 'na',
+    'newfee_swap': 'ns',
+}
+# Fields which are counters or settings rather than decimals.
+_COMPACT_INTS = {'c', 't', 'na', 'ns'}
+_COMPACT_NAMES = {v: k for k, v in COMPACT_FIELDS.items()}
+_KEY_LAYOUT = 'storage:layout'
+
+
+def _compact_series(fields: Iterable[str]) -> List[str]:
+    return list(dict.fromkeys(x.rsplit(':', 1)[0] for x in fields))
+
+
+def is_day(key: str) -> bool:
+    """Whether `key` is a `{chain}:{ns}:{date}` hash."""
+    parts = key.split(':')
+    return len(parts) == 3 and parts[1] in INDEXED \
+        and bool(_DATE.match(parts[2]))
+
+
+def compact_series(day: str) -> List[str]:
+    """Series stored in the `{chain}:{ns}:{date}` hash `day`."""
+    return _compact_series(LOGS_REDIS_URL.hkeys(day))
+
+
+def compact_key(key: str) -> Tuple[str, str]:
+    """(hash, series) of the aggregate `key` in the 'compact' layout."""
+    parts = split_aggregate(key)
+    assert parts is not None, f'{key} is no aggregate'
+
+    chain, ns, date, series = parts
+    return f'{chain}:{ns}:{date}', series
+
+
+def encode_compact(series: str, value: Dict[str, Any]) -> Dict[str, str]:
+    """Hash fields of `value` of `series`, see :func:`fixed_value`."""
+    return {
+        f'{series}:{COMPACT_FIELDS[field]}': str(v)
+        for field, v in _flatten(value).items()
+    }
+
+
+def compact_fields(series: str, value: Dict[str, Any]) -> List[str]:
+    """Hash fields :func:`encode_compact` would write for `value`."""
+    return [f'{series}:{COMPACT_FIELDS[x]}' for x in _flatten(value)]
+
+
+def decode_compact(data: Dict[str, Optional[str]],
+                   fixed: bool = False) -> Dict[str, Any]:
+    """
+    Inverse of :func:`encode_compact`, series -> json value. Amounts are
+    `Decimal`s unless `fixed`.
+    """
+    res: Dict[str, Any] = {}
+
+    for field, v in data.items():
+        if v is None:
+            continue
+
+        series, short = field.rsplit(':', 1)
+        value: Any = int(v)
+
+        if short not in _COMPACT_INTS and not fixed:
+            value = from_fixed(value)
+
+        _set_nested(res.setdefault(series, {}), _COMPACT_NAMES[short], value)
+
+    return res
+
+
+def iter_compact(
+    keys: Iterable[str],
+    batch_size: int = 100,
+) -> Generator[Tuple[str, Any], None, None]:
+    """
+    Stream (key, value) of the aggregates `keys` from the 'compact' layout,
+    every hash is only fetched once however many of its series are wanted.
+    """
+    days: Dict[str, List[str]] = {}
+
+    def _fetch() -> Generator[Tuple[str, Any], None, None]:
+        pipe = LOGS_REDIS_URL.pipeline(transaction=False)
+        for day in days:
+            pipe.hgetall(day)
+
+        for (day, series), data in zip(days.items(), pipe.execute()):
+            data = decode_compact(data)
+
+            for x in series:
+                if x in data:
+                    yield f'{day}:{x}', data[x]
+
+    for key in keys:
+        day, series = compact_key(key)
+        days.setdefault(day, []).append(series)
+
+        if len(days) >= batch_size:
+            yield from _fetch()
+            days = {}
+
+    if days:
+        yield from _fetch()
+
+
+def migrate_compact(batch_size: int = 500) -> None:
+    """
+    Move every 'json' or 'hash' aggregate to the 'compact' layout, safe to
+    interrupt and rerun. Aggregate keys are unchanged, so the index stays
+    valid.
+    """
+    if LOGS_REDIS_URL.get(_KEY_LAYOUT) == 'compact':
+        return
+
+    count = 0
+
+    def _migrate(keys: List[str]) -> None:
+        pipe = LOGS_REDIS_URL.pipeline(transaction=False)
+        for key in keys:
+            pipe.type(key)
+
+        types = pipe.execute()
+        for key, _type in zip(keys, types):
+            if _type == 'hash':
+                pipe.hgetall(key)
+            else:
+                pipe.get(key)
+
+        values = pipe.execute()
+        pipe = LOGS_REDIS_URL.pipeline(transaction=True)
+
+        for key, _type, data in zip(keys, types, values):
+            if not data:
+                continue
+
+            if _type == 'hash':
+                value = decode_hash(data)
+            else:
+                value = json.loads(data, use_decimal=True)
+
+            day, series = compact_key(key)
+            pipe.hset(day, mapping=encode_compact(series, fixed_value(value)))
+            pipe.delete(key)
+
+        pipe.execute()
+
+    for ns in INDEXED:
+        keys: List[str] = []
+
+        for key in LOGS_REDIS_URL.scan_iter(match=f'*:{ns}:*', count=1000):
+            if split_aggregate(key) is None:
+                continue
+
+            keys.append(key)
+            count += 1
+
+            if len(keys) >= batch_size:
+                _migrate(keys)
+                keys = []
+
+        if keys:
+            _migrate(keys)
+
+    LOGS_REDIS_URL.set(_KEY_LAYOUT, 'compact')
+    print(f'migrated {count} aggregates to the compact layout')
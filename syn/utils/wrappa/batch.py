@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+          Copyright Blaze 2021.
+ Distributed under the Boost Software License, Version 1.0.
+    (See accompanying file LICENSE_1_0.txt or copy at
+          https://www.boost.org/LICENSE_1_0.txt)
+"""
+
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, \
+    cast
+import traceback
+
+from web3._utils.method_formatters import (receipt_formatter,
+                                           transaction_result_formatter)
+from web3.types import LogReceipt, TxData, TxReceipt, _Hash32
+from web3._utils.request import make_post_request
+from web3.datastructures import AttributeDict
+from web3 import Web3, HTTPProvider
+from redis.client import Pipeline
+import simplejson as json
+
+from syn.utils.helpers import TxContext, convert, hex_to_int
+from syn.utils.wrappa.provider import MultiHTTPProvider
+from syn.utils.cache import BLOCK_TIMESTAMPS
+from syn.utils.data import SYN_DATA, LOGS_REDIS_URL, AGGREGATE_STORAGE, \
+    RPC_BATCH_ITEM_COST
+from syn.utils.storage import write_hash, write_index, split_aggregate, \
+    compact_key, compact_fields, encode_compact, decode_compact, \
+    fixed_value, decimal_value
+from syn.utils.sqlstore import get_store
+
+#: Merge two json values of the same key, where the first one is `None` if
+#: the key does not exist yet.
+Merge = Callable[[Optional[Any], Any], Any]
+
+# Public nodes cap the amount of calls in a single batch, 100 seems to be
+# the lowest common denominator.
+BATCH_SIZE = 100
+
+
+def batch_request(w3: Web3,
+                  calls: List[Tuple[str, List[Any]]],
+                  batch_size: int = BATCH_SIZE) -> List[Optional[Any]]:
+    """
+    Send `calls` as JSON-RPC batch requests of `batch_size` calls each.
+
+    Args:
+        w3 (Web3): web3 instance of the chain, must use a `HTTPProvider`.
+        calls (List[Tuple[str, List[Any]]]): list of (method, params).
+        batch_size (int, optional): max calls per request.
+
+    Returns:
+        List[Optional[Any]]: raw results in the same order as `calls`, with
+            `None` for calls which errored or were not returned by the node.
+    """
+    provider = cast(HTTPProvider, w3.provider)
+    results: List[Optional[Any]] = [None] * len(calls)
+
+    for i in range(0, len(calls), batch_size):
+        payload = [{
+            'jsonrpc': '2.0',
+            'method': method,
+            'params': params,
+            'id': i + x,
+        } for x, (method, params) in enumerate(calls[i:i + batch_size])]
+
+        data = json.dumps(payload).encode()
+
+        try:
+            if isinstance(provider, MultiHTTPProvider):
+                ret = json.loads(
+                    provider.post(data, len(payload) * RPC_BATCH_ITEM_COST))
+            else:
+                ret = json.loads(
+                    make_post_request(provider.endpoint_uri, data,
+                                      **provider.get_request_kwargs()))
+        except Exception:
+            # Leave these as `None`, callers fall back to single requests.
+            traceback.print_exc()
+            continue
+
+        # Nodes which do not support batching reply with a single error.
+        if not isinstance(ret, list):
+            print(f'batch request rejected by {provider}: {ret}')
+            continue
+
+        for res in ret:
+            if res.get('result') is not None:
+                results[res['id']] = res['result']
+
+    return results
+
+
+class WindowContext:
+    """
+    Blocks, transactions and receipts prefetched for a single `eth_getLogs`
+    window, anything which was not prefetched is fetched on demand.
+
+    Callbacks also buffer their writes here, which are then committed to
+    `LOGS_REDIS_URL` in one transaction by :func:`commit`.
+    """
+    def __init__(self, chain: str) -> None:
+        self.chain = chain
+        self.w3: Web3 = SYN_DATA[chain]['w3']
+        self.timestamps: Dict[int, int] = {}
+        self.txs: Dict[str, TxData] = {}
+        self.receipts: Dict[str, TxReceipt] = {}
+        self.pending: Dict[str, Tuple[Merge, Any]] = {}
+        self.hashes: Dict[str, Dict[str, Any]] = {}
+        # Anything callbacks decoded from a log during prefetching, keyed by
+        # its tx hash and log index so it is not decoded twice.
+        self.parsed: Dict[Tuple[str, int], Any] = {}
+
+    def update(self, key: str, value: Any, merge: Merge) -> None:
+        """
+        Merge `value` into the json value of `key`, `merge` has to be
+        associative as it is used both in memory and against redis.
+        Amounts are fixed-point ints, see :func:`fixed_value`, which are only
+        turned into `Decimal`s if the storage needs them.
+        """
+        if key in self.pending:
+            value = merge(self.pending[key][1], value)
+
+        self.pending[key] = (merge, value)
+
+    def hset(self, key: str, field: str, value: Any) -> None:
+        self.hashes.setdefault(key, {})[field] = value
+
+    def commit(self, checkpoint: Dict[str, Any]) -> None:
+        """
+        Write every buffered update, its index entries and `checkpoint` in a
+        single MULTI/EXEC, which is retried if another indexer touched the
+        same keys meanwhile.
+        With 'hash' storage updates are applied server side instead, so
+        nothing has to be read or watched. With 'compact' storage aggregates
+        are merged into their day's hash, and with 'sqlite' storage
+        everything goes to :class:`SQLiteStore` instead.
+        """
+        if (store := get_store()) is not None:
+            store.commit(self.pending, self.hashes, checkpoint)
+            self.pending.clear()
+            self.hashes.clear()
+            return
+
+        if AGGREGATE_STORAGE == 'hash':
+            pipe = LOGS_REDIS_URL.pipeline(transaction=True)
+
+            for key, (merge, value) in self.pending.items():
+                write_hash(pipe, key, merge, value)
+                write_index(pipe, key)
+
+            for key, mapping in self.hashes.items():
+                pipe.hset(key, mapping=mapping)
+
+            for key, value in checkpoint.items():
+                pipe.set(key, value)
+
+            pipe.execute()
+            self.pending.clear()
+            self.hashes.clear()
+            return
+
+        keys: List[str] = []
+        # Day hash -> (key, series) of its aggregates, with 'compact' storage.
+        days: Dict[str, List[Tuple[str, str]]] = {}
+
+        for key in self.pending:
+            if AGGREGATE_STORAGE == 'compact' \
+                    and split_aggregate(key) is not None:
+                day, series = compact_key(key)
+                days.setdefault(day, []).append((key, series))
+            else:
+                keys.append(key)
+
+        def _transaction(pipe: Pipeline) -> None:
+            ret = pipe.mget(keys) if keys else []
+            current: Dict[str, Dict[str, Any]] = {}
+
+            for day, x in days.items():
+                fields = [
+                    y for key, series in x
+                    for y in compact_fields(series, self.pending[key][1])
+                ]
+                current[day] = decode_compact(
+                    dict(zip(fields, pipe.hmget(day, fields))), fixed=True)
+
+            pipe.multi()
+
+            for day, x in days.items():
+                mapping: Dict[str, str] = {}
+
+                for key, series in x:
+                    merge, value = self.pending[key]
+                    value = merge(current[day].get(series), value)
+                    mapping.update(encode_compact(series, value))
+                    write_index(pipe, key)
+
+                pipe.hset(day, mapping=mapping)
+
+            for key, data in zip(keys, ret):
+                merge, value = self.pending[key]
+
+                if data is not None:
+                    data = fixed_value(json.loads(data, use_decimal=True))
+
+                pipe.set(key, json.dumps(decimal_value(merge(data, value))))
+                write_index(pipe, key)
+
+            for key, mapping in self.hashes.items():
+                pipe.hset(key, mapping=mapping)
+
+            for key, value in checkpoint.items():
+                pipe.set(key, value)
+
+        LOGS_REDIS_URL.transaction(_transaction, *keys, *days)
+
+        self.pending.clear()
+        self.hashes.clear()
+
+    def get_timestamp(self, block: int) -> int:
+        if block not in self.timestamps:
+            cache = BLOCK_TIMESTAMPS[self.chain]
+
+            if (ret := cache.get(block)) is None:
+                ret = self.w3.eth.get_block(block)['timestamp']  # type: ignore
+                cache.set_many({block: ret})
+
+            self.timestamps[block] = ret
+
+        return self.timestamps[block]
+
+    def get_transaction(self, tx_hash: _Hash32) -> TxData:
+        key = cast(str, convert(tx_hash))
+
+        if key not in self.txs:
+            self.txs[key] = self.w3.eth.get_transaction(tx_hash)
+
+        return self.txs[key]
+
+    def get_receipt(self, tx_hash: _Hash32) -> TxReceipt:
+        key = cast(str, convert(tx_hash))
+
+        if key not in self.receipts:
+            self.receipts[key] = self.w3.eth.wait_for_transaction_receipt(
+                tx_hash, timeout=60)
+
+        return self.receipts[key]
+
+    def tx_context(self, tx_hash: _Hash32) -> TxContext:
+        """Receipt of `tx_hash`, along with its tx if we have it."""
+        key = cast(str, convert(tx_hash))
+        ret: TxContext = {'receipt': self.get_receipt(tx_hash)}
+
+        if key in self.txs:
+            ret['tx'] = self.txs[key]
+
+        return ret
+
+
+def prefetch_window(
+        chain: str,
+        logs: List[LogReceipt],
+        tx_hashes: Iterable[_Hash32] = (),
+        receipt_hashes: Iterable[_Hash32] = ()) -> WindowContext:
+    """
+    Batch fetch the block of every log in `logs`, the transaction of every
+    hash in `tx_hashes` and the receipt of every hash in `receipt_hashes`.
+    """
+    ctx = WindowContext(chain)
+    w3 = ctx.w3
+
+    blocks = sorted({log['blockNumber'] for log in logs})
+    # Only fetch blocks we have not seen before.
+    ctx.timestamps = BLOCK_TIMESTAMPS[chain].get_many(blocks)
+    blocks = [x for x in blocks if x not in ctx.timestamps]
+    hashes = sorted({cast(str, convert(x)) for x in tx_hashes})
+    _hashes = sorted({cast(str, convert(x)) for x in receipt_hashes})
+
+    calls: List[Tuple[str, List[Any]]] = []
+    calls += [('eth_getBlockByNumber', [hex(x), False]) for x in blocks]
+    calls += [('eth_getTransactionByHash', [x]) for x in hashes]
+    calls += [('eth_getTransactionReceipt', [x]) for x in _hashes]
+
+    if not calls:
+        return ctx
+
+    ret = batch_request(w3, calls)
+    _blocks, ret = ret[:len(blocks)], ret[len(blocks):]
+    _txs, _receipts = ret[:len(hashes)], ret[len(hashes):]
+
+    timestamps: Dict[int, int] = {}
+    for block, data in zip(blocks, _blocks):
+        if data is not None:
+            timestamps[block] = hex_to_int(data['timestamp'])
+
+    BLOCK_TIMESTAMPS[chain].set_many(timestamps)
+    ctx.timestamps.update(timestamps)
+
+    for tx_hash, data in zip(hashes, _txs):
+        if data is not None:
+            ctx.txs[tx_hash] = AttributeDict.recursive(
+                transaction_result_formatter(data))  # type: ignore
+
+    for tx_hash, data in zip(_hashes, _receipts):
+        if data is not None:
+            ctx.receipts[tx_hash] = AttributeDict.recursive(
+                receipt_formatter(data))  # type: ignore
+
+    return ctx
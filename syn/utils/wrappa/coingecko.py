@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+          Copyright Blaze 2021.
+ Distributed under the Boost Software License, Version 1.0.
+    (See accompanying file LICENSE_1_0.txt or copy at
+          https://www.boost.org/LICENSE_1_0.txt)
+"""
+
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from datetime import date as Date, datetime, time as Time, timedelta, \
+    timezone
+from urllib.parse import urlparse
+from decimal import Decimal
+import traceback
+
+from gevent.pool import Pool
+import simplejson as json
+import requests
+import gevent
+
+from syn.utils.wrappa.ratelimit import RedisTokenBucket, TokenBucket
+from syn.utils.data import REDIS, MESSAGE_QUEUE_REDIS, COINGECKO_RANGE_URL, \
+    COINGECKO_BASE_URL, COINGECKO_RATE_LIMIT, COINGECKO_BURST
+from syn.utils.pricetable import publish_prices
+
+#: Takes an url and returns its decoded json body, `use_decimal` style.
+Fetch = Callable[[str], Any]
+
+# Ids fetched at once, the rate limit is what actually paces them.
+CONCURRENCY = 8
+# Attempts per id, waiting `BACKOFF * 2**attempt` seconds in between.
+ATTEMPTS = 4
+BACKOFF = 2.0
+
+
+def fetch_json(url: str) -> Any:
+    r = requests.get(url, timeout=30)
+    r.raise_for_status()
+
+    return r.json(use_decimal=True)
+
+
+def _timestamp(date: Date) -> int:
+    return int(datetime.combine(date, Time(), timezone.utc).timestamp())
+
+
+def bucket_daily(points: List[List[Any]]) -> Dict[str, Decimal]:
+    """
+    Price of every UTC day in `points`, a list of [timestamp in ms, price].
+    The first point of a day is used, which is what `/history` returns.
+    """
+    res: Dict[str, Decimal] = {}
+
+    for ts, price in sorted(points, key=lambda x: x[0]):
+        day = datetime.fromtimestamp(ts / 1000, timezone.utc).date()
+        res.setdefault(str(day), price)
+
+    return res
+
+
+class CoingeckoClient:
+    """
+    Fetch price history a whole date range per request and spot prices of
+    many ids per request, `fetch` and the urls can be swapped for a local
+    server serving fixtures.
+    """
+    def __init__(self,
+                 fetch: Fetch = fetch_json,
+                 url: str = COINGECKO_RANGE_URL,
+                 limiter: Optional[TokenBucket] = None,
+                 spot_url: str = COINGECKO_BASE_URL) -> None:
+        self.fetch = fetch
+        self.url = url
+        self.spot_url = spot_url
+        self.limiter = limiter
+
+        # Shared by every worker as the api limits us by ip.
+        if limiter is None and COINGECKO_RATE_LIMIT > 0:
+            self.limiter = RedisTokenBucket(
+                COINGECKO_RATE_LIMIT, max(COINGECKO_BURST, 1),
+                MESSAGE_QUEUE_REDIS, f'ratelimit:{urlparse(url).netloc}')
+
+    def _acquire(self) -> None:
+        if self.limiter is not None:
+            self.limiter.acquire()
+
+    def history(self,
+                _id: str,
+                since: Date,
+                until: Date,
+                currency: str = 'usd') -> Dict[str, Decimal]:
+        """Daily price of `_id` from `since` up to and including `until`."""
+        self._acquire()
+
+        # Ranges under 90 days come in hourly, bucketing takes care of it.
+        ret = self.fetch(
+            self.url.format(_id, currency, _timestamp(since),
+                            _timestamp(until + timedelta(days=1))))
+
+        return {
+            k: v
+            for k, v in bucket_daily(ret['prices']).items()
+            if str(since) <= k <= str(until)
+        }
+
+    def spot(self,
+             ids: List[str],
+             currency: str = 'usd') -> Dict[str, Decimal]:
+        """Current price of every id in `ids` which CoinGecko knows."""
+        self._acquire()
+        ret = self.fetch(self.spot_url.format(','.join(ids), currency))
+
+        return {
+            k: v[currency]
+            for k, v in ret.items() if v.get(currency) is not None
+        }
+
+    def history_retry(self, _id: str, since: Date,
+                      until: Date) -> Dict[str, Decimal]:
+        """:func:`history` retried with exponential backoff."""
+        for attempt in range(ATTEMPTS - 1):
+            try:
+                return self.history(_id, since, until)
+            except Exception as e:
+                if not _retryable(e):
+                    raise
+
+            gevent.sleep(BACKOFF * 2**attempt)
+
+        return self.history(_id, since, until)
+
+
+def _retryable(e: Exception) -> bool:
+    if isinstance(e, requests.exceptions.HTTPError) \
+            and e.response is not None:
+        # Unknown ids and the like will not fix themselves.
+        code = e.response.status_code
+        return code == 429 or code >= 500
+
+    return True
+
+
+def ingest_prices(dates: Dict[str, Iterable[Date]],
+                  client: Optional[CoingeckoClient] = None,
+                  overwrite: bool = False) -> List[str]:
+    """
+    Fetch every id in `dates` once, over the range spanning its dates, and
+    write each day as both `{id}:{date}` and `{id}:{date}:usd` in a single
+    pipeline. Existing prices are kept unless `overwrite` is set.
+
+    Ids are fetched concurrently, one failing or backing off does not hold
+    up the others.
+
+    Returns:
+        List[str]: keys written.
+    """
+    client = client or CoingeckoClient()
+    prices: Dict[str, Decimal] = {}
+
+    def _fetch(_id: str, x: List[Date]) -> None:
+        try:
+            ret = client.history_retry(_id, x[0], x[-1])  # type: ignore
+        except Exception:
+            # Other ids still get written, this one is retried later.
+            traceback.print_exc()
+            print(f'failed to fetch prices of {_id}')
+            return
+
+        for date, price in ret.items():
+            prices[f'{_id}:{date}'] = price
+            prices[f'{_id}:{date}:usd'] = price
+
+    pool = Pool(CONCURRENCY)
+    for _id, x in dates.items():
+        if (x := sorted(x)):
+            pool.spawn(_fetch, _id, x)
+    pool.join()
+
+    if not prices:
+        return []
+
+    pipe = REDIS.pipeline(transaction=False)
+    for key, price in prices.items():
+        pipe.set(key, json.dumps(price), nx=not overwrite)
+
+    written = [k for k, ok in zip(prices, pipe.execute()) if ok]
+    publish_prices(written)
+
+    return written
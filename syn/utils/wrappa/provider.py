@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+          Copyright Blaze 2021.
+ Distributed under the Boost Software License, Version 1.0.
+    (See accompanying file LICENSE_1_0.txt or copy at
+          https://www.boost.org/LICENSE_1_0.txt)
+"""
+
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+import threading
+import time
+
+from web3.types import RPCEndpoint, RPCResponse
+from web3._utils.request import make_post_request
+from web3 import HTTPProvider
+from redis import Redis
+import requests
+
+from syn.utils.wrappa.ratelimit import RedisTokenBucket, TokenBucket
+
+# Weight of the latest sample in an endpoint's latency and error EWMA.
+EWMA_ALPHA = 0.2
+# Consecutive failures after which an endpoint is ejected, and for how long.
+FAILURE_THRESHOLD = 3
+COOLDOWN = 30.0
+# Latency an error counts as, so an endpoint which errors a lot ranks below
+# a slow but working one.
+ERROR_PENALTY = 10.0
+
+
+class Endpoint:
+    """Health and rate limit of a single rpc endpoint."""
+    def __init__(self, uri: str, limiter: Optional[TokenBucket]) -> None:
+        self.uri = uri
+        self.host = urlparse(uri).netloc
+        self.limiter = limiter
+        # Start off optimistic so every endpoint gets tried.
+        self.latency = 0.0
+        self.errors = 0.0
+        self.failures = 0
+        self.ejected_until = 0.0
+        self.requests = 0
+
+    @property
+    def score(self) -> float:
+        """Lower is better."""
+        return self.latency + self.errors * ERROR_PENALTY
+
+    def available(self, now: float) -> bool:
+        # Past the cool-down the endpoint is given another chance, one more
+        # failure ejects it again.
+        return self.ejected_until <= now
+
+    def success(self, elapsed: float) -> None:
+        self.requests += 1
+        self.latency += EWMA_ALPHA * (elapsed - self.latency)
+        self.errors -= EWMA_ALPHA * self.errors
+        self.failures = 0
+
+    def failure(self, elapsed: float) -> None:
+        self.requests += 1
+        self.latency += EWMA_ALPHA * (elapsed - self.latency)
+        self.errors += EWMA_ALPHA * (1 - self.errors)
+        self.failures += 1
+
+        if self.failures >= FAILURE_THRESHOLD:
+            self.ejected_until = time.time() + COOLDOWN
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'latency': round(self.latency, 4),
+            'errors': round(self.errors, 4),
+            'requests': self.requests,
+            'ejected': not self.available(time.time()),
+            'rate_limit': self.limiter.stats() if self.limiter else None,
+        }
+
+
+class MultiHTTPProvider(HTTPProvider):
+    """
+    `HTTPProvider` over several endpoints of the same chain, every request
+    goes to the healthiest endpoint and fails over to the next ones.
+
+    Requests still go through :func:`web3._utils.request.make_post_request`
+    so every endpoint gets its own session from the patched session cache.
+
+    With a `rate_limit` (requests per second) every endpoint gets its own
+    token bucket, which is shared by every worker when `client` is set.
+    """
+    def __init__(self,
+                 endpoint_uris: List[str],
+                 rate_limit: float = 0,
+                 burst: int = 0,
+                 client: Optional[Redis] = None,
+                 **kwargs: Any) -> None:
+        assert endpoint_uris, 'need at least one endpoint'
+        super().__init__(endpoint_uris[0], **kwargs)
+
+        self.endpoints = [
+            Endpoint(x, _limiter(x, rate_limit, burst, client))
+            for x in endpoint_uris
+        ]
+        # Greenlet local once gevent patched threading.
+        self._local = threading.local()
+
+    def __str__(self) -> str:
+        return f'RPC connection {[x.uri for x in self.endpoints]}'
+
+    @property
+    def elapsed(self) -> Optional[float]:
+        """
+        Seconds the last successful request of the calling greenlet took,
+        rate limit waits and failed endpoints excluded.
+        """
+        return getattr(self._local, 'elapsed', None)
+
+    def _ranked(self) -> List[Endpoint]:
+        now = time.time()
+        ret = sorted((x for x in self.endpoints if x.available(now)),
+                     key=lambda x: x.score)
+
+        # Everything is ejected, rather try whichever comes back first than
+        # fail outright.
+        return ret or [min(self.endpoints, key=lambda x: x.ejected_until)]
+
+    def post(self, data: bytes, cost: float = 1) -> bytes:
+        """
+        POST `data` to the healthiest endpoint, trying every other available
+        endpoint before giving up. `cost` is how many requests `data` counts
+        as against the rate limit, e.g. the calls of a batch request.
+        """
+        error: Optional[Exception] = None
+
+        for endpoint in self._ranked():
+            if endpoint.limiter is not None:
+                endpoint.limiter.acquire(cost)
+
+            start = time.time()
+
+            try:
+                ret = make_post_request(endpoint.uri, data,
+                                        **self.get_request_kwargs())
+            except requests.exceptions.RequestException as e:
+                endpoint.failure(time.time() - start)
+                print(f'rpc {endpoint.uri} failed: {e}')
+                error = e
+                continue
+
+            self._local.elapsed = time.time() - start
+            endpoint.success(self._local.elapsed)
+            return ret
+
+        raise error  # type: ignore
+
+    def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        request_data = self.encode_rpc_request(method, params)
+        return self.decode_rpc_response(self.post(request_data))
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        # Only the host, api keys tend to live in the path.
+        return {
+            f'{i}:{x.host}': x.stats()
+            for i, x in enumerate(self.endpoints)
+        }
+
+
+def _limiter(uri: str, rate_limit: float, burst: int,
+             client: Optional[Redis]) -> Optional[TokenBucket]:
+    if rate_limit <= 0:
+        return None
+
+    burst = burst or max(int(rate_limit), 1)
+
+    if client is not None:
+        # Keyed by host, as that is what providers rate limit by.
+        key = f'ratelimit:{urlparse(uri).netloc}'
+        return RedisTokenBucket(rate_limit, burst, client, key)
+
+    return TokenBucket(rate_limit, burst)
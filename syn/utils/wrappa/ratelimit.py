@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+          Copyright Blaze 2021.
+ Distributed under the Boost Software License, Version 1.0.
+    (See accompanying file LICENSE_1_0.txt or copy at
+          https://www.boost.org/LICENSE_1_0.txt)
+"""
+
+from typing import Any, Dict
+import time
+
+from redis import Redis
+import gevent
+
+# KEYS[1]: bucket, ARGV: rate, burst, tokens. Takes the tokens and returns how
+# long the caller has to wait for them, tokens going negative is the queue.
+_ACQUIRE_SCRIPT = """
+-- `TIME` needs effects replication, which is the default since redis 5.
+if redis.replicate_commands then redis.replicate_commands() end
+
+local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+
+local data = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(data[1]) or burst
+local ts = tonumber(data[2]) or now
+
+tokens = math.min(burst, tokens + (now - ts) * rate) - cost
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], 60)
+
+if tokens >= 0 then
+    return '0'
+end
+
+return tostring(-tokens / rate)
+"""
+
+
+class TokenBucket:
+    """
+    Allow `rate` requests per second with bursts of up to `burst` requests,
+    callers over the limit wait their turn rather than being rejected.
+    """
+    def __init__(self, rate: float, burst: int) -> None:
+        assert rate > 0 and burst > 0, f'invalid bucket: {rate}/s {burst}'
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.time()
+
+        self.waits = 0
+        self.waited = 0.0
+
+    def _reserve(self, tokens: float) -> float:
+        now = time.time()
+        self.tokens = min(self.burst, self.tokens +
+                          (now - self.updated) * self.rate) - tokens
+        self.updated = now
+
+        return max(-self.tokens / self.rate, 0.0)
+
+    def acquire(self, tokens: float = 1) -> float:
+        """
+        Wait for `tokens` tokens, returns how long that took. Taking more than
+        `burst` at once is fine, the caller just waits longer.
+        """
+        wait = self._reserve(tokens)
+
+        if wait > 0:
+            self.waits += 1
+            self.waited += wait
+            gevent.sleep(wait)
+
+        return wait
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'rate': self.rate,
+            'burst': self.burst,
+            'waits': self.waits,
+            'waited': round(self.waited, 4),
+            'avg_wait': round(self.waited / self.waits, 4)
+            if self.waits else 0,
+        }
+
+
+class RedisTokenBucket(TokenBucket):
+    """:class:`TokenBucket` kept in redis, shared by every worker."""
+    def __init__(self, rate: float, burst: int, client: Redis,
+                 key: str) -> None:
+        super().__init__(rate, burst)
+
+        self.key = key
+        self._script = client.register_script(_ACQUIRE_SCRIPT)
+
+    def _reserve(self, tokens: float) -> float:
+        try:
+            return float(
+                self._script(keys=[self.key],
+                             args=[self.rate, self.burst, tokens]))
+        except Exception as e:
+            # Rather fall back to limiting locally than stall on redis.
+            print(f'shared rate limit {self.key} failed: {e}')
+            return super()._reserve(tokens)
@@ -7,22 +7,28 @@
           https://www.boost.org/LICENSE_1_0.txt)
 """
 
-from typing import Callable, Dict, cast, List, TypeVar, Union
+from typing import Any, Callable, Dict, NamedTuple, Optional, cast, List, \
+    Tuple, TypeVar, Union
 from datetime import datetime
-from pprint import pformat
 import time
 
-from web3.types import FilterParams, LogReceipt, TxData
+from web3.types import FilterParams, LogReceipt
+from gevent.queue import Queue
 from gevent.pool import Pool
 import simplejson as json
 from web3 import Web3
 import gevent
 
-from syn.utils.helpers import (get_gas_stats_for_tx, handle_decimals,
+from syn.utils.helpers import (get_gas_stats_for_tx,
                                get_airdrop_value_for_block, parse_logs_out,
-                               convert, parse_tx_in, update_global_data, retry)
+                               convert, parse_tx_in, update_global_data, retry,
+                               parse_logs_in)
+from syn.utils.wrappa.batch import WindowContext, prefetch_window
+from syn.utils.wrappa.window import WindowController
+from syn.utils.storage import merge_sum, merge_min, to_fixed, \
+    decimal_to_fixed
 from syn.utils.data import SYN_DATA, LOGS_REDIS_URL, TOKEN_DECIMALS
-from syn.utils.explorer.data import TOPICS, Direction
+from syn.utils.explorer.data import TOPICS, TOPIC_TO_EVENT, Direction
 from syn.utils.contract import get_bridge_token_info
 
 _start_blocks = {
@@ -120,18 +126,84 @@ airdrop_ranges = {
     },
 }
 
+# How many fetched `eth_getLogs` windows may wait to be processed, chains
+# with slow nodes benefit from fetching further ahead.
+_queue_depths = {
+    'ethereum': 4,
+    'bsc': 4,
+    'polygon': 4,
+    'avalanche': 4,
+    'harmony': 4,
+}
+
 pool = Pool(size=64)
 MAX_BLOCKS = 5000
+QUEUE_DEPTH = 2
+# Not worth sharding a backfill with less blocks than this per shard.
+MIN_SHARD_BLOCKS = 100_000
 T = TypeVar('T')
 
 
-def bridge_callback(chain: str, address: str, log: LogReceipt,
-                    first_run: bool) -> None:
+def _parse_in(log: LogReceipt) -> Optional[Dict[str, Union[int, str]]]:
+    """
+    Bridged token, amount and fee of an `IN` log, or `None` if the log does
+    not have the bridged amount and it has to be read from the tx input.
+    """
+    args = cast(Dict[str, Union[int, str]], parse_logs_in(log))
+    event = TOPIC_TO_EVENT[cast(str, convert(log['topics'][0]))]
+    received = cast(int, args['amount_received'])
+
+    if event == 'TokenWithdraw':
+        # `SynapseBridge.withdraw` is the only one emitting the amount
+        # before fees.
+        args['amount'] = received
+    elif args.get('swap_success', False):
+        # A successful swap emits the amount of the token swapped to.
+        return None
+    else:
+        # `TokenMint` and failed swaps emit what the user received.
+        args['amount'] = received + cast(int, args['fee'])
+
+    return args
+
+
+def _log_key(log: LogReceipt) -> Tuple[str, int]:
+    return cast(str, convert(log['transactionHash'])), log['logIndex']
+
+
+def bridge_prefetch(chain: str, logs: List[LogReceipt]) -> WindowContext:
+    # Only `IN` txs need their receipt, and their tx input only if the log
+    # itself is not enough. `OUT` txs are fully described by the log.
+    logs_in = [
+        log for log in logs
+        if TOPICS.get(cast(str, convert(log['topics'][0]))) == Direction.IN
+    ]
+
+    parsed = {_log_key(x): _parse_in(x) for x in logs_in}
+    tx_hashes = [
+        x['transactionHash'] for x in logs_in if parsed[_log_key(x)] is None
+    ]
+    receipt_hashes = [x['transactionHash'] for x in logs_in]
+
+    ctx = prefetch_window(chain, logs, tx_hashes, receipt_hashes)
+    ctx.parsed.update(parsed)
+
+    return ctx
+
+
+def bridge_callback(chain: str,
+                    address: str,
+                    log: LogReceipt,
+                    first_run: bool,
+                    ctx: Optional[WindowContext] = None) -> None:
     w3: Web3 = SYN_DATA[chain]['w3']
     tx_hash = log['transactionHash']
 
+    if ctx is None:
+        ctx = WindowContext(chain)
+
     block_n = log['blockNumber']
-    timestamp = w3.eth.get_block(block_n)['timestamp']  # type: ignore
+    timestamp = ctx.get_timestamp(block_n)
     date = datetime.utcfromtimestamp(timestamp).date()
 
     topic = cast(str, convert(log['topics'][0]))
@@ -145,13 +217,19 @@ def bridge_callback(chain: str, address: str, log: LogReceipt,
         # and its amount are stored in the logs data
         args = parse_logs_out(log)
     elif direction == Direction.IN:
-        # For IN transactions the bridged asset
-        # and its amount are stored in the tx.input
-        tx_data: TxData = w3.eth.get_transaction(tx_hash)
+        # For IN transactions the bridged asset and its amount are stored in
+        # the logs data, except for successful swaps where we need tx.input
+        if (key := _log_key(log)) in ctx.parsed:
+            _args = ctx.parsed[key]
+        else:
+            _args = _parse_in(log)
 
-        # All IN transactions are guaranteed to be
-        # from validators to Bridge contract
-        args = parse_tx_in(tx_data)
+        if _args is not None:
+            args = _args
+        else:
+            # All IN transactions are guaranteed to be
+            # from validators to Bridge contract
+            args = parse_tx_in(ctx.get_transaction(tx_hash))
     else:
         raise RuntimeError(f'sanity check? got {direction}')
 
@@ -186,23 +264,26 @@ def bridge_callback(chain: str, address: str, log: LogReceipt,
             update_global_data(chain, asset)
 
     decimals = TOKEN_DECIMALS[chain][asset]
-    # Amount is in nUSD/nETH/SYN/etc
-    value = {'amount': handle_decimals(args['amount'], decimals), 'txCount': 1}
+    # Amount is in nUSD/nETH/SYN/etc, as a fixed-point int.
+    value = {'amount': to_fixed(args['amount'], decimals), 'txCount': 1}
 
     if direction == Direction.IN:
         # All `IN` txs are from the validator;
         # let's track how much gas they pay.
-        receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=60)
-        gas_stats = get_gas_stats_for_tx(chain, w3, tx_hash, receipt)
+        gas_stats = get_gas_stats_for_tx(chain,
+                                         w3,
+                                         tx_hash,
+                                         ctx=ctx.tx_context(tx_hash),
+                                         fixed=True)
         value['validator'] = gas_stats
 
         # Let's also track how much fees the user paid for the bridge tx
-        value['fees'] = handle_decimals(args['fee'], decimals)
+        value['fees'] = to_fixed(args['fee'], decimals)
 
         # All `IN` txs give some airdrop amounts, well on most chains at least.
         if chain in airdrop_ranges:
-            value['airdrops'] = get_airdrop_value_for_block(
-                airdrop_ranges[chain], block_n)
+            value['airdrops'] = decimal_to_fixed(
+                get_airdrop_value_for_block(airdrop_ranges[chain], block_n))
         else:
             raise RuntimeError(f'{chain} is not in `airdrop_ranges`')
 
@@ -211,57 +292,34 @@ def bridge_callback(chain: str, address: str, log: LogReceipt,
 
     key = f'{chain}:bridge:{date}:{asset}:{direction}{_chain}'
 
-    if (ret := LOGS_REDIS_URL.get(key)) is not None:
-        ret = json.loads(ret, use_decimal=True)
-
-        if direction == Direction.IN:
-            if 'validator' not in ret:
-                raise RuntimeError(
-                    f'No validator for key = {key}, ret = {pformat(ret, indent=2)}'
-                )
-            if 'validator' not in value:
-                raise RuntimeError(
-                    f'No validator: chain = {chain}, tx_hash = {convert(tx_hash)}'
-                )
-
-            if chain in airdrop_ranges:
-                ret['airdrops'] += value['airdrops']
+    # Merged with the rest of the window in memory, `get_logs` commits the
+    # whole window at once.
+    ctx.update(key, value, merge_sum)
 
-            ret['validator']['gas_price'] += value['validator']['gas_price']
-            ret['validator']['gas_paid'] += value['validator']['gas_paid']
-            ret['fees'] += value['fees']
+    # NOTE: we push this into the bridge callback rather than it's own
+    # callback to save some rpc calls, why can't they be free? *sigh*.
+    # First bridge tx of the day; store this block so we can later map
+    # date to block, which is a limitation of eth rpc. However this should
+    # not get confused with the FIRST block of the day, rather it is the
+    # first block of the day which contains a bridge event.
+    ctx.update(f'{chain}:date2block:{date}', {
+        'block': block_n,
+        'timestamp': timestamp,
+    }, merge_min)
 
-        ret['amount'] += value['amount']
-        ret['txCount'] += 1
-        # Just in case we ever need that later for debugging
-        # ret['txs'] += ' ' + value['txs']
 
-        LOGS_REDIS_URL.set(key, json.dumps(ret))
-    else:
-        # NOTE: we push this into the bridge callback rather than it's own
-        # callback to save some rpc calls, why can't they be free? *sigh*.
-        # First bridge tx of the day; store this block so we can later map
-        # date to block, which is a limitation of eth rpc. However this should
-        # not get confused with the FIRST block of the day, rather it is the
-        # first block of the day which contains a bridge event.
-        _key = f'{chain}:date2block:{date}'
-        LOGS_REDIS_URL.setnx(
-            _key, json.dumps({
-                'block': block_n,
-                'timestamp': timestamp,
-            }))
-
-        LOGS_REDIS_URL.set(key, json.dumps(value))
-
-    LOGS_REDIS_URL.set(f'{chain}:logs:{address}:MAX_BLOCK_STORED',
-                       log['blockNumber'])
-    LOGS_REDIS_URL.set(f'{chain}:logs:{address}:TX_INDEX',
-                       log['transactionIndex'])
+class LogSource(NamedTuple):
+    """An address indexed by :func:`scan`, with its own checkpoint."""
+    callback: Callable[[str, str, LogReceipt, bool, WindowContext], None]
+    address: str
+    topics: List[str] = list(TOPICS)
+    key_namespace: str = 'logs'
+    start_block: Optional[int] = None
 
 
 def get_logs(
     chain: str,
-    callback: Callable[[str, str, LogReceipt, bool], None],
+    callback: Callable[[str, str, LogReceipt, bool, WindowContext], None],
     address: str,
     start_block: int = None,
     till_block: int = None,
@@ -270,29 +328,84 @@ def get_logs(
     key_namespace: str = 'logs',
     start_blocks: Dict[str, int] = _start_blocks,
     prefer_db_values: bool = True,
+    prefetch: Optional[Callable[[str, List[LogReceipt]],
+                                WindowContext]] = None,
+    queue_depth: Optional[int] = None,
+    shard: Optional[int] = None,
 ) -> None:
+    source = LogSource(callback, address, topics, key_namespace, start_block)
+    scan(chain, [source],
+         till_block=till_block,
+         max_blocks=max_blocks,
+         start_blocks=start_blocks,
+         prefer_db_values=prefer_db_values,
+         prefetch=prefetch,
+         queue_depth=queue_depth,
+         shard=shard)
+
+
+def scan(
+    chain: str,
+    sources: List[LogSource],
+    till_block: int = None,
+    max_blocks: int = MAX_BLOCKS,
+    start_blocks: Dict[str, int] = _start_blocks,
+    prefer_db_values: bool = True,
+    prefetch: Optional[Callable[[str, List[LogReceipt]],
+                                WindowContext]] = None,
+    queue_depth: Optional[int] = None,
+    shard: Optional[int] = None,
+) -> None:
+    """
+    Index every source of `chain` with one `eth_getLogs` per window over all
+    of their addresses, routing each log to the callback of its emitter.
+
+    Sources keep their own checkpoint, the scan starts from the earliest one
+    and logs a source has already seen are skipped. An address is only part
+    of the request once the scan reached its checkpoint.
+    """
     w3: Web3 = SYN_DATA[chain]['w3']
     _chain = f'[{chain}]'
     chain_len = max(len(c) for c in SYN_DATA) + 2
-    tx_index = -1
+    key_namespace = '+'.join(sorted({x.key_namespace for x in sources}))
 
-    if start_block is None or prefer_db_values:
-        _key_block = f'{chain}:{key_namespace}:{address}:MAX_BLOCK_STORED'
-        _key_index = f'{chain}:{key_namespace}:{address}:TX_INDEX'
+    # Shards of a backfill keep their own checkpoint.
+    _shard = f':{shard}' if shard is not None else ''
+    state: Dict[str, Dict[str, Any]] = {}
 
-        if (ret := LOGS_REDIS_URL.get(_key_block)) is not None:
-            _start_block = max(int(ret), start_blocks[chain])
+    for source in sources:
+        _key = f'{chain}:{source.key_namespace}:{source.address}'
+        _key_block = f'{_key}:MAX_BLOCK_STORED{_shard}'
+        _key_index = f'{_key}:TX_INDEX{_shard}'
+        start_block = source.start_block
+        tx_index = -1
 
-            if (ret := LOGS_REDIS_URL.get(_key_index)) is not None:
-                tx_index = int(ret)
-        else:
-            _start_block = start_blocks[chain]
+        if start_block is None or prefer_db_values:
+            if (ret := LOGS_REDIS_URL.get(_key_block)) is not None:
+                _start_block = max(int(ret), start_blocks[chain])
 
-        if start_block is not None and prefer_db_values:
-            # We don't want to go back in blocks we already checked.
-            start_block = max(_start_block, start_block)
-        else:
-            start_block = _start_block
+                if (ret := LOGS_REDIS_URL.get(_key_index)) is not None:
+                    tx_index = int(ret)
+            else:
+                _start_block = start_blocks[chain]
+
+            if start_block is not None and prefer_db_values:
+                # We don't want to go back in blocks we already checked.
+                start_block = max(_start_block, start_block)
+            else:
+                start_block = _start_block
+
+        state[source.address.lower()] = {
+            'source': source,
+            'topics': set(source.topics),
+            'key_block': _key_block,
+            'key_index': _key_index,
+            'start_block': start_block,
+            'tx_index': tx_index,
+            'first_run': True,
+        }
+
+    start_block = min(x['start_block'] for x in state.values())
 
     if till_block is None:
         till_block = w3.eth.block_number
@@ -301,62 +414,222 @@ def get_logs(
         f'{key_namespace} | {_chain:{chain_len}} starting from {start_block} '
         f'with block height of {till_block}')
 
+    if queue_depth is None:
+        queue_depth = _queue_depths.get(chain, QUEUE_DEPTH)
+
     jobs: List[gevent.Greenlet] = []
     _start = time.time()
     x = 0
 
     total_events = 0
     initial_block = start_block
-    first_run = True
 
-    while start_block < till_block:
-        to_block = min(start_block + max_blocks, till_block)
+    def _params(start_block: int) -> FilterParams:
+        # Any window we fetch from `start_block` ends before this.
+        end = start_block + controller.size
+        _sources = [
+            v['source'] for v in state.values() if v['start_block'] <= end
+        ]
+
+        topics = sorted({t for x in _sources for t in x.topics})
 
-        params: FilterParams = {
-            'fromBlock': start_block,
-            'toBlock': to_block,
-            'address': w3.toChecksumAddress(address),
+        return {
+            'address': [w3.toChecksumAddress(x.address) for x in _sources],
             'topics': [topics],  # type: ignore
         }
 
-        logs: List[LogReceipt] = retry(w3.eth.get_logs, params)
+    # `max_blocks` is only where we start off if we have not learned a better
+    # window for this chain yet.
+    controller = WindowController(chain, max_blocks)
+    if controller.limit is None:
+        controller.probe(_params(till_block), till_block)
+
+    def _produce(queue: Queue, start_block: int) -> None:
+        try:
+            while start_block <= till_block:
+                to_block, logs = controller.fetch(_params(start_block),
+                                                  start_block, till_block)
+
+                # Apparently, some RPC nodes don't bother
+                # sorting events in a chronological order.
+                # Let's sort them by block (from oldest to newest)
+                # And by transaction index (within the same block,
+                # also in ascending order)
+                logs = sorted(logs,
+                              key=lambda k:
+                              (k['blockNumber'], k['transactionIndex']))
+
+                # Batch fetch whatever the callbacks need for this window
+                # upfront rather than paying a round-trip per log.
+                if prefetch is not None:
+                    ctx = prefetch(chain, logs)
+                else:
+                    ctx = prefetch_window(chain, logs)
+
+                # Blocks once `queue_depth` windows are waiting to be
+                # processed, so we never run too far ahead of the callbacks.
+                queue.put((to_block, logs, ctx))
+                start_block = to_block + 1
+        except Exception as e:
+            # Let the consumer raise this, rather than waiting forever.
+            queue.put(e)
+            return
+
+        queue.put(None)
 
-        # Apparently, some RPC nodes don't bother
-        # sorting events in a chronological order.
-        # Let's sort them by block (from oldest to newest)
-        # And by transaction index (within the same block,
-        # also in ascending order)
-        logs = sorted(logs,
-                      key=lambda k: (k['blockNumber'], k['transactionIndex']))
+    # The producer fetches upcoming windows while we run the callbacks of the
+    # current one, windows are consumed in order so checkpoints stay ordered.
+    queue: Queue = Queue(maxsize=queue_depth)
+    jobs.append(gevent.spawn(_produce, queue, start_block))
+    checkpoint: Dict[str, int] = {}
 
-        for log in logs:
-            # Skip transactions from the very first block
-            # that are already in the DB
-            if log['blockNumber'] == initial_block \
-              and log['transactionIndex'] <= tx_index:
-                continue
+    try:
+        while (window := queue.get()) is not None:
+            if isinstance(window, Exception):
+                raise window
 
-            try:
-                retry(callback, chain, address, log, first_run)
-            except Exception as e:
-                print(chain, log)
-                raise e
+            to_block, logs, ctx = window
 
-            if first_run:
-                first_run = False
+            for log in logs:
+                if (v := state.get(log['address'].lower())) is None:
+                    raise RuntimeError(
+                        f'sanity check? got log of {log["address"]}')
 
-        start_block += max_blocks + 1
+                # Skip transactions this source has already stored, which
+                # is anything up to its checkpoint.
+                if (log['blockNumber'], log['transactionIndex']) \
+                        <= (v['start_block'], v['tx_index']):
+                    continue
 
-        y = time.time() - _start
-        total_events += len(logs)
+                if convert(log['topics'][0]) not in v['topics']:
+                    continue
 
-        percent = 100 * (to_block - initial_block) \
-            / (till_block - initial_block)
+                source: LogSource = v['source']
 
-        print(f'{key_namespace} | {_chain:{chain_len}} elapsed {y:5.1f}s'
-              f' ({y - x:5.1f}s), found {total_events:5} events,'
-              f' {percent:4.1f}% done: so far at block {start_block}')
-        x = y
+                try:
+                    retry(source.callback, chain, source.address, log,
+                          v['first_run'], ctx)
+                except Exception as e:
+                    print(chain, log)
+                    raise e
+
+                checkpoint[v['key_block']] = log['blockNumber']
+                checkpoint[v['key_index']] = log['transactionIndex']
+                v['first_run'] = False
+
+            # Everything the callbacks wrote and the checkpoints go in at
+            # once, so a crash can never count a log twice.
+            retry(ctx.commit, checkpoint)
+            checkpoint = {}
+
+            y = time.time() - _start
+            total_events += len(logs)
+
+            percent = 100 * (to_block - initial_block) \
+                / max(till_block - initial_block, 1)
+
+            print(f'{key_namespace} | {_chain:{chain_len}} elapsed {y:5.1f}s'
+                  f' ({y - x:5.1f}s), found {total_events:5} events,'
+                  f' {percent:4.1f}% done: so far at block {to_block + 1}')
+            x = y
+    finally:
+        gevent.killall(jobs)
+        controller.save()
 
-    gevent.joinall(jobs)
     print(f'{_chain:{chain_len}} it took {time.time() - _start:.1f}s!')
+
+
+def backfill(
+    chain: str,
+    callback: Callable[[str, str, LogReceipt, bool, WindowContext], None],
+    address: str,
+    shards: int,
+    key_namespace: str = 'logs',
+    start_blocks: Dict[str, int] = _start_blocks,
+    **kwargs: Any,
+) -> None:
+    """
+    Index `[checkpoint, head]` as `shards` concurrent :func:`get_logs`
+    each with their own checkpoint, resuming only unfinished shards after
+    a crash. Once every shard is done the regular checkpoint is moved to
+    the end of the backfill.
+
+    Does nothing if there is too little left to shard, the regular scan
+    (:func:`syn.utils.helpers.dispatch_scan`) picks it up from there.
+
+    NOTE: `callback` has to be order independent, which is the case for
+    :func:`bridge_callback` but not for :func:`pool_callback` (fee changes).
+    """
+    w3: Web3 = SYN_DATA[chain]['w3']
+
+    _key = f'{chain}:{key_namespace}:{address}'
+    key_plan = f'{_key}:BACKFILL'
+    key_done = f'{_key}:BACKFILL:DONE'
+
+    if (ret := LOGS_REDIS_URL.get(key_plan)) is not None:
+        plan: List[List[int]] = json.loads(ret)
+    else:
+        if (ret := LOGS_REDIS_URL.get(f'{_key}:MAX_BLOCK_STORED')) is not None:
+            start_block = max(int(ret), start_blocks[chain])
+        else:
+            start_block = start_blocks[chain]
+
+        till_block = w3.eth.block_number
+        shards = min(shards, (till_block - start_block) // MIN_SHARD_BLOCKS)
+
+        if shards <= 1:
+            # Not worth it, or done already. The regular scan carries on
+            # from the checkpoint.
+            return
+
+        step = (till_block - start_block) // shards + 1
+        plan = [[x, min(x + step - 1, till_block)]
+                for x in range(start_block, till_block + 1, step)]
+
+        pipe = LOGS_REDIS_URL.pipeline(transaction=True)
+        pipe.set(key_plan, json.dumps(plan))
+
+        # The first shard starts at the checkpoint block, hand it the
+        # checkpoint so it skips the txs of that block we already stored.
+        for x in ['MAX_BLOCK_STORED', 'TX_INDEX']:
+            if (ret := LOGS_REDIS_URL.get(f'{_key}:{x}')) is not None:
+                pipe.set(f'{_key}:{x}:0', ret)
+
+        pipe.execute()
+
+    done = {int(x) for x in LOGS_REDIS_URL.smembers(key_done)}
+    print(f'{key_namespace} | [{chain}] backfilling {plan}, done: {done}')
+
+    def _shard(i: int, start_block: int, till_block: int) -> None:
+        get_logs(chain,
+                 callback,
+                 address,
+                 start_block=start_block,
+                 till_block=till_block,
+                 key_namespace=key_namespace,
+                 start_blocks=start_blocks,
+                 shard=i,
+                 **kwargs)
+
+        LOGS_REDIS_URL.sadd(key_done, i)
+
+    jobs = [
+        gevent.spawn(_shard, i, *x) for i, x in enumerate(plan)
+        if i not in done
+    ]
+    gevent.joinall(jobs, raise_error=True)
+
+    # Hand over to the regular checkpoint, which is the last shard that had
+    # any events at all.
+    for i in reversed(range(len(plan))):
+        if (ret := LOGS_REDIS_URL.get(f'{_key}:MAX_BLOCK_STORED:{i}')) \
+                is not None:
+            LOGS_REDIS_URL.set(f'{_key}:MAX_BLOCK_STORED', ret)
+            LOGS_REDIS_URL.set(f'{_key}:TX_INDEX',
+                               LOGS_REDIS_URL.get(f'{_key}:TX_INDEX:{i}'))
+            break
+
+    LOGS_REDIS_URL.delete(
+        key_plan, key_done,
+        *[f'{_key}:MAX_BLOCK_STORED:{i}' for i in range(len(plan))],
+        *[f'{_key}:TX_INDEX:{i}' for i in range(len(plan))])
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+          Copyright Blaze 2021.
+ Distributed under the Boost Software License, Version 1.0.
+    (See accompanying file LICENSE_1_0.txt or copy at
+          https://www.boost.org/LICENSE_1_0.txt)
+"""
+
+from typing import List, Optional, Tuple
+import traceback
+import time
+
+from web3.types import FilterParams, LogReceipt
+import requests
+import gevent
+
+from syn.utils.data import LOGS_REDIS_URL, SYN_DATA
+
+# Bounds of the `eth_getLogs` block range we will ever ask for.
+MIN_WINDOW = 16
+MAX_WINDOW = 2**17
+# Grow the window while a response has less logs than this and came back
+# quicker than `TARGET_TIME`, shrink it once either is doubled.
+TARGET_LOGS = 1000
+TARGET_TIME = 2.0
+# Successful fetches at the `limit` after which it is doubled again, so a
+# limit learned from a node having a bad moment does not stick forever.
+LIMIT_RECOVERY = 100
+
+# Substrings of errors nodes give when the block range itself is too big,
+# rather than the range having too many events in it.
+_RANGE_ERRORS = [
+    'block range',
+    'range too large',
+    'range is too large',
+    'exceed maximum block range',
+    'max range',
+]
+
+
+class WindowController:
+    """
+    Adaptive block range for `eth_getLogs` on a chain.
+
+    The largest range an endpoint accepts (`limit`) is probed on first use
+    and retried every :data:`LIMIT_RECOVERY` fetches at it, the range we
+    settle on (`size`) then grows on sparse ranges and shrinks on dense or
+    slow ones. Both are stored in redis so restarts don't have to learn them
+    again.
+
+    NOTE: these are per chain rather than per endpoint, any request may fail
+    over to another endpoint of the chain so the window has to suit all of
+    them.
+    """
+    def __init__(self, chain: str, initial: int) -> None:
+        self.chain = chain
+        self.key = f'{chain}:logs:window'
+
+        ret = LOGS_REDIS_URL.hgetall(self.key)
+        self.limit: Optional[int] = int(ret['limit']) if 'limit' in ret \
+            else None
+        self.size = int(ret['size']) if 'size' in ret else initial
+        # Consecutive successful fetches at the limit.
+        self.streak = 0
+        self._clamp()
+
+    def _clamp(self) -> None:
+        self.size = max(MIN_WINDOW, min(self.size, self.limit or MAX_WINDOW))
+
+    def save(self) -> None:
+        mapping = {'size': self.size}
+        if self.limit is not None:
+            mapping['limit'] = self.limit
+
+        LOGS_REDIS_URL.hset(self.key, mapping=mapping)  # type: ignore
+
+    def probe(self, params: FilterParams, head: int) -> None:
+        """
+        Find the largest block range the endpoint accepts by halving from
+        `MAX_WINDOW` over the most recent blocks.
+        """
+        w3 = SYN_DATA[self.chain]['w3']
+        size = MAX_WINDOW
+
+        while size > MIN_WINDOW:
+            _params: FilterParams = {
+                **params,  # type: ignore
+                'fromBlock': max(head - size, 0),
+                'toBlock': head,
+            }
+
+            try:
+                w3.eth.get_logs(_params)
+                break
+            except Exception as e:
+                if not _is_range_error(e):
+                    # Says nothing about the range, take it as accepted so
+                    # we do not probe again every run. `failure` lowers it
+                    # if it is rejected after all.
+                    print(f'{self.chain} failed probing {size} blocks: {e}')
+                    break
+
+                print(f'{self.chain} rejected a range of {size} blocks: {e}')
+                size //= 2
+
+        self.limit = size
+        self._clamp()
+        self.save()
+
+    def success(self, logs: int, elapsed: float) -> None:
+        if self.limit is not None and self.size >= self.limit:
+            self.streak += 1
+
+            if self.streak >= LIMIT_RECOVERY and self.limit < MAX_WINDOW:
+                # `failure` lowers it again if it is still rejected.
+                self.limit = min(self.limit * 2, MAX_WINDOW)
+                self.streak = 0
+                self.save()
+
+        if logs > 2 * TARGET_LOGS or elapsed > 2 * TARGET_TIME:
+            self.size //= 2
+        elif logs < TARGET_LOGS and elapsed < TARGET_TIME:
+            self.size *= 2
+
+        self._clamp()
+
+    def failure(self, e: Exception) -> None:
+        self.streak = 0
+
+        if _is_range_error(e):
+            # Endpoint's hard limit is lower than we thought.
+            self.limit = max(self.size // 2, MIN_WINDOW)
+
+        # Too many results, timeouts and oversized payloads all come down to
+        # asking for too much at once.
+        self.size //= 2
+        self._clamp()
+        self.save()
+
+    def fetch(self, params: FilterParams, start_block: int, till_block: int,
+              attempts: int = 8) -> Tuple[int, List[LogReceipt]]:
+        """
+        `eth_getLogs` from `start_block` using the current window size,
+        shrinking the window on errors.
+
+        Returns:
+            Tuple[int, List[LogReceipt]]: last block fetched and its logs.
+        """
+        w3 = SYN_DATA[self.chain]['w3']
+
+        for i in range(attempts):
+            to_block = min(start_block + self.size, till_block)
+            _params: FilterParams = {
+                **params,  # type: ignore
+                'fromBlock': start_block,
+                'toBlock': to_block,
+            }
+
+            try:
+                start = time.time()
+                logs: List[LogReceipt] = w3.eth.get_logs(_params)
+                # Waiting on the rate limit says nothing about the range.
+                elapsed = getattr(w3.provider, 'elapsed', None)
+                if elapsed is None:
+                    elapsed = time.time() - start
+
+                self.success(len(logs), elapsed)
+
+                return to_block, logs
+            except Exception as e:
+                print(f'{self.chain} get_logs {start_block}-{to_block} '
+                      f'failed, attempt {i}')
+                traceback.print_exc()
+
+                if _is_window_error(e) and self.size > MIN_WINDOW:
+                    self.failure(e)
+                else:
+                    # Can't shrink our way out of this one, back off.
+                    gevent.sleep(min(3**i, 60))
+
+        raise RuntimeError(f'{self.chain} get_logs failed from {start_block}')
+
+
+def _is_range_error(e: Exception) -> bool:
+    msg = str(e).lower()
+    return any(x in msg for x in _RANGE_ERRORS)
+
+
+def _is_window_error(e: Exception) -> bool:
+    if isinstance(e, (requests.exceptions.Timeout, ValueError)):
+        # web3 raises `ValueError` with the node's json-rpc error.
+        return True
+
+    if isinstance(e, requests.exceptions.HTTPError) \
+            and e.response is not None:
+        # 413 Payload Too Large & friends.
+        return e.response.status_code in [413, 502, 503, 504]
+
+    return False
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+          Copyright Blaze 2021.
+ Distributed under the Boost Software License, Version 1.0.
+    (See accompanying file LICENSE_1_0.txt or copy at
+          https://www.boost.org/LICENSE_1_0.txt)
+"""
+
+from collections import defaultdict
+import types
+import sys
+import os
+
+import fakeredis
+import pytest
+
+_ROOT = os.path.join(os.path.dirname(__file__), '..', 'syn')
+_UTILS = os.path.join(_ROOT, 'utils')
+
+# `syn` monkey patches gevent and connects to every chain's rpc on import,
+# and so does `syn.utils.data`. The modules under test only need the redis
+# clients and some config, so they are imported against fake ones instead.
+# Chains are added to `SYN_DATA` by the tests needing them.
+for name, path in [('syn', _ROOT), ('syn.utils', _UTILS)]:
+    module = types.ModuleType(name)
+    module.__path__ = [path]  # type: ignore
+    sys.modules.setdefault(name, module)
+
+data = types.ModuleType('syn.utils.data')
+data.REDIS = fakeredis.FakeRedis(decode_responses=True)  # type: ignore
+data.LOGS_REDIS_URL = fakeredis.FakeRedis(  # type: ignore
+    decode_responses=True)
+data.MESSAGE_QUEUE_REDIS = fakeredis.FakeRedis(  # type: ignore
+    decode_responses=True)
+data.AGGREGATE_STORAGE = 'json'  # type: ignore
+data.RPC_BATCH_ITEM_COST = 1  # type: ignore
+data.SQLITE_PATH = ':memory:'  # type: ignore
+data.SNAPSHOT_DIR = ''  # type: ignore
+data.SYN_DATA = {}  # type: ignore
+data.SYN_DECIMALS = 18  # type: ignore
+data.MAX_UINT8 = 2**8 - 1  # type: ignore
+data.BRIDGE_CONFIG = None  # type: ignore
+data.BASEPOOL_ABI = '[]'  # type: ignore
+data.TOKEN_DECIMALS = defaultdict(dict)  # type: ignore
+data.TOKENS_INFO = defaultdict(dict)  # type: ignore
+data.new_tokens_file = os.devnull  # type: ignore
+data._cb = data._tk_d = data._sml_adr = None  # type: ignore
+data.COINGECKO_BASE_URL = \
+    'https://coingecko.test/simple/{0}/{1}'  # type: ignore
+data.COINGECKO_RANGE_URL = \
+    'https://coingecko.test/range/{0}/{1}/{2}/{3}'  # type: ignore
+data.COINGECKO_RATE_LIMIT = 0  # type: ignore
+data.COINGECKO_BURST = 0  # type: ignore
+data.SPOT_PRICE_INTERVAL = 0  # type: ignore
+data.POPULATE_CACHE = False  # type: ignore
+sys.modules.setdefault('syn.utils.data', data)
+
+
+@pytest.fixture(autouse=True)
+def flush() -> None:
+    data.REDIS.flushall()  # type: ignore
+    data.LOGS_REDIS_URL.flushall()  # type: ignore
+    data.MESSAGE_QUEUE_REDIS.flushall()  # type: ignore
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+          Copyright Blaze 2021.
+ Distributed under the Boost Software License, Version 1.0.
+    (See accompanying file LICENSE_1_0.txt or copy at
+          https://www.boost.org/LICENSE_1_0.txt)
+"""
+
+from types import SimpleNamespace
+
+import simplejson as json
+
+from syn.utils.wrappa.batch import batch_request
+from syn.utils.wrappa.provider import MultiHTTPProvider
+from syn.utils.wrappa import batch
+
+
+def test_batch_request_cost(monkeypatch):
+    costs = []
+
+    def _post(data, cost=1):
+        costs.append(cost)
+        return json.dumps([{
+            'id': x['id'],
+            'result': x['method'],
+        } for x in json.loads(data)]).encode()
+
+    provider = MultiHTTPProvider(['https://a.example'])
+    monkeypatch.setattr(provider, 'post', _post)
+    monkeypatch.setattr(batch, 'RPC_BATCH_ITEM_COST', 0.5)
+
+    calls = [(f'eth_{i}', []) for i in range(250)]
+    ret = batch_request(SimpleNamespace(provider=provider), calls)
+
+    assert ret == [x for x, _ in calls]
+    # Every call of a batch counts against the rate limit.
+    assert costs == [50, 50, 25]
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+          Copyright Blaze 2021.
+ Distributed under the Boost Software License, Version 1.0.
+    (See accompanying file LICENSE_1_0.txt or copy at
+          https://www.boost.org/LICENSE_1_0.txt)
+"""
+
+from datetime import date as Date, datetime, timezone
+from typing import Any, List
+from decimal import Decimal
+
+import simplejson as json
+import pytest
+
+from syn.utils.data import REDIS
+from syn.utils.wrappa.coingecko import CoingeckoClient, bucket_daily, \
+    ingest_prices
+
+HOUR = 3600
+
+
+def _ts(x: str) -> int:
+    """Timestamp of an iso datetime in UTC."""
+    return int(datetime.fromisoformat(x).replace(tzinfo=timezone.utc)
+               .timestamp())
+
+
+def _price(ts: int) -> Decimal:
+    # Unique per hour, and exact.
+    return Decimal(ts // HOUR) / 100
+
+
+class FakeCoingecko:
+    """
+    `/market_chart/range` with hourly points at 13 minutes past the hour,
+    starting before `from` and ending after `to` like the real one does.
+    """
+    def __init__(self) -> None:
+        self.urls: List[str] = []
+
+    def fetch(self, url: str) -> Any:
+        self.urls.append(url)
+        *_, since, until = url.split('/')
+        start = int(since) // HOUR * HOUR - 2 * HOUR + 13 * 60
+        points = [[ts * 1000, _price(ts)]
+                  for ts in range(start, int(until) + 2 * HOUR, HOUR)]
+
+        # Reversed, nothing says they are sorted.
+        return {'prices': points[::-1]}
+
+
+@pytest.fixture
+def coingecko() -> FakeCoingecko:
+    return FakeCoingecko()
+
+
+@pytest.fixture
+def client(coingecko) -> CoingeckoClient:
+    return CoingeckoClient(coingecko.fetch, limiter=None)
+
+
+def test_bucket_daily():
+    points = [
+        [_ts('2022-01-02T01:13:00') * 1000, Decimal('3')],
+        [_ts('2022-01-01T23:13:00') * 1000, Decimal('1')],
+        [_ts('2022-01-02T00:13:00') * 1000, Decimal('2')],
+    ]
+
+    # The first point of every UTC day.
+    assert bucket_daily(points) == {
+        '2022-01-01': Decimal('1'),
+        '2022-01-02': Decimal('2'),
+    }
+
+
+def test_history(client, coingecko):
+    ret = client.history('synapse-2', Date(2022, 1, 1), Date(2022, 1, 3))
+
+    assert ret == {
+        '2022-01-01': _price(_ts('2022-01-01T00:13:00')),
+        '2022-01-02': _price(_ts('2022-01-02T00:13:00')),
+        '2022-01-03': _price(_ts('2022-01-03T00:13:00')),
+    }
+    # A single request for the whole range.
+    assert coingecko.urls == [
+        'https://coingecko.test/range/synapse-2/usd/'
+        f'{_ts("2022-01-01T00:00:00")}/{_ts("2022-01-04T00:00:00")}'
+    ]
+
+
+@pytest.mark.parametrize('overwrite', [False, True])
+def test_ingest_prices(client, coingecko, overwrite):
+    REDIS.set('synapse-2:2022-01-01', '1')
+
+    ret = ingest_prices(
+        {
+            'synapse-2': [Date(2022, 1, 2), Date(2022, 1, 1)],
+            'ethereum': [Date(2022, 1, 1)],
+            'nothing': [],
+        },
+        client,
+        overwrite=overwrite)
+
+    prices = {
+        f'{_id}:{date}': _price(_ts(f'{date}T00:13:00'))
+        for _id, date in [('synapse-2', '2022-01-01'),
+                          ('synapse-2', '2022-01-02'),
+                          ('ethereum', '2022-01-01')]
+    }
+    written = {**prices, **{f'{k}:usd': v for k, v in prices.items()}}
+
+    if not overwrite:
+        written.pop('synapse-2:2022-01-01')
+
+    assert sorted(ret) == sorted(written)
+    assert len(coingecko.urls) == 2
+
+    for key, price in written.items():
+        assert json.loads(REDIS.get(key), use_decimal=True) == price
+
+    if not overwrite:
+        assert REDIS.get('synapse-2:2022-01-01') == '1'
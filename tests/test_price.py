@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+          Copyright Blaze 2021.
+ Distributed under the Boost Software License, Version 1.0.
+    (See accompanying file LICENSE_1_0.txt or copy at
+          https://www.boost.org/LICENSE_1_0.txt)
+"""
+
+from syn.utils import price
+from syn.utils.price import ABSENT_TTL
+
+
+def test_queue_missing(monkeypatch):
+    queued = []
+    now = [1000.0]
+
+    monkeypatch.setattr(price, 'enqueue',
+                        lambda keys, requested: queued.append(keys))
+    monkeypatch.setattr(price.time, 'time', lambda: now[0])
+    monkeypatch.setattr(price, '_queued', {})
+
+    price._queue_missing(['a:2022-01-01', 'b:2022-01-01'])
+    price._queue_missing(['a:2022-01-01', 'c:2022-01-01'])
+    assert queued == [['a:2022-01-01', 'b:2022-01-01'], ['c:2022-01-01']]
+
+    # Once the queue may have given up on them.
+    now[0] += ABSENT_TTL
+    price._queue_missing(['a:2022-01-01', 'c:2022-01-01'])
+    assert queued[-1] == ['a:2022-01-01', 'c:2022-01-01']
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+          Copyright Blaze 2021.
+ Distributed under the Boost Software License, Version 1.0.
+    (See accompanying file LICENSE_1_0.txt or copy at
+          https://www.boost.org/LICENSE_1_0.txt)
+"""
+
+from datetime import date as Date
+from typing import Dict, Iterable, List
+
+import pytest
+
+from syn.utils.data import MESSAGE_QUEUE_REDIS, REDIS
+from syn.utils import pricequeue
+from syn.utils.pricequeue import BACKOFF, MAX_ATTEMPTS, consume, enqueue
+
+# 2022-06-01, `Date.today` goes by the patched clock as well.
+NOW = 1654041600
+
+
+def _queue() -> Dict[str, float]:
+    return dict(
+        MESSAGE_QUEUE_REDIS.zrange('prices:queue', 0, -1, withscores=True))
+
+
+class FakeIngest:
+    """`ingest_prices` knowing the price of every id in `prices`."""
+    def __init__(self) -> None:
+        self.prices: Dict[str, str] = {}
+        self.calls: List[Dict[str, List[Date]]] = []
+
+    def __call__(self, dates: Dict[str, Iterable[Date]],
+                 overwrite: bool = False) -> List[str]:
+        self.calls.append({k: sorted(v) for k, v in dates.items()})
+        written = []
+
+        for _id, days in dates.items():
+            if _id not in self.prices:
+                continue
+
+            for day in days:
+                for key in [f'{_id}:{day}', f'{_id}:{day}:usd']:
+                    if REDIS.set(key, self.prices[_id], nx=not overwrite):
+                        written.append(key)
+
+        return written
+
+
+@pytest.fixture
+def ingest(monkeypatch) -> FakeIngest:
+    ingest = FakeIngest()
+    monkeypatch.setattr(pricequeue, 'ingest_prices', ingest)
+    monkeypatch.setattr(pricequeue.time, 'time', lambda: NOW)
+
+    return ingest
+
+
+def test_enqueue(ingest):
+    today = Date.fromtimestamp(NOW)
+    enqueue(['a:2021-01-01', 'b:2021-01-01:usd', f'c:{today}', 'junk'])
+    enqueue(['a:2021-01-01'], requested=True)
+
+    queue = _queue()
+    # Both variants are queued as one.
+    assert sorted(queue) == ['a:2021-01-01', 'b:2021-01-01', f'c:{today}']
+    # Recent and requested prices go first.
+    assert queue['b:2021-01-01'] == NOW
+    assert queue[f'c:{today}'] < NOW
+    assert queue['a:2021-01-01'] < NOW
+
+    # Never pushed back.
+    enqueue(['a:2021-01-01'])
+    assert _queue() == queue
+
+
+def test_enqueue_backoff(ingest):
+    MESSAGE_QUEUE_REDIS.hset('prices:attempts', 'a:2021-01-01', 1)
+    MESSAGE_QUEUE_REDIS.zadd('prices:queue', {'a:2021-01-01': NOW + 120})
+
+    # However urgent, it stays where the retry put it.
+    enqueue(['a:2021-01-01'], requested=True)
+    assert _queue() == {'a:2021-01-01': NOW + 120}
+
+
+def test_consume(ingest):
+    ingest.prices = {'a': '1.5', 'c': '2'}
+    REDIS.set('b:2021-01-02:usd', '3')
+    REDIS.set('c:2021-01-01', '0')
+    REDIS.set('c:2021-01-01:usd', '0')
+    enqueue(['a:2021-01-01', 'a:2021-01-03', 'b:2021-01-02',
+             'c:2021-01-01', 'd:2021-01-01'])
+    # Not due yet.
+    MESSAGE_QUEUE_REDIS.zadd('prices:queue', {'a:2021-01-05': NOW + 1})
+
+    assert consume() == 5
+
+    # A single range per id, zeros apart as they are overwritten.
+    assert ingest.calls == [
+        {
+            'a': [Date(2021, 1, 1), Date(2021, 1, 3)],
+            'd': [Date(2021, 1, 1)],
+        },
+        {
+            'c': [Date(2021, 1, 1)]
+        },
+    ]
+    assert REDIS.mget('a:2021-01-01', 'a:2021-01-03:usd', 'b:2021-01-02',
+                      'c:2021-01-01', 'c:2021-01-01:usd') \
+        == ['1.5', '1.5', '3', '2', '2']
+
+    # Only what failed is retried, after backing off.
+    assert _queue() == {
+        'a:2021-01-05': NOW + 1,
+        'd:2021-01-01': NOW + BACKOFF * 2,
+    }
+    assert MESSAGE_QUEUE_REDIS.hgetall('prices:attempts') == {
+        'd:2021-01-01': '1'
+    }
+
+
+def test_give_up(ingest):
+    MESSAGE_QUEUE_REDIS.hset('prices:attempts', 'd:2021-01-01',
+                             MAX_ATTEMPTS - 1)
+    MESSAGE_QUEUE_REDIS.zadd('prices:queue', {'d:2021-01-01': NOW})
+
+    assert consume() == 1
+    assert _queue() == {}
+    assert MESSAGE_QUEUE_REDIS.hgetall('prices:attempts') == {}
+
+
+def test_legacy(ingest):
+    MESSAGE_QUEUE_REDIS.sadd('prices:missing', 'a:2021-01-01')
+
+    consume()
+
+    assert MESSAGE_QUEUE_REDIS.smembers('prices:missing') == set()
+    assert 'a:2021-01-01' in _queue()
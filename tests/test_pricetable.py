@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+          Copyright Blaze 2021.
+ Distributed under the Boost Software License, Version 1.0.
+    (See accompanying file LICENSE_1_0.txt or copy at
+          https://www.boost.org/LICENSE_1_0.txt)
+"""
+
+from datetime import date as Date
+from decimal import Decimal
+
+import pytest
+
+from syn.utils.data import REDIS
+from syn.utils import pricetable
+from syn.utils.pricetable import FALLBACK_DAYS, PriceTable, publish_prices
+
+pytest.importorskip('numpy')
+
+# More digits than a float64 holds.
+PRICE = '1.000123456789012345678'
+
+
+@pytest.fixture
+def table():
+    REDIS.set('usd-coin:2022-01-03', PRICE)
+    REDIS.set('usd-coin:2022-01-04:usd', '0.99')
+
+    return PriceTable(['usd-coin', 'synapse-2'])
+
+
+def test_get(table):
+    assert table.get('usd-coin', '2022-01-03') == Decimal(PRICE)
+    assert table.get('usd-coin', Date(2022, 1, 4)) == Decimal('0.99')
+    assert table.get('usd-coin', '2022-01-05') is None
+    assert table.get('synapse-2', '2022-01-03') is None
+    # Not in the table at all.
+    assert table.get('ethereum', '2022-01-03') is None
+    assert table.get('usd-coin', '2020-12-31') is None
+
+
+def test_fallback(table):
+    assert table.fallback('usd-coin', '2022-01-04') == Decimal('0.99')
+    assert table.fallback('usd-coin', '2022-01-05') == Decimal('0.99')
+
+    last = Date(2022, 1, 3 + FALLBACK_DAYS)
+    assert table.fallback('usd-coin', last) == Decimal('0.99')
+    assert table.fallback('usd-coin', last.replace(day=last.day + 1)) is None
+    assert table.fallback('usd-coin', '2022-01-02') is None
+
+
+def test_refresh(table):
+    assert table.get('synapse-2', '2022-01-03') is None
+
+    REDIS.set('synapse-2:2022-01-03', '2.5')
+    REDIS.set('synapse-2:2099-01-01', '3')
+    publish_prices(['synapse-2:2022-01-03', 'synapse-2:2099-01-01'])
+    table.refresh()
+
+    assert table.get('synapse-2', '2022-01-03') == Decimal('2.5')
+    # The table grows to fit days past its end.
+    assert table.get('synapse-2', '2099-01-01') == Decimal('3')
+    assert table.get('usd-coin', '2022-01-03') == Decimal(PRICE)
+
+
+def test_refresh_pruned(table, monkeypatch):
+    assert table.get('usd-coin', '2022-01-03') == Decimal(PRICE)
+    monkeypatch.setattr(pricetable, 'KEEP_UPDATES', 1)
+
+    REDIS.set('synapse-2:2022-01-03', '2.5')
+    publish_prices(['synapse-2:2022-01-03'])
+    publish_prices(['usd-coin:2022-01-04:usd'])
+
+    # What the table missed is pruned, so it has to load again.
+    assert REDIS.zcard('prices:updates') == 1
+    table.refresh()
+
+    assert table.get('synapse-2', '2022-01-03') == Decimal('2.5')
+    assert table.seq == 2
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+          Copyright Blaze 2021.
+ Distributed under the Boost Software License, Version 1.0.
+    (See accompanying file LICENSE_1_0.txt or copy at
+          https://www.boost.org/LICENSE_1_0.txt)
+"""
+
+from typing import Any, List, Set
+
+import requests
+import pytest
+
+from syn.utils.wrappa import provider
+from syn.utils.wrappa.provider import FAILURE_THRESHOLD, MultiHTTPProvider
+
+URIS = ['https://a.example', 'https://b.example', 'https://c.example']
+
+
+class FakeNodes:
+    def __init__(self) -> None:
+        # Endpoints refusing connections.
+        self.down: Set[str] = set()
+        self.calls: List[str] = []
+
+    def post(self, uri: str, data: bytes, **kwargs: Any) -> bytes:
+        self.calls.append(uri)
+
+        if uri in self.down:
+            raise requests.exceptions.ConnectionError(uri)
+
+        return uri.encode()
+
+
+@pytest.fixture
+def nodes(monkeypatch) -> FakeNodes:
+    nodes = FakeNodes()
+    monkeypatch.setattr(provider, 'make_post_request', nodes.post)
+
+    return nodes
+
+
+def test_failover(nodes):
+    w3 = MultiHTTPProvider(URIS)
+    nodes.down.add(URIS[0])
+
+    assert w3.post(b'') == URIS[1].encode()
+    assert nodes.calls == URIS[:2]
+    assert w3.endpoints[0].failures == 1
+    assert w3.elapsed is not None
+
+    # Ranked below the others now.
+    nodes.calls.clear()
+    w3.post(b'')
+    assert len(nodes.calls) == 1
+    assert URIS[0] not in nodes.calls
+
+
+def test_eject(nodes):
+    w3 = MultiHTTPProvider(URIS)
+    nodes.down.update(URIS)
+
+    for _ in range(FAILURE_THRESHOLD):
+        with pytest.raises(requests.exceptions.ConnectionError):
+            w3.post(b'')
+
+    # Everything is ejected, only the first one back gets tried.
+    assert len(w3._ranked()) == 1
+    assert all(x['ejected'] for x in w3.stats().values())
+
+    # Past the cool-down it is tried again, a success brings it back.
+    w3.endpoints[1].ejected_until = 0
+    nodes.down.clear()
+
+    assert w3.post(b'') == URIS[1].encode()
+    assert w3.endpoints[1].failures == 0
+    assert [x['ejected'] for x in w3.stats().values()] == [True, False, True]
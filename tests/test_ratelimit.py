@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+          Copyright Blaze 2021.
+ Distributed under the Boost Software License, Version 1.0.
+    (See accompanying file LICENSE_1_0.txt or copy at
+          https://www.boost.org/LICENSE_1_0.txt)
+"""
+
+from typing import List
+
+import pytest
+
+from syn.utils.data import REDIS
+from syn.utils.wrappa import ratelimit
+from syn.utils.wrappa.ratelimit import RedisTokenBucket, TokenBucket
+
+
+@pytest.fixture
+def sleeps(monkeypatch) -> List[float]:
+    """Waits of the buckets, the clock stands still meanwhile."""
+    sleeps: List[float] = []
+    monkeypatch.setattr(ratelimit.time, 'time', lambda: 1000.0)
+    monkeypatch.setattr(ratelimit.gevent, 'sleep', sleeps.append)
+
+    return sleeps
+
+
+def test_token_bucket(sleeps):
+    bucket = TokenBucket(2, 3)
+
+    assert [bucket.acquire() for _ in range(5)] == [0, 0, 0, 0.5, 1.0]
+    assert sleeps == [0.5, 1.0]
+    assert bucket.stats()['waits'] == 2
+
+
+def test_token_bucket_refill(sleeps, monkeypatch):
+    bucket = TokenBucket(2, 3)
+    bucket.acquire(3)
+
+    # Never more than `burst` tokens.
+    monkeypatch.setattr(ratelimit.time, 'time', lambda: 1010.0)
+    assert bucket.acquire(3) == 0
+    assert bucket.acquire() == 0.5
+
+
+def test_token_bucket_cost(sleeps):
+    bucket = TokenBucket(10, 10)
+
+    # More than a burst at once.
+    assert bucket.acquire(25) == 1.5
+    assert bucket.acquire() == 1.6
+
+
+def test_redis_token_bucket():
+    # Shared through redis, whose clock we can't stop.
+    first = RedisTokenBucket(1, 10, REDIS, 'ratelimit:a')
+    second = RedisTokenBucket(1, 10, REDIS, 'ratelimit:a')
+
+    assert first._reserve(4) == 0
+    assert second._reserve(6) == 0
+    assert 9 < first._reserve(10) <= 10
+    assert float(REDIS.hget('ratelimit:a', 'tokens')) <= -9
+
+
+def test_redis_token_bucket_fallback(sleeps):
+    class Broken:
+        def register_script(self, script):
+            def _script(*args, **kwargs):
+                raise ConnectionError('redis is down')
+
+            return _script
+
+    bucket = RedisTokenBucket(1, 1, Broken(), 'ratelimit:a')  # type: ignore
+
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == 1
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+          Copyright Blaze 2021.
+ Distributed under the Boost Software License, Version 1.0.
+    (See accompanying file LICENSE_1_0.txt or copy at
+          https://www.boost.org/LICENSE_1_0.txt)
+"""
+
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+import simplejson as json
+from web3 import Web3
+import pytest
+
+from syn.utils.data import LOGS_REDIS_URL, SYN_DATA
+from syn.utils.explorer.data import TOPICS
+from syn.utils.storage import fixed_value, merge_sum
+from syn.utils.wrappa.batch import WindowContext
+from syn.utils.wrappa import rpc
+
+ADDRESS = '0xd123f70ae324d34a9e76b67a27bf77593ba8749f'
+KEY = 'bsc:bridge:2022-01-01:0xabc:IN'
+TOPIC = next(iter(TOPICS))
+
+# Two txs every third block.
+LOGS = [{
+    'address': Web3.toChecksumAddress(ADDRESS),
+    'blockNumber': block,
+    'transactionIndex': index,
+    'topics': [TOPIC],
+} for block in range(0, 400, 3) for index in range(2)]
+
+
+class FakeEth:
+    def __init__(self) -> None:
+        self.block_number = 0
+
+    def get_logs(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        return [
+            x for x in LOGS if x['address'] in params['address']
+            and params['fromBlock'] <= x['blockNumber'] <= params['toBlock']
+            and x['blockNumber'] <= self.block_number
+        ]
+
+
+@pytest.fixture
+def eth(monkeypatch) -> FakeEth:
+    eth = FakeEth()
+    w3 = SimpleNamespace(eth=eth,
+                         provider=None,
+                         toChecksumAddress=Web3.toChecksumAddress)
+    monkeypatch.setitem(SYN_DATA, 'bsc', {'w3': w3})
+    monkeypatch.setattr(rpc, 'MIN_SHARD_BLOCKS', 50)
+    # Skip probing for the largest range.
+    LOGS_REDIS_URL.hset('bsc:logs:window', mapping={'limit': 32, 'size': 32})
+
+    return eth
+
+
+def _callback(chain: str, address: str, log: Dict[str, Any],
+              first_run: bool, ctx: WindowContext) -> None:
+    ctx.update(KEY, {'amount': log['blockNumber'], 'txCount': 1}, merge_sum)
+
+
+def _prefetch(chain: str, logs: List[Dict[str, Any]]) -> WindowContext:
+    return WindowContext(chain)
+
+
+def _totals() -> Dict[str, int]:
+    return fixed_value(json.loads(LOGS_REDIS_URL.get(KEY), use_decimal=True))
+
+
+def _expected(head: int) -> Dict[str, int]:
+    logs = [x for x in LOGS if x['blockNumber'] <= head]
+
+    return {
+        'amount': sum(x['blockNumber'] for x in logs),
+        'txCount': len(logs),
+    }
+
+
+def test_backfill_from_checkpoint(eth):
+    kwargs = {'start_blocks': {'bsc': 0}, 'prefetch': _prefetch}
+
+    # Checkpoint at a block with logs, which the first shard starts from.
+    eth.block_number = 150
+    rpc.get_logs('bsc', _callback, ADDRESS, **kwargs)
+    assert _totals() == _expected(150)
+
+    eth.block_number = 399
+    rpc.backfill('bsc', _callback, ADDRESS, 4, **kwargs)
+
+    assert _totals() == _expected(399)
+    assert LOGS_REDIS_URL.get(f'bsc:logs:{ADDRESS}:MAX_BLOCK_STORED') \
+        == '399'
+    assert LOGS_REDIS_URL.keys(f'bsc:logs:{ADDRESS}:*:*') == []
+
+    # Nothing left for either of them.
+    rpc.backfill('bsc', _callback, ADDRESS, 4, **kwargs)
+    rpc.get_logs('bsc', _callback, ADDRESS, **kwargs)
+    assert _totals() == _expected(399)
+
+
+
+def test_bridge_prefetch(eth, monkeypatch):
+    calls = []
+    fetched = []
+
+    def _parse_in(log):
+        calls.append(log)
+        # Successful swaps need their tx input.
+        return None if log['transactionIndex'] else {'amount': 1}
+
+    def _prefetch_window(chain, logs, tx_hashes, receipt_hashes):
+        fetched.extend(tx_hashes)
+        return WindowContext(chain)
+
+    monkeypatch.setattr(rpc, '_parse_in', _parse_in)
+    monkeypatch.setattr(rpc, 'prefetch_window', _prefetch_window)
+
+    direction = {v: k for k, v in TOPICS.items()}
+    logs = [{
+        'transactionHash': f'0x{i:064x}',
+        'transactionIndex': i,
+        'logIndex': 0,
+        'topics': [direction[rpc.Direction.IN]],
+    } for i in range(2)]
+    ctx = rpc.bridge_prefetch('bsc', logs)
+
+    assert calls == logs
+    assert fetched == [logs[1]['transactionHash']]
+    assert ctx.parsed == {
+        (logs[0]['transactionHash'], 0): {'amount': 1},
+        (logs[1]['transactionHash'], 0): None,
+    }
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+          Copyright Blaze 2021.
+ Distributed under the Boost Software License, Version 1.0.
+    (See accompanying file LICENSE_1_0.txt or copy at
+          https://www.boost.org/LICENSE_1_0.txt)
+"""
+
+from datetime import date as Date
+from decimal import Decimal
+import json
+import os
+
+import pytest
+
+from syn.utils import snapshot
+from syn.utils.snapshot import build_snapshot, get_snapshot
+
+# Enough of these overflow an int64 sum of the `_lo` column.
+AMOUNT = Decimal('1234567.999999999999999999')
+
+AGGREGATES = {
+    'bridge': [
+        *[(f'bsc:bridge:2022-01-0{i % 2 + 1}:0xabc:IN', {
+            'amount': AMOUNT,
+            'txCount': 1,
+            'fees': Decimal('0.000000000000000001'),
+            'validator': {
+                'gas_paid': Decimal('0.021'),
+                'gas_price': Decimal('0.000000005'),
+            },
+        }) for i in range(20)],
+        ('eth:bridge:2022-01-01:0xabc:OUT:56', {
+            'amount': Decimal('1.5'),
+            'txCount': 3,
+        }),
+    ],
+    'pool': [
+        ('bsc:pool:2022-01-01:0xpool:swap', {
+            'volume': AMOUNT,
+            'lp_fees': Decimal('0.1'),
+            'admin_fees': Decimal('0.05'),
+            'tx_count': 2,
+        }),
+        ('bsc:pool:2022-01-01:0xpool:new_fee', {
+            'tx_count': 1,
+            'newfee_swap': 4000000,
+        }),
+    ],
+}
+
+
+@pytest.fixture
+def path(tmp_path, monkeypatch) -> str:
+    monkeypatch.setattr(snapshot, 'iter_aggregates',
+                        lambda chain, ns: iter(AGGREGATES[ns]))
+    return str(tmp_path)
+
+
+def test_group_sum(path):
+    build_snapshot(path)
+    ret = get_snapshot(path)
+    assert ret is not None
+
+    assert ret.group_sum('bridge', ['chain', 'direction'],
+                         ['amount', 'tx_count', 'fees', 'gas_price']) == {
+        ('bsc', 'IN'): {
+            'amount': AMOUNT * 20,
+            'tx_count': 20,
+            'fees': Decimal('0.00000000000000002'),
+            'gas_price': Decimal('0.0000001'),
+        },
+        ('eth', 'OUT'): {
+            'amount': Decimal('1.5'),
+            'tx_count': 3,
+            'fees': 0,
+            'gas_price': 0,
+        },
+    }
+    assert ret.group_sum('bridge', ['day'], ['amount'], chain='bsc',
+                         since=Date(2022, 1, 2)) == {
+        ('2022-01-02',): {'amount': AMOUNT * 10},
+    }
+    assert ret.group_sum('bridge', ['day'], ['amount'], chain='ftm') == {}
+
+    # Fee changes are no counters.
+    assert ret.group_sum('pool', ['pool', 'tx_type'], ['volume']) == {
+        ('0xpool', 'swap'): {'volume': AMOUNT},
+    }
+
+
+def test_outdated(path, monkeypatch):
+    out = build_snapshot(path)
+    assert out is not None
+
+    with open(os.path.join(out, 'meta.json')) as f:
+        meta = json.load(f)
+
+    with open(os.path.join(out, 'meta.json'), 'w') as f:
+        json.dump({**meta, 'version': 1, 'decimals': 6}, f)
+
+    monkeypatch.setattr(snapshot, '_snapshot', None)
+    assert get_snapshot(path) is None
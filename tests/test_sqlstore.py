@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+          Copyright Blaze 2021.
+ Distributed under the Boost Software License, Version 1.0.
+    (See accompanying file LICENSE_1_0.txt or copy at
+          https://www.boost.org/LICENSE_1_0.txt)
+"""
+
+from decimal import Decimal
+import os
+
+import pytest
+
+from syn.utils.data import LOGS_REDIS_URL
+from syn.utils.sqlstore import SQLiteStore
+from syn.utils.storage import decimal_to_fixed, merge_sum
+
+# Adding two of these carries into `_hi`, and enough of them overflow an
+# int64 sum of `_lo`.
+AMOUNT = Decimal('1234567.999999999999999999')
+IN = {
+    'amount': decimal_to_fixed(AMOUNT),
+    'txCount': 1,
+    'fees': 1,
+    'airdrops': decimal_to_fixed(Decimal('0.002')),
+    'validator': {
+        'gas_paid': decimal_to_fixed(Decimal('0.021')),
+        'gas_price': 5 * 10**9,
+    },
+}
+
+
+@pytest.fixture
+def store(tmp_path) -> SQLiteStore:
+    return SQLiteStore(os.path.join(tmp_path, 'syn.db'))
+
+
+def test_commit(store):
+    key = 'bsc:bridge:2022-01-01:0xabc:IN'
+
+    for _ in range(3):
+        store.commit({key: (merge_sum, IN)}, {}, {'bsc:logs:0x1': 10})
+
+    assert dict(store.iter_aggregates('bsc', 'bridge')) == {
+        key: {
+            'amount': AMOUNT * 3,
+            'txCount': 3,
+            'fees': Decimal('0.000000000000000003'),
+            'airdrops': Decimal('0.006'),
+            'validator': {
+                'gas_paid': Decimal('0.063'),
+                'gas_price': Decimal('0.000000015'),
+            },
+        }
+    }
+    assert LOGS_REDIS_URL.get('bsc:logs:0x1') == '10'
+
+    # `_lo` stays below the limb.
+    ret = store._run(store._fetchall,
+                     'SELECT amount_hi, amount_lo FROM bridge')
+    assert ret == [(3703703, 999999999999999997)]
+
+
+def test_group_sum(store):
+    store.commit(
+        {
+            f'bsc:bridge:2022-01-{i + 1:02}:0xabc:IN': (merge_sum, IN)
+            for i in range(20)
+        }, {}, {})
+    store.commit(
+        {
+            'bsc:bridge:2022-01-01:0xabc:OUT:1': (merge_sum, {
+                'amount': 10**18,
+                'txCount': 1,
+            })
+        }, {}, {})
+
+    assert store.group_sum('bridge', ['chain', 'direction'],
+                           ['amount', 'tx_count', 'fees']) == {
+        ('bsc', 'IN'): {
+            'amount': AMOUNT * 20,
+            'tx_count': 20,
+            'fees': Decimal('0.00000000000000002'),
+        },
+        ('bsc', 'OUT'): {
+            'amount': 1,
+            'tx_count': 1,
+            'fees': 0,
+        },
+    }
+    assert store.group_sum('bridge', ['dest'], ['amount'],
+                           direction='OUT') == {
+        (1,): {'amount': 1},
+    }
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+          Copyright Blaze 2021.
+ Distributed under the Boost Software License, Version 1.0.
+    (See accompanying file LICENSE_1_0.txt or copy at
+          https://www.boost.org/LICENSE_1_0.txt)
+"""
+
+from decimal import Decimal
+
+import pytest
+
+from syn.utils.data import LOGS_REDIS_URL
+from syn.utils.storage import LIMB, compact_fields, compact_key, \
+    decimal_to_fixed, decimal_value, decode_compact, decode_hash, \
+    encode_compact, fixed_value, from_fixed, merge_min, merge_sum, to_fixed, \
+    write_hash
+
+# Past both `LIMB` and `HINCRBY`'s 64-bit range.
+AMOUNT = Decimal('123456789.123456789012345678')
+
+BRIDGE_IN = {
+    'amount': AMOUNT,
+    'txCount': 2,
+    'fees': Decimal('0.000000000000000001'),
+    'airdrops': Decimal('0.003'),
+    'validator': {
+        'gas_paid': Decimal('0.021'),
+        'gas_price': Decimal('0.000000025'),
+    },
+}
+POOL = {
+    'volume': AMOUNT,
+    'lp_fees': Decimal('1.5'),
+    'admin_fees': Decimal('0.75'),
+    'tx_count': 3,
+    'newfee_swap': 4000000,
+}
+
+
+def test_fixed_round_trip():
+    assert from_fixed(decimal_to_fixed(AMOUNT)) == AMOUNT
+    assert from_fixed(to_fixed(1500000, 6)) == Decimal('1.5')
+    # Anything past 18 decimals is truncated.
+    assert to_fixed(10**24 + 1, 24) == 10**18
+
+
+def test_fixed_value_round_trip():
+    value = fixed_value(BRIDGE_IN)
+
+    assert value['amount'] == 123456789123456789012345678
+    assert value['validator']['gas_price'] == 25 * 10**9
+    assert value['txCount'] == 2
+    assert decimal_value(value) == BRIDGE_IN
+
+
+def test_merge_sum():
+    ret = merge_sum(None, fixed_value(BRIDGE_IN))
+    ret = merge_sum(ret, fixed_value(BRIDGE_IN))
+
+    assert decimal_value(ret) == {
+        'amount': AMOUNT * 2,
+        'txCount': 4,
+        'fees': Decimal('0.000000000000000002'),
+        'airdrops': Decimal('0.006'),
+        'validator': {
+            'gas_paid': Decimal('0.042'),
+            'gas_price': Decimal('0.00000005'),
+        },
+    }
+
+
+def test_merge_sum_newfee():
+    ret = merge_sum(None, {'tx_count': 1, 'newfee_swap': 1})
+    ret = merge_sum(ret, {'tx_count': 1, 'newfee_swap': 2})
+
+    assert ret == {'tx_count': 2, 'newfee_swap': 2}
+
+
+def test_merge_sum_mismatched():
+    with pytest.raises(RuntimeError):
+        merge_sum({'amount': 1, 'txCount': 1},
+                  {'amount': 1, 'txCount': 1, 'fees': 1})
+
+
+def test_merge_min():
+    first = {'block': 10, 'timestamp': 100}
+    second = {'block': 20, 'timestamp': 200}
+
+    assert merge_min(None, second) == second
+    assert merge_min(second, first) == first
+    assert merge_min(first, second) == first
+
+
+@pytest.mark.parametrize('value', [BRIDGE_IN, POOL])
+def test_hash_round_trip(value):
+    key = 'bsc:bridge:2022-01-01:0xabc:IN'
+    pipe = LOGS_REDIS_URL.pipeline(transaction=False)
+    write_hash(pipe, key, merge_sum, fixed_value(value))
+    write_hash(pipe, key, merge_sum, fixed_value(value))
+    pipe.execute()
+
+    expected = merge_sum(fixed_value(value), fixed_value(value))
+    ret = LOGS_REDIS_URL.hgetall(key)
+
+    assert decode_hash(ret) == decimal_value(expected)
+    # The carry keeps every `:lo` field below `LIMB`.
+    assert all(int(v) < LIMB for k, v in ret.items() if k.endswith(':lo'))
+
+
+def test_hash_merge_min():
+    key = 'bsc:date2block:2022-01-01'
+    pipe = LOGS_REDIS_URL.pipeline(transaction=False)
+    write_hash(pipe, key, merge_min, {'block': 20, 'timestamp': 200})
+    write_hash(pipe, key, merge_min, {'block': 10, 'timestamp': 100})
+    write_hash(pipe, key, merge_min, {'block': 30, 'timestamp': 300})
+    pipe.execute()
+
+    assert decode_hash(LOGS_REDIS_URL.hgetall(key)) == {
+        'block': 10,
+        'timestamp': 100,
+    }
+
+
+@pytest.mark.parametrize('value', [BRIDGE_IN, POOL])
+def test_compact_round_trip(value):
+    key, series = compact_key('bsc:pool:2022-01-01:0xpool:swap_base')
+    data = encode_compact(series, fixed_value(value))
+
+    assert key == 'bsc:pool:2022-01-01'
+    assert series == '0xpool:swap_base'
+    assert sorted(data) == sorted(compact_fields(series, value))
+    assert decode_compact(data) == {series: value}
+    assert decode_compact(data, fixed=True) == {series: fixed_value(value)}
+
+
+def test_compact_many_series():
+    data = {
+        **encode_compact('0xabc:IN', fixed_value(BRIDGE_IN)),
+        **encode_compact('0xabc:OUT:1', {'amount': 1, 'txCount': 1}),
+    }
+    # Missing fields of a `HMGET` come back as `None`.
+    data['0xdef:OUT:1:a'] = None
+
+    assert decode_compact(data) == {
+        '0xabc:IN': BRIDGE_IN,
+        '0xabc:OUT:1': {'amount': from_fixed(1), 'txCount': 1},
+    }
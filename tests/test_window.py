@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+          Copyright Blaze 2021.
+ Distributed under the Boost Software License, Version 1.0.
+    (See accompanying file LICENSE_1_0.txt or copy at
+          https://www.boost.org/LICENSE_1_0.txt)
+"""
+
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+import pytest
+
+from syn.utils.data import LOGS_REDIS_URL, SYN_DATA
+from syn.utils.wrappa.window import LIMIT_RECOVERY, MAX_WINDOW, \
+    MIN_WINDOW, TARGET_LOGS, TARGET_TIME, WindowController
+
+
+class FakeEth:
+    def __init__(self) -> None:
+        # Largest range accepted.
+        self.limit = MAX_WINDOW
+        # Raised on every call, if set.
+        self.error: Optional[Exception] = None
+        self.calls: List[int] = []
+
+    def get_logs(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        size = params['toBlock'] - params['fromBlock']
+        self.calls.append(size)
+
+        if self.error is not None:
+            raise self.error
+        elif size > self.limit:
+            raise ValueError({'code': -32000, 'message': 'block range too '
+                              f'large, max is {self.limit}'})
+
+        return []
+
+
+@pytest.fixture
+def eth(monkeypatch) -> FakeEth:
+    eth = FakeEth()
+    monkeypatch.setitem(SYN_DATA, 'bsc', {
+        'w3': SimpleNamespace(eth=eth, provider=None)
+    })
+
+    return eth
+
+
+def test_probe(eth):
+    eth.limit = 5000
+    controller = WindowController('bsc', 10000)
+    controller.probe({}, 10**6)
+
+    assert controller.limit == 4096
+    assert controller.size == 4096
+    assert WindowController('bsc', 10000).limit == 4096
+
+
+def test_probe_other_error(eth):
+    eth.error = ValueError('too many results')
+    controller = WindowController('bsc', 10000)
+    controller.probe({}, 10**6)
+
+    # A single attempt, which is not repeated by the next run.
+    assert eth.calls == [MAX_WINDOW]
+    assert WindowController('bsc', 10000).limit == MAX_WINDOW
+
+
+def test_success():
+    controller = WindowController('bsc', 1000)
+
+    controller.success(0, 0)
+    assert controller.size == 2000
+
+    controller.success(3 * TARGET_LOGS, 0)
+    assert controller.size == 1000
+
+    controller.success(0, 3 * TARGET_TIME)
+    assert controller.size == 500
+
+    # Neither sparse nor dense.
+    controller.success(TARGET_LOGS, 0)
+    assert controller.size == 500
+
+
+def test_success_clamp():
+    LOGS_REDIS_URL.hset('bsc:logs:window', mapping={'limit': 1024})
+    controller = WindowController('bsc', 1000)
+
+    controller.success(0, 0)
+    assert controller.size == 1024
+
+    for _ in range(20):
+        controller.success(10**6, 0)
+
+    assert controller.size == MIN_WINDOW
+
+
+def test_limit_recovery():
+    LOGS_REDIS_URL.hset('bsc:logs:window', mapping={'limit': 1024})
+    controller = WindowController('bsc', 1024)
+
+    for _ in range(LIMIT_RECOVERY - 1):
+        controller.success(TARGET_LOGS, 0)
+
+    assert controller.limit == 1024
+
+    controller.success(TARGET_LOGS, 0)
+    assert controller.limit == 2048
+    assert LOGS_REDIS_URL.hget('bsc:logs:window', 'limit') == '2048'
+
+
+def test_failure():
+    controller = WindowController('bsc', 1024)
+
+    controller.failure(ValueError('too many results'))
+    assert controller.limit is None
+    assert controller.size == 512
+
+    controller.failure(ValueError('exceed maximum block range'))
+    assert controller.limit == 256
+    assert controller.size == 256
+    assert LOGS_REDIS_URL.hgetall('bsc:logs:window') == {
+        'limit': '256',
+        'size': '256',
+    }
+
+
+def test_fetch(eth):
+    eth.limit = 300
+    controller = WindowController('bsc', 1024)
+
+    assert controller.fetch({}, 0, 10**6) == (256, [])
+    assert eth.calls == [1024, 512, 256]
+    assert controller.limit == 256
+
+    # Never past `till_block`.
+    assert controller.fetch({}, 1000, 1100) == (1100, [])